@@ -0,0 +1,4 @@
+"""Offline benchmarks for HangupsBot hot paths
+
+Run them from the repository root, e.g. ``python -m benchmarks.config_resolution``.
+"""
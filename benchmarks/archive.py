@@ -0,0 +1,81 @@
+"""Benchmark writing to message archive and full-text search in it"""
+
+import os, time, random, argparse, tempfile
+
+from hangupsbot.archive import MessageArchive
+
+
+WORDS = ['meeting', 'tomorrow', 'station', 'episode', 'amazing', 'lunch', 'deploy', 'server', 'weekend',
+         'coffee', 'invoice', 'release', 'party', 'birthday', 'football', 'weather', 'train', 'photo']
+
+
+def build_batch(start, count, conversations, rnd):
+    """Build batch of archive rows with random text (rare words are numbered)"""
+    timestamp = int(time.time() * 1000000)
+    rows = []
+    for i in range(start, start + count):
+        words = [rnd.choice(WORDS) for j in range(rnd.randint(3, 15))]
+        words.append('word{}'.format(rnd.randrange(100000)))
+        rows.append(('EVENT{}'.format(i), 'CONV{}_ID'.format(rnd.randrange(conversations)),
+                     'USER{}_ID'.format(rnd.randrange(1000)), 'User', timestamp - (start + count - i) * 1000,
+                     'ChatMessageEvent', ' '.join(words)))
+    return rows
+
+
+def measure(archive, queries, conv_ids=None):
+    """Return average time of search per query in milliseconds"""
+    start = time.perf_counter()
+    for query in queries:
+        archive._search(query, conv_ids, 10)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=1000000,
+                        help='number of archived messages')
+    parser.add_argument('--conversations', type=int, default=300,
+                        help='number of conversations')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='number of messages written in one transaction')
+    parser.add_argument('--queries', type=int, default=100,
+                        help='number of search queries')
+    parser.add_argument('--path', default=None,
+                        help='database file (temporary by default, existing file is reused)')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        archive = MessageArchive(args.path or os.path.join(directory, 'archive.sqlite'))
+        archive._setup()
+        existing = archive._write_connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+        start = time.perf_counter()
+        for i in range(existing, args.messages, args.batch_size):
+            archive._write(build_batch(i, min(args.batch_size, args.messages - i), args.conversations, rnd))
+        elapsed = time.perf_counter() - start
+        if args.messages > existing:
+            print('Write ({}, {}):   {:10.0f} messages/s'.format(
+                archive.fts, args.batch_size, (args.messages - existing) / elapsed))
+        print('Database size:        {:10.1f} MB'.format(os.path.getsize(archive.path) / 1024 / 1024))
+
+        common = [rnd.choice(WORDS) for i in range(args.queries)]
+        two_words = ['{} {}'.format(rnd.choice(WORDS), rnd.choice(WORDS)) for i in range(args.queries)]
+        rare = ['word{}'.format(rnd.randrange(100000)) for i in range(args.queries)]
+        conv_ids = ['CONV{}_ID'.format(rnd.randrange(args.conversations))]
+        print('Search common word:   {:10.3f} ms'.format(measure(archive, common)))
+        print('Search two words:     {:10.3f} ms'.format(measure(archive, two_words)))
+        print('Search rare word:     {:10.3f} ms'.format(measure(archive, rare)))
+        print('Search in conv:       {:10.3f} ms'.format(measure(archive, common, conv_ids)))
+        print('Search rare in conv:  {:10.3f} ms'.format(measure(archive, rare, conv_ids)))
+
+        start = time.perf_counter()
+        archive._compact()
+        print('Compact:              {:10.3f} s'.format(time.perf_counter() - start))
+        archive._write_connection.close()
+        if archive._read_connection:
+            archive._read_connection.close()
+
+
+if __name__ == '__main__':
+    main()
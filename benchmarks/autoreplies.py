@@ -0,0 +1,75 @@
+"""Benchmark matching of messages against autoreply keywords"""
+
+import random, timeit, argparse
+
+from hangupsbot.handlers.autoreplies import AutoreplyMatcher, find_keyword
+
+
+def build_autoreplies(keywords, regex_ratio=0.1, seed=0):
+    """Build autoreplies list with given total number of keywords"""
+    rnd = random.Random(seed)
+    autoreplies_list = []
+    for i in range(0, keywords, 5):
+        kwds = []
+        for j in range(i, min(i + 5, keywords)):
+            if rnd.random() < regex_ratio:
+                kwds.append('regex:^kw{}\\b'.format(j))
+            else:
+                kwds.append('kw{}'.format(j))
+        autoreplies_list.append([kwds, 'Reply {}'.format(i)])
+    return autoreplies_list
+
+
+def build_messages(count, keywords, seed=0):
+    """Build messages, roughly every tenth of them contains some keyword"""
+    rnd = random.Random(seed)
+    filler = ('Příliš žluťoučký kůň úpěl ďábelské ódy, the quick brown fox '
+              'jumps over the lazy dog.').split()
+    messages = []
+    for i in range(count):
+        words = rnd.sample(filler, rnd.randint(3, len(filler)))
+        if rnd.random() < 0.1:
+            words.insert(rnd.randint(0, len(words)), 'kw{}!'.format(rnd.randrange(keywords)))
+        messages.append(' '.join(words))
+    return messages
+
+
+def legacy_match(autoreplies_list, text):
+    """Autoreply matching as it was done before autoreplies were compiled"""
+    replies = []
+    for kwds, sentence in autoreplies_list:
+        for kw in kwds:
+            if find_keyword(kw, text):
+                replies.append(sentence)
+                break
+    return replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=1000,
+                        help='number of messages per run')
+    parser.add_argument('--keywords', type=int, nargs='+', default=[10, 100, 500, 1000],
+                        help='numbers of autoreply keywords to test')
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>12} {:>8}'.format('keywords', 'legacy [us]', 'compiled [us]', 'speedup'))
+    for keywords in args.keywords:
+        autoreplies_list = build_autoreplies(keywords)
+        messages = build_messages(args.messages, keywords)
+        matcher = AutoreplyMatcher(autoreplies_list)
+
+        # Both implementations must give exactly the same replies
+        for text in messages:
+            assert matcher.match(text) == legacy_match(autoreplies_list, text)
+
+        legacy = min(timeit.repeat(lambda: [legacy_match(autoreplies_list, t) for t in messages],
+                                   number=1, repeat=3))
+        compiled = min(timeit.repeat(lambda: [matcher.match(t) for t in messages],
+                                     number=1, repeat=3))
+        print('{:8d} {:12.1f} {:12.1f} {:7.1f}x'.format(
+            keywords, legacy / args.messages * 1e6, compiled / args.messages * 1e6, legacy / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark recognizing and parsing of command messages"""
+
+import shlex, random, timeit, argparse
+
+from hangupsbot.utils import split_args
+from hangupsbot.handlers.commands import AliasMatcher, find_bot_alias
+
+
+ALIASES = ['/bot', '/hal', '/cylon', '/skynet', '/terminator']
+
+MESSAGES = [
+    'Hello everyone, how are you doing today?',
+    'I think we should meet at 10 o\'clock in front of the "old" station.',
+    'lol',
+    'Did you see the new episode? It was absolutely amazing, I can\'t wait for the next one!',
+    'https://www.example.com/some/very/long/link?with=parameters&and=more',
+    'ok',
+]
+
+COMMANDS = [
+    '/bot help',
+    '/bot conv_send "Announcements" Meeting starts in 5 minutes!',
+    '/HAL user_find "John Smith"',
+    '/bot config set conversations CONV_ID forward_to \'["CONV2_ID"]\'',
+]
+
+
+def build_messages(count, command_ratio, seed=0):
+    """Build realistic mix of messages with given ratio of commands"""
+    rnd = random.Random(seed)
+    return [rnd.choice(COMMANDS) if rnd.random() < command_ratio else rnd.choice(MESSAGES)
+            for i in range(count)]
+
+
+def legacy_parse(text):
+    """Command parsing as it was done before aliases were compiled"""
+    if not find_bot_alias(ALIASES, text):
+        return None
+    return shlex.split(text, posix=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100000,
+                        help='number of messages')
+    parser.add_argument('--command-ratio', type=float, default=0.01,
+                        help='ratio of command messages')
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages, args.command_ratio)
+    matchers = {
+        'plain aliases': AliasMatcher(ALIASES),
+        'regex alias': AliasMatcher(ALIASES + ['regex:^/t(erminator)?\\d+$'])
+    }
+
+    def fast_parse(matcher, text):
+        if not matcher.match(text):
+            return None
+        return split_args(text)
+
+    for text in messages:
+        assert fast_parse(matchers['plain aliases'], text) == legacy_parse(text)
+
+    results = [('legacy', min(timeit.repeat(lambda: [legacy_parse(t) for t in messages],
+                                            number=1, repeat=3)))]
+    for name, matcher in sorted(matchers.items()):
+        results.append((name, min(timeit.repeat(lambda: [fast_parse(matcher, t) for t in messages],
+                                                number=1, repeat=3))))
+
+    commands = [t for t in messages if t in COMMANDS] or COMMANDS
+    results.append(('shlex.split', min(timeit.repeat(
+        lambda: [shlex.split(t, posix=False) for t in commands], number=1, repeat=3)) / len(commands) * len(messages)))
+    results.append(('split_args', min(timeit.repeat(
+        lambda: [split_args(t) for t in commands], number=1, repeat=3)) / len(commands) * len(messages)))
+
+    for name, elapsed in results:
+        print('{:14} {:8.3f} us/message'.format(name, elapsed / len(messages) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
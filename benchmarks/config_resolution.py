@@ -0,0 +1,77 @@
+"""Benchmark resolving of per-conversation config options"""
+
+import os, json, timeit, argparse, tempfile
+
+from hangupsbot.config import Config
+
+
+OPTIONS = ['commands_enabled', 'commands_aliases', 'commands_admin', 'admins',
+           'forwarding_enabled', 'forward_to', 'autoreplies_enabled', 'autoreplies',
+           'membership_watching_enabled', 'rename_watching_enabled']
+
+
+def legacy_get_config_suboption(config, conv_id, option):
+    """Config resolution as it was done before options were cached"""
+    try:
+        suboption = config['conversations'][conv_id][option]
+    except KeyError:
+        try:
+            suboption = config[option]
+        except KeyError:
+            suboption = None
+    return suboption
+
+
+def build_config(conversations):
+    """Build config with given number of conversation blocks"""
+    config = {
+        'admins': ['ADMIN_ID'],
+        'autoreplies': [[['hi', 'hello'], 'Hello world!']],
+        'autoreplies_enabled': True,
+        'commands_admin': ['quit', 'config'],
+        'commands_enabled': True,
+        'commands_aliases': ['/bot'],
+        'forwarding_enabled': False,
+        'conversations': {}
+    }
+    for i in range(conversations):
+        conv = {'forward_to': ['CONV{}_ID'.format(i + 1)]}
+        if i % 3 == 0:
+            conv['autoreplies_enabled'] = False
+        config['conversations']['CONV{}_ID'.format(i)] = conv
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--conversations', type=int, default=5000,
+                        help='number of conversations in config')
+    parser.add_argument('--events', type=int, default=20000,
+                        help='number of simulated events')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = Config(os.path.join(tmpdir, 'config.json'))
+    config.loads(json.dumps(build_config(args.conversations)))
+
+    # Half of the events come from conversations without own config block
+    conv_ids = ['CONV{}_ID'.format(i % (args.conversations * 2)) for i in range(args.events)]
+
+    def legacy():
+        for conv_id in conv_ids:
+            for option in OPTIONS:
+                legacy_get_config_suboption(config, conv_id, option)
+
+    def cached():
+        for conv_id in conv_ids:
+            for option in OPTIONS:
+                config.get_suboption(conv_id, option)
+
+    lookups = len(conv_ids) * len(OPTIONS)
+    for name, func in [('legacy', legacy), ('cached', cached)]:
+        elapsed = min(timeit.repeat(func, number=1, repeat=5))
+        print('{:8} {:8.3f} ms  {:6.0f} ns/lookup'.format(name, elapsed * 1000, elapsed / lookups * 1e9))
+
+
+if __name__ == '__main__':
+    main()
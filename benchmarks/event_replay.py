@@ -0,0 +1,322 @@
+"""Replay synthetic events through HangupsBot and measure throughput, latency, memory and outbound calls
+
+Everything runs offline (Hangouts client is replaced by FakeClient), results are printed as JSON,
+so they can be saved and compared between commits."""
+
+import os, json, time, random, asyncio, argparse, datetime, tempfile, tracemalloc, collections
+
+from hangups.user import UserList
+from hangups.conversation import ConversationList
+
+import hangupsbot
+import hangupsbot.__main__  # installs gettext
+from hangupsbot.bot import HangupsBot
+from hangupsbot.lanes import overflow_policies
+from hangupsbot.profiler import drive_coroutine
+from hangupsbot.handlers import handler
+from hangupsbot.commands import command
+from benchmarks.fakes import (FakeClient, build_entity, build_conv_state, build_chat_message_event,
+                              build_membership_change_event, build_rename_event)
+
+
+ADMIN_ID = '1'
+
+MESSAGES = [
+    'Hello everyone, how are you doing today?',
+    'I think we should meet at 10 o\'clock in front of the old station.',
+    'lol',
+    'Did you see the new episode? It was absolutely amazing, I can\'t wait for the next one!',
+    'https://www.example.com/some/very/long/link?with=parameters&and=more',
+    'hi there',
+    'is the bot still alive?',
+]
+
+COMMANDS = [
+    ('/bot ping', False),
+    ('/bot echo Hello world!', False),
+    ('/bot help', False),
+    ('/bot help echo', False),
+    ('/bot user_find "User 1"', True),
+    ('/bot conv_list Conversation 1', True),
+    ('/bot no_such_command', False),
+]
+
+
+def percentile(values, p):
+    """Get p-th percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def summarize(durations):
+    """Get number, mean, p50, p99 and max of durations"""
+    durations = sorted(durations)
+    return {
+        'count': len(durations),
+        'mean': sum(durations) / len(durations) if durations else None,
+        'p50': percentile(durations, 50),
+        'p99': percentile(durations, 99),
+        'max': durations[-1] if durations else None
+    }
+
+
+class PluginTracker:
+    """Attribute run time, outbound messages and client calls to plugins
+
+       Handlers and commands are driven step by step, so messages queued and client
+       methods called during a step are counted for plugin which made them."""
+    def __init__(self):
+        self.current = 'bot'
+        self.durations = collections.defaultdict(list)
+        self.messages = collections.Counter()
+        self.calls = collections.defaultdict(collections.Counter)
+
+    def wrap_coroutine(self, name, coro):
+        """Return coroutine which runs coro and marks plugin name as current during every step"""
+        def before_step():
+            previous, self.current = self.current, name
+            return previous
+
+        def after_step(previous):
+            self.current = previous
+        return drive_coroutine(coro, before_step, after_step)
+
+    def on_handled(self, bot, func, elapsed, exception):
+        """Record run time of handler"""
+        self.durations['handler:{}'.format(func.__name__)].append(elapsed)
+
+    def on_run(self, bot, name, elapsed, status):
+        """Record run time of command"""
+        self.durations['command:{}'.format(name)].append(elapsed)
+
+    def on_send(self):
+        """Count message queued by current plugin"""
+        self.messages[self.current] += 1
+
+    def on_call(self, name):
+        """Count client call made by current plugin"""
+        self.calls[self.current][name] += 1
+
+    def get_results(self):
+        """Get statistics of every plugin"""
+        results = {}
+        for name in set(self.durations) | set(self.messages) | set(self.calls):
+            results[name] = summarize(self.durations.get(name, []))
+            results[name]['messages'] = self.messages.get(name, 0)
+            results[name]['client_calls'] = dict(self.calls.get(name, {}))
+        return results
+
+
+class TrackedConversation:
+    """Conversation which attributes client calls made by send_message to plugin which queued message"""
+    def __init__(self, conv, tracker, plugin):
+        self.conv = conv
+        self.tracker = tracker
+        self.plugin = plugin
+
+    def __getattr__(self, name):
+        return getattr(self.conv, name)
+
+    def send_message(self, *args, **kwds):
+        """Send message as plugin which queued it"""
+        return self.tracker.wrap_coroutine(self.plugin, self.conv.send_message(*args, **kwds))
+
+
+def write_config(directory, args):
+    """Write default config with rate limits disabled"""
+    with open(os.path.join(os.path.dirname(hangupsbot.__file__), 'config.json')) as f:
+        config = json.load(f)
+    config.update({
+        'admins': [ADMIN_ID],
+        'config_watching_enabled': False,
+        'membership_watching_enabled': True,
+        'outbound_rate': None,
+        'outbound_conv_rate': None,
+        'outbound_coalesce_window': 0,
+        'event_queue_size': args.queue_size,
+        'event_overflow_policy': args.overflow_policy
+    })
+    path = os.path.join(directory, 'config.json')
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    return path
+
+
+def build_bot(directory, args, tracker):
+    """Build bot connected to fake client with synthetic users and conversations"""
+    rnd = random.Random(args.seed)
+    client = FakeClient(latency=args.rpc_latency)
+    client.on_call.append(tracker.on_call)
+
+    bot = HangupsBot(os.path.join(directory, 'refresh_token.txt'), write_config(directory, args))
+    conv_states = [build_conv_state(i, range(args.users), rnd) for i in range(args.conversations)]
+    bot._client = client
+    bot._user_list = UserList(client, build_entity(0), [build_entity(i) for i in range(1, args.users)],
+                              [p for c in conv_states for p in c.conversation.participant_data])
+    bot._conv_list = ConversationList(client, conv_states, bot._user_list,
+                                      datetime.datetime.now(tz=datetime.timezone.utc))
+    bot._build_indexes()
+    bot._supervisor.on_connected()
+
+    # Messages are sent later by outbound worker, so plugin is remembered when message is queued
+    send = bot._outbound.send
+
+    def tracked_send(conv, *args, **kwds):
+        tracker.on_send()
+        return send(TrackedConversation(conv, tracker, tracker.current), *args, **kwds)
+    bot._outbound.send = tracked_send
+    return bot
+
+
+def build_events(bot, args):
+    """Build synthetic event stream (a few conversations get most of events)"""
+    rnd = random.Random(args.seed)
+    convs = bot.list_conversations()
+    timestamp = int(time.time() * 10 ** 6)
+    events = []
+    for i in range(args.events):
+        conv = convs[int(rnd.paretovariate(1.2) - 1) % len(convs)]
+        users = [u.id_.chat_id for u in conv.users if not u.is_self] or [ADMIN_ID]
+        kind = rnd.random()
+        timestamp += 1000
+        if kind < args.membership_ratio:
+            new_user = str(rnd.randrange(1, args.users))
+            events.append((conv, build_membership_change_event(
+                i, conv.id_, rnd.choice([ADMIN_ID] + users), timestamp, [new_user], join=rnd.random() < 0.8)))
+        elif kind < args.membership_ratio + args.rename_ratio:
+            events.append((conv, build_rename_event(
+                i, conv.id_, rnd.choice(users), timestamp, 'Renamed conversation {}'.format(i))))
+        elif kind < args.membership_ratio + args.rename_ratio + args.command_ratio:
+            text, admin = rnd.choice(COMMANDS)
+            events.append((conv, build_chat_message_event(
+                i, conv.id_, ADMIN_ID if admin else rnd.choice(users), timestamp, text)))
+        else:
+            events.append((conv, build_chat_message_event(
+                i, conv.id_, rnd.choice(users), timestamp, rnd.choice(MESSAGES))))
+    return events
+
+
+@asyncio.coroutine
+def replay(bot, events, rate=None):
+    """Feed events to bot and wait until all of them are handled and all messages are sent"""
+    latencies = []
+    submitted = {}
+    handle = bot._lanes.handle
+
+    @asyncio.coroutine
+    def timed_handle(conv_event):
+        try:
+            yield from handle(conv_event)
+        finally:
+            latencies.append(time.perf_counter() - submitted.pop(id(conv_event)))
+    bot._lanes.handle = timed_handle
+
+    start = time.perf_counter()
+    for i, (conv, event_) in enumerate(events):
+        if rate:
+            yield from asyncio.sleep(max(start + i / rate - time.perf_counter(), 0))
+        else:
+            # Events arrive from network one by one, so let the loop run between them
+            yield from asyncio.sleep(0)
+        conv_event = conv.add_event(event_)
+        submitted[id(conv_event)] = time.perf_counter()
+        yield from bot._on_event(conv_event)
+
+    yield from bot._lanes.join()
+    while command.background or bot._outbound.workers:
+        yield from asyncio.wait(list(command.background) + list(bot._outbound.workers.values()))
+    return time.perf_counter() - start, latencies
+
+
+def run_pass(args, trace_memory=False):
+    """Build bot and events, replay events and return results"""
+    loop = asyncio.get_event_loop()
+    tracker = PluginTracker()
+    hooks = list(handler.on_handled), list(command.on_run), handler.wrap_coroutine, command.wrap_coroutine
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            bot = build_bot(directory, args, tracker)
+            events = build_events(bot, args)
+
+            handler.on_handled.append(tracker.on_handled)
+            command.on_run.append(tracker.on_run)
+            handler.wrap_coroutine = command.wrap_coroutine = tracker.wrap_coroutine
+
+            if trace_memory:
+                tracemalloc.start()
+            elapsed, latencies = loop.run_until_complete(replay(bot, events, args.rate))
+            if trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+    finally:
+        handler.on_handled[:], command.on_run[:], handler.wrap_coroutine, command.wrap_coroutine = hooks
+
+    if trace_memory:
+        # Memory still allocated by code of plugins (grouped by source file)
+        plugins = collections.Counter()
+        for stat in snapshot.statistics('filename'):
+            path = stat.traceback[0].filename
+            if os.path.basename(os.path.dirname(path)) in ('handlers', 'commands'):
+                plugins['{}/{}'.format(os.path.basename(os.path.dirname(path)),
+                                       os.path.splitext(os.path.basename(path))[0])] += stat.size
+        return {'current': current, 'peak': peak, 'plugins': dict(plugins)}
+
+    return {
+        'events': len(events),
+        'elapsed': elapsed,
+        'throughput': len(events) / elapsed,
+        'latency': summarize(latencies),
+        'plugins': tracker.get_results(),
+        'client_calls': dict(bot._client.calls),
+        'outbound': bot._outbound.get_stats(),
+        'lanes': bot._lanes.get_stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=2000,
+                        help='number of known users')
+    parser.add_argument('--conversations', type=int, default=300,
+                        help='number of conversations')
+    parser.add_argument('--events', type=int, default=10000,
+                        help='number of replayed events')
+    parser.add_argument('--command-ratio', type=float, default=0.05,
+                        help='ratio of command messages')
+    parser.add_argument('--membership-ratio', type=float, default=0.01,
+                        help='ratio of membership change events')
+    parser.add_argument('--rename-ratio', type=float, default=0.01,
+                        help='ratio of rename events')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='events per second (as fast as possible by default)')
+    parser.add_argument('--rpc-latency', type=float, default=0,
+                        help='simulated latency of client requests in seconds')
+    parser.add_argument('--queue-size', type=int, default=0,
+                        help='size of event queue of every conversation (0 is unlimited)')
+    parser.add_argument('--overflow-policy', default='drop_oldest', choices=overflow_policies,
+                        help='what to do with events when queue is full')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip second pass measuring memory with tracemalloc')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of random generator')
+    parser.add_argument('--output', default=None,
+                        help='write JSON results to file instead of standard output')
+    args = parser.parse_args()
+
+    results = {'parameters': vars(args)}
+    results.update(run_pass(args))
+    if not args.no_memory:
+        results['memory'] = run_pass(args, trace_memory=True)
+
+    data = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
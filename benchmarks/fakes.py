@@ -0,0 +1,183 @@
+"""Local stand-ins for network services used by HangupsBot"""
+
+import hashlib, asyncio, itertools, collections
+
+import hangups.event
+from hangups import hangouts_pb2
+
+
+class FakeHTTP:
+    """Serve images from memory with simulated latency"""
+    def __init__(self, images, latency=0.05):
+        self.images = images   # link -> image data
+        self.latency = latency
+        self.calls = 0
+
+    @asyncio.coroutine
+    def fetch(self, link):
+        """Download image"""
+        self.calls += 1
+        yield from asyncio.sleep(self.latency)
+        try:
+            return self.images[link]
+        except KeyError:
+            raise hangups.NetworkError('404 Not Found: {}'.format(link))
+
+
+class FakeImageUpload:
+    """Accept image uploads with simulated latency"""
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.calls = 0
+
+    @asyncio.coroutine
+    def upload(self, image_file, filename=None):
+        """Upload image and return its image_id"""
+        self.calls += 1
+        data = image_file.read()
+        yield from asyncio.sleep(self.latency)
+        return 'image-{}'.format(hashlib.md5(data).hexdigest())
+
+
+def fake_rpc(name, response_class):
+    """Build FakeClient method which records call and returns empty response"""
+    @asyncio.coroutine
+    def rpc(self, request, *args, **kwds):
+        self.record(name)
+        if self.latency:
+            yield from asyncio.sleep(self.latency)
+        return response_class()
+    rpc.__name__ = name
+    return rpc
+
+
+class FakeClient:
+    """Stand-in for hangups.Client answering requests locally (with simulated latency)
+
+       Number of calls of every method is counted, functions appended to on_call
+       are called as hook(name) on every call."""
+    def __init__(self, latency=0):
+        self.on_connect = hangups.event.Event('FakeClient.on_connect')
+        self.on_reconnect = hangups.event.Event('FakeClient.on_reconnect')
+        self.on_disconnect = hangups.event.Event('FakeClient.on_disconnect')
+        self.on_state_update = hangups.event.Event('FakeClient.on_state_update')
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.on_call = []
+        self._client_generated_id = itertools.count(1)
+
+    def record(self, name):
+        """Count call of method"""
+        self.calls[name] += 1
+        for hook in self.on_call:
+            hook(name)
+
+    def get_request_header(self):
+        """Get empty request header"""
+        return hangouts_pb2.RequestHeader()
+
+    def get_client_generated_id(self):
+        """Get unique ID for request"""
+        return next(self._client_generated_id)
+
+    @asyncio.coroutine
+    def upload_image(self, image_file, filename=None):
+        """Upload image and return its image_id"""
+        self.record('upload_image')
+        data = image_file.read()
+        if self.latency:
+            yield from asyncio.sleep(self.latency)
+        return 'image-{}'.format(hashlib.md5(data).hexdigest())
+
+    @asyncio.coroutine
+    def disconnect(self):
+        """Pretend to disconnect"""
+        self.record('disconnect')
+
+    send_chat_message = fake_rpc('send_chat_message', hangouts_pb2.SendChatMessageResponse)
+    create_conversation = fake_rpc('create_conversation', hangouts_pb2.CreateConversationResponse)
+    add_user = fake_rpc('add_user', hangouts_pb2.AddUserResponse)
+    remove_user = fake_rpc('remove_user', hangouts_pb2.RemoveUserResponse)
+    delete_conversation = fake_rpc('delete_conversation', hangouts_pb2.DeleteConversationResponse)
+    rename_conversation = fake_rpc('rename_conversation', hangouts_pb2.RenameConversationResponse)
+    set_focus = fake_rpc('set_focus', hangouts_pb2.SetFocusResponse)
+    set_typing = fake_rpc('set_typing', hangouts_pb2.SetTypingResponse)
+    update_watermark = fake_rpc('update_watermark', hangouts_pb2.UpdateWatermarkResponse)
+    easter_egg = fake_rpc('easter_egg', hangouts_pb2.EasterEggResponse)
+
+
+def build_entity(i):
+    """Build synthetic user entity"""
+    return hangouts_pb2.Entity(
+        id=hangouts_pb2.ParticipantId(gaia_id=str(i), chat_id=str(i)),
+        properties=hangouts_pb2.EntityProperties(
+            display_name='User {} Number{}'.format(i, i), first_name='User {}'.format(i)
+        )
+    )
+
+
+def build_conv_state(i, users, rnd):
+    """Build synthetic conversation state with random participants"""
+    participants = rnd.sample(users, min(len(users), rnd.randint(2, 20)))
+    conversation = hangouts_pb2.Conversation(
+        conversation_id=hangouts_pb2.ConversationId(id='CONV{}_ID'.format(i)),
+        type=hangouts_pb2.CONVERSATION_TYPE_GROUP,
+        name='Conversation {}'.format(i),
+        self_conversation_state=hangouts_pb2.UserConversationState(
+            sort_timestamp=rnd.randint(1, 10 ** 15)
+        ),
+        participant_data=[hangouts_pb2.ConversationParticipantData(
+            id=hangouts_pb2.ParticipantId(gaia_id=str(u), chat_id=str(u)),
+            fallback_name='User {}'.format(u)
+        ) for u in participants]
+    )
+    return hangouts_pb2.ConversationState(
+        conversation_id=conversation.conversation_id,
+        conversation=conversation
+    )
+
+
+
+def build_event(event_id, conv_id, user_id, timestamp, **kwds):
+    """Build synthetic event"""
+    return hangouts_pb2.Event(
+        conversation_id=hangouts_pb2.ConversationId(id=conv_id),
+        sender_id=hangouts_pb2.ParticipantId(gaia_id=user_id, chat_id=user_id),
+        event_id='EVENT{}'.format(event_id),
+        timestamp=timestamp,
+        **kwds
+    )
+
+
+def build_chat_message_event(event_id, conv_id, user_id, timestamp, text):
+    """Build synthetic chat message event"""
+    return build_event(
+        event_id, conv_id, user_id, timestamp,
+        event_type=hangouts_pb2.EVENT_TYPE_REGULAR_CHAT_MESSAGE,
+        chat_message=hangouts_pb2.ChatMessage(
+            message_content=hangouts_pb2.MessageContent(
+                segment=[hangouts_pb2.Segment(type=hangouts_pb2.SEGMENT_TYPE_TEXT, text=text)]
+            )
+        )
+    )
+
+
+def build_membership_change_event(event_id, conv_id, user_id, timestamp, participant_ids, join=True):
+    """Build synthetic event of users joining or leaving conversation"""
+    return build_event(
+        event_id, conv_id, user_id, timestamp,
+        event_type=hangouts_pb2.EVENT_TYPE_ADD_USER if join else hangouts_pb2.EVENT_TYPE_REMOVE_USER,
+        membership_change=hangouts_pb2.MembershipChange(
+            type=hangouts_pb2.MEMBERSHIP_CHANGE_TYPE_JOIN if join else hangouts_pb2.MEMBERSHIP_CHANGE_TYPE_LEAVE,
+            participant_ids=[hangouts_pb2.ParticipantId(gaia_id=p, chat_id=p) for p in participant_ids]
+        )
+    )
+
+
+def build_rename_event(event_id, conv_id, user_id, timestamp, new_name, old_name=''):
+    """Build synthetic conversation rename event"""
+    return build_event(
+        event_id, conv_id, user_id, timestamp,
+        event_type=hangouts_pb2.EVENT_TYPE_CONVERSATION_RENAME,
+        conversation_rename=hangouts_pb2.ConversationRename(new_name=new_name, old_name=old_name)
+    )
@@ -0,0 +1,67 @@
+"""Benchmark downloading and uploading of forwarded images (offline)"""
+
+import os, io, time, asyncio, argparse
+
+import hangups
+
+from hangupsbot.images import ImageUploader
+from benchmarks.fakes import FakeHTTP, FakeImageUpload
+
+
+@asyncio.coroutine
+def legacy_upload_images(http, upload, links):
+    """Image uploading as it was done before (one link at a time, no cache)"""
+    image_id_list = []
+    for link in links:
+        try:
+            data = yield from http.fetch(link)
+        except hangups.NetworkError:
+            continue
+        image_id = yield from upload.upload(io.BytesIO(data), filename=os.path.basename(link))
+        image_id_list.append(image_id)
+    return image_id_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=4,
+                        help='number of images in every forwarded message')
+    parser.add_argument('--forwards', type=int, default=5,
+                        help='number of forwarded messages with the same images')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='number of images processed at once')
+    parser.add_argument('--download-latency', type=float, default=0.05,
+                        help='simulated download latency in seconds')
+    parser.add_argument('--upload-latency', type=float, default=0.2,
+                        help='simulated upload latency in seconds')
+    args = parser.parse_args()
+
+    # Half of the links point to duplicate images (e.g. the same meme from different hosts)
+    images = {}
+    links = []
+    for i in range(args.images):
+        link = 'https://example.com/{}/image.png'.format(i)
+        images[link] = 'image {}'.format(i // 2).encode() * 10000
+        links.append(link)
+
+    loop = asyncio.get_event_loop()
+
+    for name in ['legacy', 'uploader']:
+        http = FakeHTTP(images, args.download_latency)
+        upload = FakeImageUpload(args.upload_latency)
+        uploader = ImageUploader(http.fetch, upload.upload, concurrency=args.concurrency)
+
+        start = time.perf_counter()
+        for i in range(args.forwards):
+            if name == 'legacy':
+                loop.run_until_complete(legacy_upload_images(http, upload, links))
+            else:
+                loop.run_until_complete(uploader.upload_images(links))
+        elapsed = time.perf_counter() - start
+
+        print('{:8} {:8.3f} s  {:4d} downloads  {:4d} uploads'.format(
+            name, elapsed, http.calls, upload.calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark adding, cancelling and running scheduled jobs"""
+
+import os, time, random, asyncio, argparse, tempfile
+
+from hangupsbot.scheduler import Scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, default=100000,
+                        help='number of scheduled jobs')
+    parser.add_argument('--cron-ratio', type=float, default=0.1,
+                        help='ratio of recurring jobs')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    loop = asyncio.get_event_loop()
+    now = [time.time()]
+    ran = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        scheduler = Scheduler(os.path.join(directory, 'schedule.json'), ran.append,
+                              catch_up=2 * 86400, timer=lambda: now[0])
+        scheduler.paused = False
+
+        start = time.perf_counter()
+        for i in range(args.jobs):
+            if rnd.random() < args.cron_ratio:
+                scheduler.add(None, 'CONV{}_ID'.format(i % 300), 'Announcement {}'.format(i),
+                              cron='{} {} * * *'.format(rnd.randrange(60), rnd.randrange(24)))
+            else:
+                scheduler.add(now[0] + rnd.uniform(0, 86400), 'CONV{}_ID'.format(i % 300), 'Message {}'.format(i))
+        elapsed = time.perf_counter() - start
+        print('Add:     {:8.2f} us/job'.format(elapsed / args.jobs * 1e6))
+
+        job_ids = rnd.sample(list(scheduler.jobs), args.jobs // 2)
+        start = time.perf_counter()
+        for job_id in job_ids:
+            scheduler.cancel(job_id)
+        elapsed = time.perf_counter() - start
+        print('Cancel:  {:8.2f} us/job'.format(elapsed / len(job_ids) * 1e6))
+
+        # Run all jobs due within one day
+        start = time.perf_counter()
+        now[0] += 86400
+        scheduler._run_due()
+        elapsed = time.perf_counter() - start
+        print('Run:     {:8.2f} us/job ({} jobs run)'.format(elapsed / max(len(ran), 1) * 1e6, len(ran)))
+
+        start = time.perf_counter()
+        loop.run_until_complete(scheduler.close())
+        print('Save:    {:8.3f} s ({} jobs)'.format(time.perf_counter() - start, len(scheduler.jobs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark searching of users and conversations by name"""
+
+import time, random, argparse, collections
+
+from hangupsbot.search import NameIndex
+
+
+FakeUser = collections.namedtuple('FakeUser', ['id_', 'full_name'])
+FakeConv = collections.namedtuple('FakeConv', ['id_', 'name', 'last_modified'])
+
+FIRST_NAMES = ['Jan', 'Petr', 'Jiří', 'Pavel', 'Martin', 'Tomáš', 'Jana', 'Marie', 'Eva', 'Hana',
+               'John', 'Michael', 'David', 'James', 'Robert', 'Mary', 'Linda', 'Susan', 'Anna', 'Zoë']
+SYLLABLES = ['no', 'vák', 'svo', 'bo', 'da', 'kře', 'nek', 'smith', 'son', 'ler', 'ber', 'ga',
+             'mil', 'ton', 'ová', 'chal', 'dvo', 'řák', 'wil', 'liams', 'jo', 'nes', 'tay', 'lor']
+
+
+def full_name_sort(user):
+    """Sort key for sorting users by last name and first name"""
+    split_name = user.full_name.split()
+    return (split_name[-1], split_name[0])
+
+
+def build_users(count, rnd):
+    """Build list of users with random names"""
+    users = []
+    for i in range(count):
+        last_name = ''.join(rnd.sample(SYLLABLES, rnd.randint(2, 3))).capitalize()
+        users.append(FakeUser('USER{}_ID'.format(i), '{} {}'.format(rnd.choice(FIRST_NAMES), last_name)))
+    return users
+
+
+def build_convs(count, rnd):
+    """Build list of conversations with random names"""
+    return [FakeConv('CONV{}_ID'.format(i),
+                     '{} {}'.format(''.join(rnd.sample(SYLLABLES, 3)).capitalize(), i),
+                     rnd.random())
+            for i in range(count)]
+
+
+def legacy_find_users(users, user_name):
+    """User search as it was done before names were indexed"""
+    user_name_lower = user_name.lower()
+    return [u for u in sorted(users, key=full_name_sort)
+            if user_name_lower in u.full_name.lower()]
+
+
+def legacy_find_conversations(convs, conv_name):
+    """Conversation search as it was done before names were indexed"""
+    conv_name_lower = conv_name.lower()
+    return [c for c in sorted(convs, reverse=True, key=lambda c: c.last_modified)
+            if conv_name_lower in c.name.lower()]
+
+
+def measure(func, queries):
+    """Return average time of func per query in milliseconds"""
+    start = time.perf_counter()
+    for query in queries:
+        func(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50000,
+                        help='number of known users')
+    parser.add_argument('--conversations', type=int, default=5000,
+                        help='number of conversations')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='number of search queries')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    users = build_users(args.users, rnd)
+    convs = build_convs(args.conversations, rnd)
+    user_queries = [rnd.choice(users).full_name.split()[-1][:rnd.randint(3, 6)] for i in range(args.queries)]
+    conv_queries = [rnd.choice(convs).name[:rnd.randint(3, 8)] for i in range(args.queries)]
+
+    start = time.perf_counter()
+    user_index = NameIndex()
+    for user in users:
+        user_index.add(user.id_, user.full_name, user)
+    conv_index = NameIndex()
+    for conv in convs:
+        conv_index.add(conv.id_, conv.name, conv)
+    print('index build: {:.0f} ms'.format((time.perf_counter() - start) * 1000))
+
+    results = [
+        ('users legacy', measure(lambda q: legacy_find_users(users, q), user_queries)),
+        ('users index', measure(lambda q: sorted(user_index.search(q), key=full_name_sort), user_queries)),
+        ('convs legacy', measure(lambda q: legacy_find_conversations(convs, q), conv_queries)),
+        ('convs index', measure(lambda q: sorted(conv_index.search(q), reverse=True,
+                                                 key=lambda c: c.last_modified), conv_queries)),
+    ]
+    for name, elapsed in results:
+        print('{:14} {:8.3f} ms/query'.format(name, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark startup and import time of HangupsBot
+
+Imports are timed by wrapping __import__ in child process and newly loaded modules are found
+by comparing sys.modules, so it works with every Python version supported by HangupsBot."""
+
+import os, sys, json, time, argparse, subprocess
+
+
+SCENARIOS = [
+    ('--version', (
+        'import sys, runpy\n'
+        'sys.argv = ["hangupsbot", "--version"]\n'
+        'try:\n'
+        '    runpy.run_module("hangupsbot", run_name="__main__", alter_sys=True)\n'
+        'except SystemExit:\n'
+        '    pass\n'
+    )),
+    ('import __main__', 'import hangupsbot.__main__'),
+    ('import bot', 'import hangupsbot.__main__, hangupsbot.bot'),
+    ('import bot and all plugins', (
+        'import hangupsbot.__main__, hangupsbot.bot\n'
+        'from hangupsbot.handlers import handler\n'
+        'from hangupsbot.commands import command\n'
+        'for module in set(handler.pending) | set(command.pending.values()):\n'
+        '    __import__(module)\n'
+    )),
+]
+
+# Runs scenario code in child process and prints import times as JSON
+DRIVER = '''
+import sys, json, time, builtins
+
+_import = builtins.__import__
+_depth = [0]
+_times = []    # (cumulative time, module, depth) of imports which loaded new modules
+
+
+def _resolve(name, globals, level):
+    """Get absolute name of imported module"""
+    if not level:
+        return name
+    package = (globals or {{}}).get('__package__') or ''
+    if level > 1:
+        package = package.rsplit('.', level - 1)[0]
+    return '{{}}.{{}}'.format(package, name) if name else package
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module = _resolve(name, globals, level)
+    if module in sys.modules:
+        return _import(name, globals, locals, fromlist, level)
+    _depth[0] += 1
+    start = time.perf_counter()
+    try:
+        return _import(name, globals, locals, fromlist, level)
+    finally:
+        _depth[0] -= 1
+        _times.append((time.perf_counter() - start, module, _depth[0]))
+
+
+before = set(sys.modules)
+builtins.__import__ = _timed_import
+try:
+    exec(compile({code!r}, '<scenario>', 'exec'), {{'__name__': '__scenario__'}})
+finally:
+    builtins.__import__ = _import
+sys.stdout.flush()
+print('\\n' + json.dumps({{'modules': len(set(sys.modules) - before), 'times': _times}}))
+'''
+
+
+def run(code, repeat):
+    """Run scenario in new Python process and return best wall time and import times of last run"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', DRIVER.format(code=code)], env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        stdout, stderr = process.communicate()
+        elapsed = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError(stderr)
+        best = elapsed if best is None else min(best, elapsed)
+
+    result = json.loads(stdout.splitlines()[-1])
+    if not result['modules'] or not result['times']:
+        raise RuntimeError('No imports were measured (output: {!r})'.format(stdout))
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs of every scenario (best is reported)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest imports made by scenario modules to show')
+    args = parser.parse_args()
+
+    for name, code in SCENARIOS:
+        elapsed, result = run(code, args.repeat)
+        top_level = [(t, m) for t, m, depth in result['times'] if depth == 0]
+        print('{:28} {:8.1f} ms wall, {:8.1f} ms importing {} modules'.format(
+            name, elapsed * 1000, sum(t for t, m in top_level) * 1000, result['modules']))
+        nested = sorted(((t, m) for t, m, depth in result['times'] if depth == 1), reverse=True)
+        for cumulative, module in nested[:args.top]:
+            print('    {:8.1f} ms  {}'.format(cumulative * 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark cold (network) and warm (cached) building of user and conversation lists"""
+
+import os, time, random, asyncio, argparse, datetime, tempfile
+
+from hangups import hangouts_pb2
+from hangups.user import UserList
+from hangups.conversation import ConversationList
+
+from hangupsbot.snapshot import SnapshotStore
+from benchmarks.fakes import FakeClient, build_entity, build_conv_state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20000,
+                        help='number of known users')
+    parser.add_argument('--conversations', type=int, default=3000,
+                        help='number of conversations')
+    parser.add_argument('--rpc-latency', type=float, default=1.5,
+                        help='simulated total latency of requests made by cold start in seconds')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    self_entity = build_entity(0)
+    # Cold start gets users and conversations in server responses, which have to be parsed too
+    entities_response = hangouts_pb2.GetEntityByIdResponse(
+        entity=[build_entity(i) for i in range(1, args.users)]
+    ).SerializeToString()
+    conversations_response = hangouts_pb2.SyncRecentConversationsResponse(
+        conversation_state=[build_conv_state(i, range(args.users), rnd) for i in range(args.conversations)]
+    ).SerializeToString()
+    sync_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+    loop = asyncio.get_event_loop()
+
+    # Cold start: wait for server responses and build lists from them
+    start = time.perf_counter()
+    loop.run_until_complete(asyncio.sleep(args.rpc_latency))
+    entities = hangouts_pb2.GetEntityByIdResponse.FromString(entities_response).entity
+    conv_states = hangouts_pb2.SyncRecentConversationsResponse.FromString(
+        conversations_response).conversation_state
+    conv_parts = [p for c in conv_states for p in c.conversation.participant_data]
+    client = FakeClient()
+    user_list = UserList(client, self_entity, entities, conv_parts)
+    conv_list = ConversationList(client, conv_states, user_list, sync_timestamp)
+    cold = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(os.path.join(directory, 'cache.json'))
+        loop.run_until_complete(store.save(user_list, conv_list))
+        size = os.path.getsize(store.filename)
+
+        # Warm start: read snapshot and build lists from it
+        start = time.perf_counter()
+        if store.load(FakeClient()) is None:
+            raise RuntimeError('Snapshot was not loaded')
+        warm = time.perf_counter() - start
+
+    print('snapshot size: {:.1f} MiB'.format(size / 2 ** 20))
+    print('cold start:    {:.3f} s (including {:.3f} s of simulated network latency)'.format(
+        cold, args.rpc_latency))
+    print('warm start:    {:.3f} s'.format(warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import os, sys, json, asyncio
+
+from hangupsbot.bot import HangupsBot, add_signal_handlers, dump_profile
+from hangupsbot.cache import LRUCache
+from hangupsbot.handlers import handler
+from hangupsbot.commands import command
+
+
+def load_accounts(filename):
+    """Load list of accounts from JSON file
+
+       Every account is object with name and optional token, config and cache paths
+       (relative paths are relative to directory of accounts file, default paths
+       are in subdirectory named after account)."""
+    with open(filename) as f:
+        accounts = json.load(f)
+    if not isinstance(accounts, list) or not accounts:
+        raise ValueError(_('accounts file must contain non-empty list of accounts'))
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    names = set()
+    result = []
+    for account in accounts:
+        name = account.get('name') if isinstance(account, dict) else None
+        if not name or name in names:
+            raise ValueError(_('every account must have unique name'))
+        names.add(name)
+        result.append({
+            'name': name,
+            'token': os.path.join(directory, account.get('token') or os.path.join(name, 'refresh_token.txt')),
+            'config': os.path.join(directory, account.get('config') or os.path.join(name, 'config.json')),
+            'cache': os.path.join(directory, account.get('cache') or os.path.join(name, 'cache.json'))
+        })
+    return result
+
+
+class AccountGroup:
+    """More bot accounts served by one event loop
+
+       Bots share imported plugins, compiled rules of autoreplies and commands,
+       downloaded images and profiler. Client, lists of users and conversations,
+       config (including disabled plugins) and uploaded images are bound to account
+       and kept by every bot."""
+    def __init__(self, accounts, profiler=None, download_cache_size=64, download_cache_ttl=600):
+        self._profiler = profiler
+        self.download_cache = LRUCache(download_cache_size, download_cache_ttl)
+        self.bots = [HangupsBot(account['token'], account['config'], account['cache'],
+                                profiler=profiler, name=account['name'], group=self,
+                                download_cache=self.download_cache)
+                     for account in accounts]
+
+        # Plugins disabled by every account are never imported, others are skipped by bots
+        plugins_disabled = set.intersection(*[set(bot.config.get('plugins_disabled') or [])
+                                              for bot in self.bots])
+        handler.disable_plugins(plugins_disabled)
+        command.disable_plugins(plugins_disabled)
+
+    def run(self):
+        """Login all accounts and run their bots until all of them are stopped"""
+        # Accounts are logged in one by one (login can ask for credentials on stdin)
+        cookies = []
+        for bot in self.bots:
+            print(_('Logging in account {}').format(bot.name))
+            account_cookies = bot.login(bot._refresh_token_path)
+            if not account_cookies:
+                sys.exit(1)
+            cookies.append(account_cookies)
+
+        add_signal_handlers(self.stop, self._profiler)
+        loop = asyncio.get_event_loop()
+        if self._profiler:
+            self._profiler.start(loop)
+
+        # Failure of one bot doesn't stop other bots
+        results = loop.run_until_complete(asyncio.gather(
+            *[bot.serve(account_cookies) for bot, account_cookies in zip(self.bots, cookies)],
+            return_exceptions=True
+        ))
+        for bot, result in zip(self.bots, results):
+            if isinstance(result, Exception):
+                print(_('Account {} failed: {!r}').format(bot.name, result))
+            elif not result:
+                print(_('Account {} gave up reconnecting').format(bot.name))
+
+        if self._profiler:
+            self._profiler.stop()
+            dump_profile(self._profiler)
+        sys.exit(0 if all(result is True for result in results) else 1)
+
+    def stop(self):
+        """Disconnect all bots from Hangouts"""
+        for bot in self.bots:
+            bot.stop()
+
+    def get_usage(self):
+        """Get resources used by every bot (as list of (name, usage))"""
+        return [(bot.name, bot.get_usage()) for bot in self.bots]
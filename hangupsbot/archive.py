@@ -0,0 +1,266 @@
+import time, sqlite3, logging, asyncio, collections, concurrent.futures
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    event_id TEXT UNIQUE,
+    conv_id TEXT NOT NULL,
+    user_id TEXT,
+    user_name TEXT,
+    timestamp INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conv_timestamp ON messages (conv_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp);
+"""
+
+# Full-text index with external content (text is stored only once, in messages table)
+FTS_SCHEMA = {
+    'fts5': """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete BEFORE DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+""",
+    'fts4': """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts4(content='messages', text);
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (docid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete BEFORE DELETE ON messages BEGIN
+    DELETE FROM messages_fts WHERE docid = old.id;
+END;
+"""
+}
+
+
+def build_fts_query(query):
+    """Convert words of user query to full-text query (all words must match, no special syntax)"""
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+class MessageArchive:
+    """Append-only archive of conversation events in SQLite database with full-text index
+
+       Events are buffered in memory and written in batches by background task
+       (in separate thread), so handling of events never waits for disk. Buffer holds
+       at most max_pending events, oldest events are dropped when it is full.
+       Events older than retention_days are deleted and database is compacted
+       every compact_interval seconds."""
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_pending=100000,
+                 retention_days=None, compact_interval=3600):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self.fts = None
+        self.stats = {'archived': 0, 'dropped': 0, 'batches': 0, 'write_time': 0.0, 'expired': 0}
+        self._buffer = collections.deque(maxlen=max_pending)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_compact = time.monotonic()
+        # SQLite connections can be used only by thread which created them,
+        # writes and searches have their own threads (WAL lets them run concurrently)
+        self._write_executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._read_executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._write_connection = None
+        self._read_connection = None
+
+    def _connect(self):
+        """Open database in WAL mode (readers don't wait for writer)"""
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _setup(self):
+        """Create tables and full-text index (FTS5 if SQLite supports it, FTS4 otherwise)"""
+        # Freed pages are returned to filesystem by compaction. Auto-vacuum must be set before
+        # journal mode writes header of new database, older database is converted by vacuum().
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                logger.warning('Archive {} is not shrunk by compaction, convert it by /bot archive_vacuum'
+                               .format(self.path))
+        finally:
+            connection.close()
+
+        connection = self._write_connection = self._connect()
+        with connection:
+            connection.executescript(SCHEMA)
+            for fts in ('fts5', 'fts4'):
+                try:
+                    connection.executescript(FTS_SCHEMA[fts])
+                except sqlite3.OperationalError as e:
+                    logger.debug('Full-text index {} is not available: {}'.format(fts, e))
+                else:
+                    self.fts = fts
+                    break
+            else:
+                raise sqlite3.OperationalError('SQLite supports neither FTS5 nor FTS4')
+
+    def start(self):
+        """Open database and start background writer"""
+        self._task = asyncio.async(self._writer())
+
+    @asyncio.coroutine
+    def close(self):
+        """Write buffered events, stop background writer and close database"""
+        if self._task:
+            self._task.cancel()
+            try:
+                yield from self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._buffer:
+            yield from self._flush()
+        loop = asyncio.get_event_loop()
+        if self._read_connection:
+            yield from loop.run_in_executor(self._read_executor, self._read_connection.close)
+        if self._write_connection:
+            yield from loop.run_in_executor(self._write_executor, self._write_connection.close)
+        self._write_executor.shutdown()
+        self._read_executor.shutdown()
+
+    def add(self, event_id, conv_id, user_id, user_name, timestamp, type_, text):
+        """Buffer event for writing (never blocks, timestamp is datetime)"""
+        if len(self._buffer) == self.max_pending:
+            self.stats['dropped'] += 1
+        self._buffer.append((event_id, conv_id, user_id, user_name,
+                             int(timestamp.timestamp() * 1000000), type_, text))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    @asyncio.coroutine
+    def _writer(self):
+        """Write buffered events every flush_interval seconds (or when batch is full)"""
+        loop = asyncio.get_event_loop()
+        try:
+            yield from loop.run_in_executor(self._write_executor, self._setup)
+        except sqlite3.Error as e:
+            logger.error('Failed to open archive {}: {}'.format(self.path, e))
+            return
+
+        while True:
+            try:
+                yield from asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._buffer:
+                yield from self._flush()
+
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.monotonic()
+                yield from loop.run_in_executor(self._write_executor, self._compact)
+
+    @asyncio.coroutine
+    def _flush(self):
+        """Write all buffered events in one transaction"""
+        batch = list(self._buffer)
+        self._buffer.clear()
+        start = time.perf_counter()
+        try:
+            yield from asyncio.get_event_loop().run_in_executor(self._write_executor, self._write, batch)
+        except sqlite3.Error as e:
+            logger.error('Failed to archive {} events: {}'.format(len(batch), e))
+            self.stats['dropped'] += len(batch)
+            return
+        self.stats['archived'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['write_time'] += time.perf_counter() - start
+
+    def _write(self, batch):
+        """Insert events to database (runs in writer thread)"""
+        if self._write_connection is None:
+            self._setup()
+        with self._write_connection:
+            self._write_connection.executemany(
+                'INSERT OR IGNORE INTO messages (event_id, conv_id, user_id, user_name, timestamp, type, text) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+
+    def _compact(self):
+        """Delete expired events, merge full-text index and shrink database (runs in writer thread)"""
+        connection = self._write_connection
+        if connection is None:
+            return
+        try:
+            if self.retention_days:
+                cutoff = int((time.time() - self.retention_days * 86400) * 1000000)
+                # Delete in small chunks, so searches are not blocked by long transaction
+                while True:
+                    with connection:
+                        deleted = connection.execute(
+                            'DELETE FROM messages WHERE id IN '
+                            '(SELECT id FROM messages WHERE timestamp < ? ORDER BY timestamp LIMIT 10000)',
+                            (cutoff,)).rowcount
+                    self.stats['expired'] += deleted
+                    if deleted < 10000:
+                        break
+            with connection:
+                connection.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+            # Python steps PRAGMA without result rows only once (one page), script runs it to the end
+            connection.executescript('PRAGMA incremental_vacuum;')
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except sqlite3.Error as e:
+            logger.error('Failed to compact archive: {}'.format(e))
+
+    @asyncio.coroutine
+    def vacuum(self):
+        """Rebuild whole database with incremental auto-vacuum (one-off maintenance, it can take long)"""
+        yield from asyncio.get_event_loop().run_in_executor(self._write_executor, self._vacuum)
+
+    def _vacuum(self):
+        """Rebuild database (runs in writer thread, writes of new events wait for it)"""
+        if self._write_connection is None:
+            self._setup()
+        start = time.perf_counter()
+        self._write_connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._write_connection.execute('VACUUM')
+        logger.info('Archive {} vacuumed in {:.1f} s'.format(self.path, time.perf_counter() - start))
+
+    @asyncio.coroutine
+    def search(self, query, conv_ids=None, limit=10):
+        """Find newest events matching all words of query (optionally only in conversations)
+
+           Returns list of (conv_id, user_name, timestamp in microseconds, text)."""
+        return (yield from asyncio.get_event_loop().run_in_executor(
+            self._read_executor, self._search, query, conv_ids, limit))
+
+    def _search(self, query, conv_ids, limit):
+        """Search full-text index (runs in reader thread)"""
+        if self._read_connection is None:
+            self._read_connection = self._connect()
+        fts_query = build_fts_query(query)
+        if not fts_query or self.fts is None:
+            return []
+
+        # Newest matches are found by walking full-text index backwards by rowid,
+        # so search doesn't have to rank all matches in huge archive
+        rowid = 'messages_fts.rowid' if self.fts == 'fts5' else 'messages_fts.docid'
+        sql = ('SELECT m.conv_id, m.user_name, m.timestamp, m.text FROM messages_fts '
+               'JOIN messages m ON m.id = {} WHERE messages_fts MATCH ?'.format(rowid))
+        params = [fts_query]
+        if conv_ids:
+            sql += ' AND m.conv_id IN ({})'.format(', '.join('?' * len(conv_ids)))
+            params.extend(conv_ids)
+        sql += ' ORDER BY {} DESC LIMIT ?'.format(rowid)
+        params.append(limit)
+        return self._read_connection.execute(sql, params).fetchall()
+
+    def get_stats(self):
+        """Get counters of archived, dropped and expired events, batches and write time"""
+        stats = dict(self.stats)
+        stats['pending'] = len(self._buffer)
+        return stats
@@ -0,0 +1,678 @@
+import os, sys, time, logging, asyncio, signal, datetime, functools
+
+import aiohttp
+import hangups
+from hangups import http_utils
+from hangups.conversation import Conversation
+from hangups.ui.utils import get_conv_name
+
+import hangupsbot.config
+from hangupsbot.archive import MessageArchive
+from hangupsbot.images import ImageUploader
+from hangupsbot.lanes import EventLanes
+from hangupsbot.metrics import MetricsRegistry, MetricsServer, LoopLagMonitor
+from hangupsbot.offload import Offloader
+from hangupsbot.outbound import OutboundDispatcher
+from hangupsbot.pager import Pager
+from hangupsbot.scheduler import Scheduler
+from hangupsbot.search import NameIndex
+from hangupsbot.snapshot import SnapshotStore
+from hangupsbot.supervisor import ConnectionSupervisor
+from hangupsbot.watcher import FileWatcher
+from hangupsbot.utils import text_to_segments
+from hangupsbot.handlers import handler
+from hangupsbot.commands import command
+
+
+logger = logging.getLogger(__name__)
+
+
+def full_name_sort(user):
+    """Sort key for sorting users by last name and first name"""
+    split_name = user.full_name.split()
+    return (split_name[-1], split_name[0])
+
+
+def add_signal_handlers(stop, profiler=None):
+    """Call stop on SIGINT and SIGTERM and dump profile on SIGUSR1
+       (add_signal_handler is not implemented on Windows)"""
+    try:
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop)
+        if profiler:
+            loop.add_signal_handler(signal.SIGUSR1, lambda: dump_profile(profiler))
+    except NotImplementedError:
+        pass
+
+
+def dump_profile(profiler):
+    """Write collected profile to data directory"""
+    try:
+        prefix = profiler.dump()
+    except OSError as e:
+        print(_('Failed to write profile: {}').format(e))
+    else:
+        print(_('Profile written to {}.*').format(prefix))
+
+
+class HangupsBot:
+    """Hangouts bot listening on all conversations
+
+       More bots (one for every account) can run in one event loop, see AccountGroup."""
+    def __init__(self, refresh_token_path, config_path, cache_path=None, max_retries=5, profiler=None,
+                 name=None, group=None, download_cache=None):
+        self.name = name              # name of account (if bot is one of more accounts)
+        self.group = group            # hangupsbot.accounts.AccountGroup which runs bot
+        self._client = None
+        self._refresh_token_path = refresh_token_path
+
+        # These are populated by on_connect when it's called.
+        self._conv_list = None        # hangups.ConversationList
+        self._user_list = None        # hangups.UserList
+
+        # Search indexes and sorted lists of users and conversations (built by on_connect)
+        self._conv_index = NameIndex()
+        self._user_index = NameIndex()
+        self._sorted_convs = None
+        self._sorted_users = None
+        self._replay_until = None     # events older than this are not handled (while syncing cached lists)
+
+        # Load config file
+        self.config = hangupsbot.config.Config(config_path)
+
+        # Plugins are imported on first use, disabled plugins are never imported
+        # (plugins are shared by all accounts in group, so group disables them itself)
+        if group is None:
+            plugins_disabled = self.config.get('plugins_disabled') or []
+            handler.disable_plugins(plugins_disabled)
+            command.disable_plugins(plugins_disabled)
+
+        self._config_watcher = None
+
+        # Lists of users and conversations are cached on disk for fast startup
+        self._snapshot = SnapshotStore(
+            cache_path, max_age=self.config.get('cache_max_age', 86400)
+        ) if cache_path else None
+
+        # Reconnect with exponential backoff after connection failure
+        self._supervisor = ConnectionSupervisor(
+            lambda: self._client.connect(),
+            base_delay=self.config.get('reconnect_delay', 5),
+            max_delay=self.config.get('reconnect_max_delay', 300),
+            max_retries=max_retries,
+            cooldown=self.config.get('reconnect_cooldown')
+        )
+
+        # All chat messages are sent through outbound queue
+        self._outbound = OutboundDispatcher()
+
+        # Events are handled in order within conversation and concurrently across conversations
+        self._lanes = EventLanes(
+            lambda conv_event: handler.handle(self, conv_event),
+            is_priority=self._is_command_event
+        )
+
+        # Images are downloaded and uploaded concurrently, already uploaded images are cached
+        self._image_uploader = ImageUploader(
+            self._fetch_image, self._upload_image,
+            download_cache=download_cache
+        )
+
+        # Regexes and transliteration of long messages can run in process pool (if enabled)
+        self.offloader = None
+
+        # Options of these are applied again whenever config is reloaded
+        self._apply_options()
+
+        # Conversation events are archived in SQLite database next to config file (if enabled)
+        self.archive = MessageArchive(
+            self.config.get('archive_path') or
+            os.path.join(os.path.dirname(os.path.abspath(config_path)), 'archive.sqlite'),
+            retention_days=self.config.get('archive_retention_days')
+        ) if self.config.get('archive_enabled') else None
+
+        # Scheduled messages are saved next to config file
+        self.scheduler = Scheduler(
+            self.config.get('schedule_path') or
+            os.path.join(os.path.dirname(os.path.abspath(config_path)), 'schedule.json'),
+            self._on_scheduled_job,
+            catch_up=self.config.get('schedule_catch_up', 3600)
+        )
+
+        # Long command outputs are sent page by page, users continue with /bot more
+        self.pager = Pager(
+            maxsize=self.config.get('paging_max_cursors') or 1000,
+            ttl=self.config.get('paging_ttl') or 600
+        )
+
+        # Metrics are always collected, but served over HTTP only if metrics_port is set
+        self.metrics = MetricsRegistry()
+        self._metrics_server = None
+        self._loop_lag_monitor = None
+        self._setup_metrics()
+
+        # Profiler times all handlers and commands (and dumps profile on SIGUSR1)
+        self._profiler = profiler
+        if profiler:
+            handler.wrap_coroutine = profiler.wrap_coroutine
+            command.wrap_coroutine = profiler.wrap_coroutine
+
+    def login(self, refresh_token_path):
+        """Login to Google account"""
+        # Authenticate Google user with OAuth token and save it
+        # (or load already saved OAuth token)
+        try:
+            cookies = hangups.auth.get_auth_stdin(refresh_token_path)
+            return cookies
+        except hangups.GoogleAuthError as e:
+            print(_('Login failed ({})').format(e))
+            return False
+
+    def run(self):
+        """Connect to Hangouts and run bot"""
+        cookies = self.login(self._refresh_token_path)
+        if not cookies:
+            sys.exit(1)
+
+        add_signal_handlers(self.stop, self._profiler)
+        loop = asyncio.get_event_loop()
+        if self._profiler:
+            self._profiler.start(loop)
+
+        connected = loop.run_until_complete(self.serve(cookies))
+
+        if self._profiler:
+            self._profiler.stop()
+            dump_profile(self._profiler)
+        sys.exit(0 if connected else 1)
+
+    @asyncio.coroutine
+    def serve(self, cookies):
+        """Connect to Hangouts with cookies of logged in account and handle events until bot is stopped
+
+           Returns False if bot has given up reconnecting."""
+        # Create Hangups client (the same client is used for reconnecting,
+        # so lists of users and conversations are preserved)
+        self._client = hangups.Client(cookies)
+        self._client.on_connect.add_observer(self._on_connect)
+        self._client.on_disconnect.add_observer(self._on_disconnect)
+
+        # Reload config whenever config file is changed
+        if self.config.get('config_watching_enabled', True):
+            self._config_watcher = FileWatcher(self.config.filename, self._on_config_changed)
+            self._config_watcher.start()
+
+        if self.archive:
+            self.archive.start()
+
+        # Serve metrics on local HTTP endpoint
+        if self.config.get('metrics_port'):
+            self._metrics_server = MetricsServer(self.metrics,
+                                                 host=self.config.get('metrics_host') or '127.0.0.1',
+                                                 port=self.config.get('metrics_port'))
+            try:
+                yield from self._metrics_server.start()
+            except OSError as e:
+                print(_('Failed to start metrics server: {}').format(e))
+                self._metrics_server = None
+            else:
+                # Loop lag is measured only when there is somebody to read it
+                self._loop_lag_monitor.start()
+
+        # Connect to Hangouts
+        # If we are forcefully disconnected, try connecting again
+        connected = yield from self._supervisor.run()
+        self._lanes.cancel()
+        command.cancel_background(self)
+        self._outbound.cancel()
+        if self._metrics_server:
+            self._loop_lag_monitor.stop()
+            self._metrics_server.stop()
+        if self.offloader:
+            self.offloader.close()
+        if self.archive:
+            yield from self.archive.close()
+        yield from self.scheduler.close()
+
+        # Write pending config changes
+        if self._config_watcher:
+            self._config_watcher.stop()
+        yield from self.config.flush()
+
+        # Save up-to-date lists of users and conversations for next start
+        if self._snapshot and self._conv_list is not None:
+            yield from self._snapshot.save(self._user_list, self._conv_list)
+        return connected
+
+    def stop(self):
+        """Disconnect from Hangouts"""
+        self._supervisor.stop()
+        if self._supervisor.connected:
+            asyncio.async(
+                self._client.disconnect()
+            ).add_done_callback(lambda future: future.result())
+
+    def send_message(self, conversation, text):
+        """Send simple chat message (returns future which can be waited for)"""
+        return self.send_message_segments(conversation, text_to_segments(text))
+
+    def send_message_segments(self, conversation, segments, image_id=None):
+        """Send chat message segments (returns future which can be waited for)
+
+           All messages are sent in order through rate limited outbound queue."""
+        # Ignore if the user hasn't typed a message.
+        if len(segments) == 0 and image_id is None:
+            future = asyncio.Future()
+            future.set_result(None)
+            return future
+        # XXX: Exception handling here is still a bit broken. Uncaught
+        # exceptions in _on_message_sent will only be logged.
+        future = self._outbound.send(conversation, segments, image_id=image_id)
+        future.add_done_callback(functools.partial(self._on_message_sent, time.perf_counter()))
+        return future
+
+    @asyncio.coroutine
+    def upload_images(self, links):
+        """Download images and upload them to Google+"""
+        return (yield from self._image_uploader.upload_images(links))
+
+    @asyncio.coroutine
+    def _fetch_image(self, link, image_file):
+        """Download image to file (it is written in chunks as it arrives)"""
+        session = aiohttp.ClientSession()
+        try:
+            res = yield from asyncio.wait_for(session.get(link), http_utils.CONNECT_TIMEOUT)
+            try:
+                if res.status != 200:
+                    raise hangups.NetworkError('Request return unexpected status: {}: {}'.format(
+                        res.status, res.reason))
+                while True:
+                    chunk = yield from asyncio.wait_for(res.content.read(65536), http_utils.REQUEST_TIMEOUT)
+                    if not chunk:
+                        break
+                    image_file.write(chunk)
+            finally:
+                res.close()
+        except asyncio.TimeoutError:
+            raise hangups.NetworkError('Request timed out')
+        except aiohttp.ClientError as e:
+            raise hangups.NetworkError('Request connection error: {}'.format(e))
+        finally:
+            # ClientSession.close() is coroutine since aiohttp 2.0
+            yield from asyncio.coroutine(session.close)()
+
+    @asyncio.coroutine
+    def _upload_image(self, image_file, filename):
+        """Upload image to Google+ and return its image_id"""
+        start = time.perf_counter()
+        status = 'failed'
+        try:
+            image_id = yield from self._client.upload_image(image_file, filename=filename)
+            status = 'ok'
+            return image_id
+        finally:
+            self._image_upload_seconds.observe(time.perf_counter() - start)
+            self._image_uploads_counter.labels(status).inc()
+
+    def list_conversations(self):
+        """List all active conversations"""
+        if self._sorted_convs is None:
+            self._sorted_convs = sorted(self._conv_list.get_all(),
+                                        reverse=True, key=lambda c: c.last_modified)
+        return list(self._sorted_convs)
+
+    def find_conversations(self, conv_name):
+        """Find conversations by name or ID in list of all active conversations"""
+        conv_name = conv_name.strip()
+        conv_name_lower = conv_name.lower()
+        if conv_name_lower.startswith("id:"):
+            return [self._conv_list.get(conv_name[3:])]
+        if not conv_name:
+            return self.list_conversations()
+
+        convs = sorted(self._conv_index.search(conv_name),
+                       reverse=True, key=lambda c: c.last_modified)
+        return convs
+
+    def list_users(self, conv=None):
+        """List all known users or all users in conversation"""
+        if isinstance(conv, Conversation):
+            return sorted(conv.users, key=full_name_sort)
+
+        if self._sorted_users is None or self._sorted_users[0] != self._user_index.version:
+            self._sorted_users = (self._user_index.version,
+                                  sorted(self._user_list.get_all(), key=full_name_sort))
+        return list(self._sorted_users[1])
+
+    def find_users(self, user_name, conv=None):
+        """Find users by name or ID in list of all known users or in conversation"""
+        user_name = user_name.strip()
+        user_name_lower = user_name.lower()
+        if user_name_lower.startswith("id:"):
+            return [self._user_list.get_user(user_name[3:])]
+        if not user_name:
+            return self.list_users(conv=conv)
+
+        # Conversations are small, so there is no need for index
+        if isinstance(conv, Conversation):
+            return [u for u in self.list_users(conv=conv)
+                    if user_name_lower in u.full_name.lower()]
+
+        return sorted(self._user_index.search(user_name), key=full_name_sort)
+
+    def is_plugin_disabled(self, module):
+        """Return True if plugin module (e.g. "hangupsbot.handlers.rename") is disabled in config"""
+        plugins_disabled = self.config.memoize(None, 'plugins_disabled', lambda: frozenset(
+            self.config.get('plugins_disabled') or []))
+        return module.split('.', 1)[-1] in plugins_disabled
+
+    def get_config_suboption(self, conv_id, option):
+        """Get config suboption for conversation (or global option if not defined)"""
+        return self.config.get_suboption(conv_id, option)
+
+    def get_usage(self):
+        """Get resources used by bot (for comparing accounts running in one process)"""
+        def total(metric, attr='value'):
+            return sum(getattr(value, attr) for value in metric.values.values())
+
+        return {
+            'connected': self._supervisor.connected,
+            'users': len(self._user_list.get_all()) if self._user_list is not None else 0,
+            'conversations': len(self._conv_list.get_all()) if self._conv_list is not None else 0,
+            'events': total(self._events_counter),
+            'handler_time': total(self._handler_seconds, 'sum'),
+            'commands': sum(sum(value.counts) for value in self._command_seconds.values.values()),
+            'command_time': total(self._command_seconds, 'sum'),
+            'background_commands': sum(1 for bot in command.background.values() if bot is self),
+            'messages': total(self._messages_counter),
+            'image_uploads': total(self._image_uploads_counter),
+            'event_queue_depth': self._lanes.queue_depth(),
+            'outbound_queue_depth': self._outbound.queue_depth(),
+            'paging_cursors': len(self.pager.cursors)
+        }
+
+    def _setup_metrics(self):
+        """Create metrics and hook them into handlers, commands and other components"""
+        self._events_counter = self.metrics.counter('events_total', 'Received events', ['type'])
+        self._messages_counter = self.metrics.counter('messages_total', 'Messages sent by bot', ['status'])
+        self._message_send_seconds = self.metrics.histogram('message_send_seconds',
+                                                            'Time from queueing message to sending it')
+        self._image_uploads_counter = self.metrics.counter('image_uploads_total', 'Uploaded images', ['status'])
+        self._image_upload_seconds = self.metrics.histogram('image_upload_seconds', 'Time of uploading image')
+
+        # Handlers and commands are shared by all bots in process, so hooks skip other bots
+        handler_seconds = self._handler_seconds = self.metrics.histogram(
+            'handler_seconds', 'Time spent in handler', ['handler'])
+        handler_errors = self.metrics.counter('handler_errors_total', 'Failed handlers', ['handler', 'error'])
+
+        def on_handled(bot, func, elapsed, exception):
+            if bot is not self:
+                return
+            handler_seconds.labels(func.__name__).observe(elapsed)
+            if exception is not None:
+                handler_errors.labels(func.__name__, type(exception).__name__).inc()
+        handler.on_handled.append(on_handled)
+
+        command_seconds = self._command_seconds = self.metrics.histogram(
+            'command_seconds', 'Time spent in command', ['command'])
+        command_runs = self.metrics.counter('commands_total', 'Commands run', ['command', 'status'])
+
+        def on_run(bot, name, elapsed, status):
+            if bot is not self:
+                return
+            command_seconds.labels(name).observe(elapsed)
+            command_runs.labels(name, status).inc()
+        command.on_run.append(on_run)
+
+        self._loop_lag_monitor = LoopLagMonitor(
+            self.metrics.histogram('loop_lag_seconds', 'Event loop lag',
+                                   buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)),
+            self.metrics.gauge('loop_lag_last_seconds', 'Last measured event loop lag')
+        )
+
+        # Gauges and counters kept by components are updated only when metrics are requested
+        def collect():
+            stats = self._supervisor.get_stats()
+            self.metrics.gauge('connected', 'Connected to Hangouts').set(int(stats['connected']))
+            self.metrics.gauge('circuit_open', 'Too many failed connection attempts').set(int(stats['circuit_open']))
+            self.metrics.counter('reconnects_total', 'Successful reconnects').labels().set(stats['reconnects'])
+            self.metrics.counter('reconnect_seconds_total', 'Time spent reconnecting').labels().set(
+                stats['reconnect_time_total'])
+
+            stats = self._outbound.get_stats()
+            self.metrics.gauge('outbound_queue_depth', 'Messages waiting for sending').set(stats['queue_depth'])
+            self.metrics.counter('outbound_coalesced_total', 'Messages merged into preceding message').labels().set(
+                stats.get('coalesced', 0))
+
+            stats = self._lanes.get_stats()
+            self.metrics.gauge('event_queue_depth', 'Events waiting for handling').set(stats['queue_depth'])
+            self.metrics.gauge('event_lanes', 'Conversations with events being handled').set(stats['lanes'])
+            self.metrics.counter('events_dropped_total', 'Events dropped because of full queue').labels().set(
+                stats.get('dropped', 0))
+            self.metrics.counter('event_wait_seconds_total', 'Time events waited in queue').labels().set(
+                stats.get('latency_total', 0))
+
+            if self.archive:
+                stats = self.archive.get_stats()
+                self.metrics.counter('archived_events_total', 'Events written to archive').labels().set(
+                    stats['archived'])
+                self.metrics.counter('archive_dropped_total', 'Events which failed to be archived').labels().set(
+                    stats['dropped'])
+                self.metrics.gauge('archive_pending', 'Events waiting for writing to archive').set(stats['pending'])
+
+            if self.offloader:
+                stats = self.offloader.get_stats()
+                self.metrics.counter('offload_tasks_total', 'Tasks run in process pool').labels().set(
+                    stats.get('tasks', 0))
+                self.metrics.counter('offload_timeouts_total', 'Tasks in process pool which timed out').labels().set(
+                    stats.get('timeouts', 0))
+                self.metrics.counter('offload_cache_hits_total', 'Cached results of matching').labels().set(
+                    stats.get('cache_hits', 0))
+                self.metrics.gauge('offload_disabled_regexes', 'Regexes disabled for being slow').set(
+                    stats['disabled'])
+        self.metrics.collectors.append(collect)
+
+    @asyncio.coroutine
+    def reload_config(self, force=False):
+        """Reload config from file (if it has changed) and apply changed global options"""
+        changes = yield from self.config.reload(force=force)
+        if changes and changes[0]:
+            self._apply_options()
+        return changes
+
+    def _apply_options(self):
+        """Apply global options of outbound queue, event lanes, image uploader and offloader"""
+        self._outbound.set_rates(
+            rate=self.config.get('outbound_rate', 5),
+            burst=self.config.get('outbound_burst', 10),
+            conv_rate=self.config.get('outbound_conv_rate', 1),
+            conv_burst=self.config.get('outbound_conv_burst', 5)
+        )
+        self._outbound.coalesce_window = self.config.get('outbound_coalesce_window', 1.0)
+        self._outbound.coalesce_length = self.config.get('outbound_coalesce_length', 1000)
+
+        self._lanes.set_limit(
+            maxsize=self.config.get('event_queue_size', 100),
+            policy=self.config.get('event_overflow_policy', 'drop_oldest')
+        )
+
+        self._image_uploader.configure(
+            concurrency=self.config.get('image_upload_concurrency') or 4,
+            cache_size=self.config.get('image_cache_size') or 256,
+            cache_ttl=self.config.get('image_cache_ttl') or 3600
+        )
+
+        if not self.config.get('offload_enabled'):
+            if self.offloader:
+                self.offloader.close()
+            self.offloader = None
+            return
+        if self.offloader is None:
+            self.offloader = Offloader()
+        self.offloader.resize(self.config.get('offload_workers') or 2)
+        self.offloader.timeout = self.config.get('offload_timeout') or 1.0
+        self.offloader.min_length = self.config.get('offload_min_length') or 1000
+        self.offloader.budget = self.config.get('offload_budget') or 0.1
+        self.offloader.max_strikes = self.config.get('offload_max_strikes') or 3
+
+    def _on_config_changed(self):
+        """Reload config after config file has changed"""
+        # Errors are logged by reload and invalid config is not used
+        asyncio.async(
+            self.reload_config()
+        ).add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    def _on_scheduled_job(self, job):
+        """Send scheduled message"""
+        try:
+            conv = self._conv_list.get(job.conv_id)
+        except KeyError:
+            logger.warning('Scheduled job {} dropped (unknown conversation {})'.format(job.id_, job.conv_id))
+            return
+        self.send_message(conv, job.text)
+
+    def _on_message_sent(self, start, future):
+        """Handle showing an error if a message fails to send"""
+        self._message_send_seconds.observe(time.perf_counter() - start)
+        sent = self._messages_counter
+        if future.cancelled():
+            sent.labels('cancelled').inc()
+            return
+        try:
+            future.result()
+        except hangups.NetworkError:
+            sent.labels('failed').inc()
+            print(_('Failed to send message!'))
+        else:
+            sent.labels('sent').inc()
+
+    @asyncio.coroutine
+    def _on_connect(self):
+        """Handle connecting"""
+        print(_('Connected!'))
+        self._supervisor.on_connected()
+
+        # After reconnecting, lists of users and conversations are kept
+        # (hangups.ConversationList syncs events missed since its last sync timestamp)
+        if self._conv_list is not None:
+            self.scheduler.resume()
+            return
+
+        # Start with cached lists if possible, changes are synced in background
+        cached_lists = self._snapshot.load(self._client) if self._snapshot else None
+        if cached_lists:
+            self._user_list, self._conv_list = cached_lists
+            # Events missed since snapshot are replayed by sync, but they are not handled
+            # (ConversationList syncs on connect by itself, this observer runs after its sync)
+            self._replay_until = datetime.datetime.now(datetime.timezone.utc)
+            self._client.on_connect.add_observer(self._on_cached_lists_synced)
+        else:
+            self._user_list, self._conv_list = (
+                yield from hangups.build_user_conversation_list(self._client)
+            )
+        self._conv_list.on_event.add_observer(self._on_event)
+        self._build_indexes()
+
+        # Scheduled messages missed while bot was not running are sent now
+        self.scheduler.resume()
+
+        print(_('Conversations:'))
+        for c in self.list_conversations():
+            print('  {} ({})'.format(get_conv_name(c, truncate=True), c.id_))
+        print()
+
+        if self._snapshot and not cached_lists:
+            asyncio.async(self._snapshot.save(self._user_list, self._conv_list))
+
+    def _on_cached_lists_synced(self):
+        """Handle end of sync of cached lists (handle new events, save fresh lists)"""
+        self._replay_until = None
+        # Observers of event can't be removed while it is being fired
+        asyncio.get_event_loop().call_soon(self._client.on_connect.remove_observer,
+                                           self._on_cached_lists_synced)
+        self._build_indexes()
+        asyncio.async(self._snapshot.save(self._user_list, self._conv_list))
+
+    def _build_indexes(self):
+        """Build search indexes of user and conversation names"""
+        self._user_index = NameIndex()
+        for user in self._user_list.get_all():
+            self._user_index.add(user.id_, user.full_name, user)
+
+        self._conv_index = NameIndex()
+        for conv in self._conv_list.get_all():
+            self._conv_index.add(conv.id_, get_conv_name(conv, truncate=True), conv)
+
+        self._sorted_convs = None
+        self._sorted_users = None
+
+    def _update_indexes(self, conv_event):
+        """Update search indexes and sorted lists after conversation event"""
+        # Every event changes order of conversations
+        self._sorted_convs = None
+
+        conv = self._conv_list.get(conv_event.conversation_id)
+        if conv.id_ not in self._conv_index:
+            for user in conv.users:
+                self._user_index.add(user.id_, user.full_name, user)
+        elif isinstance(conv_event, hangups.MembershipChangeEvent):
+            for user_id in conv_event.participant_ids:
+                user = conv.get_user(user_id)
+                self._user_index.add(user.id_, user.full_name, user)
+        elif not isinstance(conv_event, hangups.RenameEvent):
+            return
+
+        # Conversation is new, renamed or its name (if unnamed) is built from changed members
+        self._conv_index.add(conv.id_, get_conv_name(conv, truncate=True), conv)
+
+    @asyncio.coroutine
+    def _on_event(self, conv_event):
+        """Handle conversation events"""
+        self._events_counter.labels(type(conv_event).__name__).inc()
+        self._update_indexes(conv_event)
+        self._archive_event(conv_event)
+
+        # Old commands and autoreplies are not repeated on start with cached lists
+        # (same as on start without them, when missed events are not fetched at all)
+        if self._replay_until is not None and conv_event.timestamp < self._replay_until:
+            return
+        yield from self._lanes.submit(conv_event.conversation_id, conv_event)
+
+    def _archive_event(self, conv_event):
+        """Archive conversation event (including messages sent by bot, which aren't handled)"""
+        if self.archive is None or not self.get_config_suboption(conv_event.conversation_id, 'archive_enabled'):
+            return
+
+        conv = self._conv_list.get(conv_event.conversation_id)
+        if isinstance(conv_event, hangups.ChatMessageEvent):
+            text = conv_event.text.strip()
+        elif isinstance(conv_event, hangups.RenameEvent):
+            text = conv_event.new_name
+        elif isinstance(conv_event, hangups.MembershipChangeEvent):
+            text = ', '.join(conv.get_user(user_id).full_name for user_id in conv_event.participant_ids)
+        else:
+            text = ''
+
+        # Events replayed by sync are archived too (archive ignores events it already has)
+        self.archive.add(conv_event.id_, conv.id_, conv_event.user_id.chat_id,
+                         conv.get_user(conv_event.user_id).full_name,
+                         conv_event.timestamp, type(conv_event).__name__, text)
+
+    def _is_command_event(self, conv_event):
+        """Return True if event is chat message with bot command"""
+        if not isinstance(conv_event, hangups.ChatMessageEvent):
+            return False
+        from hangupsbot.handlers.commands import get_alias_matcher
+        text = conv_event.text.strip()
+        if not text:
+            return False
+        matcher = get_alias_matcher(self, conv_event.conversation_id)
+        # Regex aliases are not searched in event loop when offloading is enabled
+        return matcher.match_plain(text) if self.offloader else matcher.match(text)
+
+    @asyncio.coroutine
+    def _on_disconnect(self):
+        """Handle disconnecting"""
+        print(_('Connection lost!'))
+        self.scheduler.pause()
@@ -0,0 +1,81 @@
+import time, logging, asyncio
+
+from hangups.ui.utils import get_conv_name
+
+
+logger = logging.getLogger(__name__)
+
+default_bulk_concurrency = 5
+default_bulk_progress_interval = 10
+
+
+def parse_dry_run(conv_name, args):
+    """Get dry run flag, conversation name and other arguments of command
+       (--dry-run option can precede conversation name)"""
+    if conv_name == '--dry-run':
+        return True, args[0] if args else '', args[1:]
+    return False, conv_name, args
+
+
+@asyncio.coroutine
+def run_bulk(bot, event, name, convs, operation, dry_run=False):
+    """Run coroutine operation(conv) for every conversation and report results to caller
+
+       At most bulk_concurrency conversations are processed at once, steps of operation
+       in one conversation run in order. Progress is reported every bulk_progress_interval
+       seconds and failures are summarized at the end. Dry run only lists conversations."""
+    conv_names = [get_conv_name(conv, truncate=True) for conv in convs]
+    if dry_run:
+        yield from bot.send_message(
+            event.conv, _('**{} would run in {} conversations:**\n{}').format(
+                name, len(convs), '\n'.join(conv_names))
+        )
+        return
+    if not convs:
+        yield from bot.send_message(event.conv, _('{}: No conversation found!').format(name))
+        return
+
+    concurrency = (bot.get_config_suboption(event.conv_id, 'bulk_concurrency') or
+                   default_bulk_concurrency)
+    interval = (bot.get_config_suboption(event.conv_id, 'bulk_progress_interval') or
+                default_bulk_progress_interval)
+    semaphore = asyncio.Semaphore(concurrency)
+    done = [0]
+
+    @asyncio.coroutine
+    def run(conv):
+        yield from semaphore.acquire()
+        try:
+            yield from operation(conv)
+        finally:
+            semaphore.release()
+            done[0] += 1
+
+    # Failure in one conversation doesn't stop others
+    start = time.monotonic()
+    future = asyncio.gather(*[run(conv) for conv in convs], return_exceptions=True)
+    try:
+        while True:
+            finished, pending = yield from asyncio.wait([future], timeout=interval)
+            if finished:
+                break
+            bot.send_message(event.conv, _('{}: {} of {} conversations done').format(name, done[0], len(convs)))
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    results = future.result()
+
+    failures = []
+    for conv, conv_name, result in zip(convs, conv_names, results):
+        if isinstance(result, Exception):
+            failures.append((conv_name, result))
+            logger.warning('{} failed in {}: {!r}'.format(name, conv.id_, result))
+
+    # Operation in single conversation is reported only if it failed
+    if failures or len(convs) > 1:
+        text = _('{}: done in {} of {} conversations ({:.1f} s)').format(
+            name, len(convs) - len(failures), len(convs), time.monotonic() - start)
+        if failures:
+            text += _('\n**Failed:**\n{}').format(
+                '\n'.join('{}: {}'.format(conv_name, result) for conv_name, result in failures))
+        yield from bot.send_message(event.conv, text)
@@ -0,0 +1,73 @@
+import time, collections
+
+
+class LRUCache:
+    """Least recently used cache with limited size and optional time to live of items"""
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._items = collections.OrderedDict()   # key -> (expiration time, value)
+
+    def get(self, key, default=None):
+        """Get item from cache (or default if item isn't cached or has expired)"""
+        try:
+            expires, value = self._items[key]
+        except KeyError:
+            return default
+        if expires is not None and expires <= self.timer():
+            del self._items[key]
+            return default
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """Put item to cache (least recently used item is removed if cache is full)"""
+        expires = self.timer() + self.ttl if self.ttl is not None else None
+        self._items[key] = (expires, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove item from cache and return it"""
+        try:
+            return self._items.pop(key)[1]
+        except KeyError:
+            return default
+
+    def clear(self):
+        """Remove all items from cache"""
+        self._items.clear()
+
+    def __contains__(self, key):
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self):
+        return len(self._items)
+
+
+def freeze(value):
+    """Convert lists and dicts (e.g. from config) to hashable tuples"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    return value
+
+
+# Objects compiled from config rules, shared by all conversations and bots with equal rules
+compiled_cache = LRUCache(maxsize=256)
+
+
+def get_compiled(factory, rules):
+    """Get object built as factory(rules) (it is built only once for equal rules)
+
+       Built objects must not be changed, because they can be used by many bots."""
+    key = (factory, freeze(rules))
+    compiled = compiled_cache.get(key)
+    if compiled is None:
+        compiled = factory(rules)
+        compiled_cache.set(key, compiled)
+    return compiled
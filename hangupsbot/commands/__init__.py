@@ -1,4 +1,9 @@
-import os, glob, asyncio
+import os, time, weakref, logging, importlib, asyncio
+
+from hangupsbot.plugins import PluginManifest
+
+
+logger = logging.getLogger(__name__)
 
 
 class CommandDispatcher:
@@ -7,38 +12,174 @@ class CommandDispatcher:
         self.commands = {}
         self.commands_admin = []
         self.unknown_command = None
+        self.timeouts = {}       # command name -> timeout set by plugin (in seconds)
+        self.stats = {}          # command name -> [number of calls, cumulative time, failures, timeouts]
+        self.background = {}     # task of command which is running in background -> bot
+        self.on_run = []         # hooks called as hook(bot, name, elapsed_time, status) after every command
+        self.wrap_coroutine = None  # function called as wrap_coroutine(name, coro) (used by profiler)
+        self.pending = {}        # command name -> plugin module which hasn't been imported yet
+        self.pending_unknown = None
+        self.configs = weakref.WeakValueDictionary()  # id -> config with memoized admin commands
+
+    def add_plugins(self, manifest):
+        """Import plugins only when one of their commands is run
+           (plugins which can't be scanned are imported immediately)"""
+        for module, registered in sorted(manifest.modules.items()):
+            if registered is None:
+                importlib.import_module(module)
+                continue
+            for name, kwds in registered:
+                if kwds['method'] == 'register_unknown':
+                    self.pending_unknown = module
+                    continue
+                self.pending[name] = module
+                if kwds.get('admin') and name not in self.commands_admin:
+                    self.commands_admin.append(name)
+
+    def disable_plugins(self, plugins):
+        """Never import plugins from list (e.g. ["commands.jokes"])"""
+        for name, module in list(self.pending.items()):
+            if module.split('.', 1)[-1] in plugins:
+                del self.pending[name]
+        if self.pending_unknown and self.pending_unknown.split('.', 1)[-1] in plugins:
+            self.pending_unknown = None
+
+    def _load_plugin(self, module):
+        """Import plugin (its commands are registered by import)"""
+        for name, pending_module in list(self.pending.items()):
+            if pending_module == module:
+                del self.pending[name]
+        if self.pending_unknown == module:
+            self.pending_unknown = None
+        importlib.import_module(module)
+
+    def get_command(self, name):
+        """Get command function (plugin with command is imported on first use)"""
+        if name not in self.commands and name in self.pending:
+            self._load_plugin(self.pending[name])
+        return self.commands.get(name)
+
+    def get_unknown_command(self):
+        """Get function handling unknown commands"""
+        if self.unknown_command is None and self.pending_unknown:
+            self._load_plugin(self.pending_unknown)
+        return self.unknown_command
+
+    def get_command_names(self):
+        """Get sorted names of all commands (including commands which haven't been imported yet)"""
+        return sorted(set(self.commands) | set(self.pending))
 
     def get_admin_commands(self, bot, conv_id):
-        """Get list of admin-only commands (set by plugins or in config.json)"""
-        commands_admin = bot.get_config_suboption(conv_id, 'commands_admin') or []
-        return list(set(commands_admin + self.commands_admin))
+        """Get frozenset of admin-only commands (set by plugins or in config.json)
+
+           Set is built only once until config is changed or more commands are registered."""
+        def build():
+            self.configs[id(bot.config)] = bot.config
+            commands_admin = bot.get_config_suboption(conv_id, 'commands_admin') or []
+            return frozenset(commands_admin + self.commands_admin)
+        return bot.config.memoize(conv_id, 'commands_admin', build)
+
+    def get_timeout(self, bot, name):
+        """Get timeout of command (set in config.json or by plugin, None means no timeout)"""
+        timeouts = bot.config.get('command_timeouts') or {}
+        if name in timeouts:
+            return timeouts[name] or None
+        if name in self.timeouts:
+            return self.timeouts[name] or None
+        return bot.config.get('command_timeout', 120) or None
+
+    def get_stats(self):
+        """Get number of calls, cumulative time, failures and timeouts for every command"""
+        return {name: tuple(stats) for name, stats in self.stats.items()}
 
     @asyncio.coroutine
     def run(self, bot, event, *args, **kwds):
-        """Run command"""
-        try:
-            func = self.commands[args[0]]
-        except KeyError:
-            if self.unknown_command:
-                func = self.unknown_command
-            else:
-                raise
+        """Run command
+
+           Command which doesn't finish within command_background_delay continues
+           in background, so it doesn't block handling of other events."""
+        func = self.get_command(args[0])
+        if func is None or bot.is_plugin_disabled(func.__module__):
+            func = self.get_unknown_command()
+        if func is None:
+            raise KeyError(args[0])
 
+        name = func.__name__
         args = list(args[1:])
 
+        coro = func(bot, event, *args, **kwds)
+        if self.wrap_coroutine:
+            coro = self.wrap_coroutine('command:{}'.format(name), coro)
+        timeout = self.get_timeout(bot, name)
+        task = asyncio.async(self._run(bot, name, timeout, coro))
+        try:
+            yield from asyncio.wait([task], timeout=bot.config.get('command_background_delay', 1.0))
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        if not task.done():
+            logger.info('command={} status=background'.format(name))
+            self.background[task] = bot
+            task.add_done_callback(lambda task: self.background.pop(task, None))
+
+    @asyncio.coroutine
+    def _run(self, bot, name, timeout, coro):
+        """Run command coroutine with timeout and update command statistics"""
+        start = time.perf_counter()
+        status = 'ok'
         try:
-            yield from func(bot, event, *args, **kwds)
+            if timeout:
+                yield from asyncio.wait_for(coro, timeout)
+            else:
+                yield from coro
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        except asyncio.TimeoutError:
+            status = 'timeout'
         except Exception as e:
-            print(e)
+            status = 'failed'
+            logger.exception('command={} duration={:.3f} status=failed error={!r}'.format(
+                name, time.perf_counter() - start, e))
+        finally:
+            elapsed = time.perf_counter() - start
+            try:
+                stats = self.stats[name]
+            except KeyError:
+                stats = self.stats[name] = [0, 0.0, 0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            if status == 'failed':
+                stats[2] += 1
+            elif status == 'timeout':
+                stats[3] += 1
+                logger.warning('command={} duration={:.3f} status=timeout'.format(name, elapsed))
+            else:
+                logger.debug('command={} duration={:.3f} status={}'.format(name, elapsed, status))
 
-    def register(self, *args, admin=False):
+            for hook in self.on_run:
+                hook(bot, name, elapsed, status)
+
+    def cancel_background(self, bot=None):
+        """Cancel commands of bot (or of all bots) running in background"""
+        for task, task_bot in list(self.background.items()):
+            if bot is None or task_bot is bot:
+                task.cancel()
+
+    def register(self, *args, admin=False, timeout=None):
         """Decorator for registering command"""
         def wrapper(func):
             # Automatically wrap command function in coroutine
             func = asyncio.coroutine(func)
             self.commands[func.__name__] = func
-            if admin:
+            if admin and func.__name__ not in self.commands_admin:
                 self.commands_admin.append(func.__name__)
+                # Memoized sets of admin commands don't include new command
+                for config in list(self.configs.values()):
+                    config.invalidate()
+            if timeout is not None:
+                self.timeouts[func.__name__] = timeout
             return func
 
         # If there is one (and only one) positional argument and this argument is callable,
@@ -59,10 +200,5 @@ class CommandDispatcher:
 # Create CommandDispatcher singleton
 command = CommandDispatcher()
 
-# Build list of commands
-_plugins = glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))
-__all__ = [os.path.splitext(os.path.basename(f))[0] for f in _plugins
-           if os.path.isfile(f) and not os.path.basename(f).startswith("_")]
-
-# Load all commands
-from hangupsbot.commands import *
+# Find commands in plugins (they are imported when one of their commands is run)
+command.add_plugins(PluginManifest(__name__, os.path.dirname(__file__), 'command'))
@@ -0,0 +1,25 @@
+from hangupsbot.commands import command
+
+
+@command.register(admin=True)
+def accounts(bot, event, *args):
+    """Show resources used by bot accounts running in this process
+       Usage: /bot accounts"""
+    usage = bot.group.get_usage() if bot.group else [(bot.name, bot.get_usage())]
+
+    lines = [_('**Accounts:**')]
+    for name, stats in usage:
+        lines.append(_('**{}**{}: {} users, {} conversations').format(
+            name or _('default'),
+            '' if stats['connected'] else _(' (disconnected)'),
+            stats['users'], stats['conversations']
+        ))
+        lines.append(_('events: {}, handlers: {:.1f} s, commands: {} ({:.1f} s, {} in background)').format(
+            stats['events'], stats['handler_time'],
+            stats['commands'], stats['command_time'], stats['background_commands']
+        ))
+        lines.append(_('messages: {}, images: {}, queued events: {}, queued messages: {}').format(
+            stats['messages'], stats['image_uploads'],
+            stats['event_queue_depth'], stats['outbound_queue_depth']
+        ))
+    yield from bot.send_message(event.conv, '\n'.join(lines))
@@ -0,0 +1,73 @@
+import sqlite3, datetime
+
+from hangups.ui.utils import get_conv_name
+
+from hangupsbot.utils import strip_quotes
+from hangupsbot.permissions import is_global_admin
+from hangupsbot.commands import command
+
+
+@command.register
+def search(bot, event, query=None, *args):
+    """Search archived messages (all words must match, quote query with more words)
+       Only global admins can search in other conversations (use . for current conversation).
+       Usage: /bot search query [conversation_name]"""
+    if bot.archive is None:
+        yield from bot.send_message(
+            event.conv, _('{}: Message archive is not enabled!').format(event.user.full_name)
+        )
+        return
+
+    query = strip_quotes(query or '')
+    if not query:
+        yield from bot.send_message(event.conv, _('Usage: /bot search query [conversation_name]'))
+        return
+
+    conv_name = strip_quotes(' '.join(args))
+    # Admins of single conversation can't search other conversations
+    if not is_global_admin(bot, event.user_id.chat_id) or conv_name == '.':
+        conv_ids = [event.conv_id]
+    elif conv_name:
+        conv_ids = [c.id_ for c in bot.find_conversations(conv_name)]
+        if not conv_ids:
+            yield from bot.send_message(event.conv, _('No conversation found!'))
+            return
+    else:
+        conv_ids = None
+
+    results = yield from bot.archive.search(query, conv_ids,
+                                            limit=bot.config.get('archive_search_limit') or 10)
+    if not results:
+        yield from bot.send_message(event.conv, _('No messages found!'))
+        return
+
+    lines = [_('**Found messages:**')]
+    for conv_id, user_name, timestamp, text in results:
+        try:
+            conv_name = get_conv_name(bot._conv_list.get(conv_id), truncate=True)
+        except KeyError:
+            conv_name = conv_id
+        date = datetime.datetime.fromtimestamp(timestamp / 1000000).strftime('%Y-%m-%d %H:%M')
+        if len(text) > 200:
+            text = text[:200] + '...'
+        lines.append('{} [{}] {}: {}'.format(date, conv_name, user_name, text))
+    yield from bot.send_message(event.conv, '\n'.join(lines))
+
+
+@command.register(admin=True, timeout=3600)
+def archive_vacuum(bot, event, *args):
+    """Rebuild message archive, so that it is shrunk by compaction (needed once for older archives)
+       Usage: /bot archive_vacuum"""
+    if bot.archive is None:
+        yield from bot.send_message(
+            event.conv, _('{}: Message archive is not enabled!').format(event.user.full_name)
+        )
+        return
+
+    yield from bot.send_message(event.conv, _('Vacuuming message archive...'))
+    try:
+        yield from bot.archive.vacuum()
+    except sqlite3.Error as e:
+        yield from bot.send_message(event.conv, _('Failed to vacuum message archive: {}').format(e))
+        return
+    yield from bot.send_message(event.conv, _('Message archive vacuumed.'))
@@ -1,6 +1,6 @@
 import json
 
-from hangupsbot.utils import text_to_segments
+from hangupsbot.pager import send_pages
 from hangupsbot.commands import command
 
 
@@ -28,16 +28,18 @@ def config(bot, event, cmd=None, *args):
     if value is None:
         value = _('Key not found!')
 
+    # Value is serialized at once, because config can be changed before next page is requested
     config_path = ' '.join(k for k in ['config'] + config_args)
-    text = (
-        '**{}:**\n'
-        '{}'
-    ).format(config_path, json.dumps(value, indent=2, sort_keys=True))
-    yield from event.conv.send_message(text_to_segments(text))
+    lines = ['**{}:**'.format(config_path)] + json.dumps(value, indent=2, sort_keys=True).splitlines()
+    yield from send_pages(bot, event, lines, title=config_path)
 
 
 @command.register(admin=True)
 def config_reload(bot, event, *args):
     """Reload bot configuration from file"""
-    bot.config.load()
-    yield from event.conv.send_message(text_to_segments(_('Configuration reloaded')))
+    try:
+        yield from bot.reload_config(force=True)
+    except (IOError, ValueError) as e:
+        yield from bot.send_message(event.conv, _('Failed to reload configuration: {}').format(e))
+        return
+    yield from bot.send_message(event.conv, _('Configuration reloaded'))
@@ -1,10 +1,12 @@
-import itertools
+import asyncio, itertools
 
 from hangups import hangouts_pb2
 from hangups.hangouts_pb2 import InviteeID
 from hangups.ui.utils import get_conv_name
 
-from hangupsbot.utils import strip_quotes, text_to_segments
+from hangupsbot.utils import strip_quotes
+from hangupsbot.bulk import parse_dry_run, run_bulk
+from hangupsbot.pager import send_pages
 from hangupsbot.commands import command
 
 
@@ -20,16 +22,18 @@ def get_unique_user_objects(bot, user_list):
     return itertools.chain.from_iterable(bot.find_users(strip_quotes(u)) for u in user_list)
 
 
-@command.register(admin=True)
+@command.register(admin=True, timeout=1800)
 def conv_refresh(bot, event, conv_name, *args):
     """Create new conversation with same users as in old one except kicked users (use . for current conversation)
-       Usage: /bot conv_refresh conversation_name [kicked_user_name_1] [kicked_user_name_2] [...]"""
+       Usage: /bot conv_refresh [--dry-run] conversation_name [kicked_user_name_1] [kicked_user_name_2] [...]"""
+    dry_run, conv_name, args = parse_dry_run(conv_name, args)
     conv_name = strip_quotes(conv_name)
     convs = [event.conv] if conv_name == '.' else bot.find_conversations(conv_name)
-    kicked_chat_ids = get_unique_users(bot, args)
+    kicked_chat_ids = set(get_unique_users(bot, args))
 
-    for c in convs:
-        new_chat_ids = {u for u in bot.find_users('', conv=c) if u.id_.chat_id not in set(kicked_chat_ids)}
+    @asyncio.coroutine
+    def refresh(c):
+        new_chat_ids = {u for u in bot.find_users('', conv=c) if u.id_.chat_id not in kicked_chat_ids}
         invitee_ids = [InviteeID(
             gaia_id=u.id_.gaia_id,
             fallback_name=u.full_name
@@ -49,21 +53,23 @@ def conv_refresh(bot, event, conv_name, *args):
         conv = bot._conv_list.get(conv_id)
 
         yield from conv.rename(c.name)
-        yield from conv.send_message(
-            text_to_segments(('**Welcome!**\n'
-                              'This is the new refreshed conversation. Old conversation has been '
-                              'terminated, but you are one of the lucky ones who survived cleansing! '
-                              'If you are still in old conversation, please leave it.'))
+        yield from bot.send_message(
+            conv, ('**Welcome!**\n'
+                   'This is the new refreshed conversation. Old conversation has been '
+                   'terminated, but you are one of the lucky ones who survived cleansing! '
+                   'If you are still in old conversation, please leave it.')
         )
 
         # Destroy old one and leave it
         yield from c.rename(('[TERMINATED] {}').format(c.name))
-        yield from c.send_message(
-            text_to_segments(('**!!! WARNING !!!**\n'
-                              'This conversation has been terminated! Please leave immediately!'))
+        yield from bot.send_message(
+            c, ('**!!! WARNING !!!**\n'
+                'This conversation has been terminated! Please leave immediately!')
         )
         yield from c.leave()
 
+    yield from run_bulk(bot, event, 'conv_refresh', convs, refresh, dry_run=dry_run)
+
 
 @command.register(admin=True)
 def conv_create(bot, event, conv_name, *args):
@@ -88,13 +94,14 @@ def conv_create(bot, event, conv_name, *args):
     res = yield from bot._client.create_conversation(request)
     conv = bot._conv_list.add_conversation(res.conversation)
     yield from conv.rename(conv_name)
-    yield from conv.send_message(text_to_segments(('Welcome!')))
+    yield from bot.send_message(conv, ('Welcome!'))
 
 
-@command.register(admin=True)
+@command.register(admin=True, timeout=1800)
 def conv_add(bot, event, conv_name, *args):
     """Invite users to existing conversation (use . for current conversation)
-       Usage: /bot conv_add conversation_name [user_name_1] [user_name_2] [...]"""
+       Usage: /bot conv_add [--dry-run] conversation_name [user_name_1] [user_name_2] [...]"""
+    dry_run, conv_name, args = parse_dry_run(conv_name, args)
     conv_name = strip_quotes(conv_name)
     unique_user_objects = get_unique_user_objects(bot, args)
     if not unique_user_objects:
@@ -105,7 +112,9 @@ def conv_add(bot, event, conv_name, *args):
         fallback_name=u.full_name
     ) for u in unique_user_objects]
     convs = [event.conv] if conv_name == '.' else bot.find_conversations(conv_name)
-    for c in convs:
+
+    @asyncio.coroutine
+    def add(c):
         req = hangouts_pb2.AddUserRequest(
             request_header=bot._client.get_request_header(),
             invitee_id=invitee_ids,
@@ -114,41 +123,48 @@ def conv_add(bot, event, conv_name, *args):
         res = yield from bot._client.add_user(req)
         c.add_event(res.created_event)
 
+    yield from run_bulk(bot, event, 'conv_add', convs, add, dry_run=dry_run)
 
-@command.register(admin=True)
+
+@command.register(admin=True, timeout=1800)
 def conv_rename(bot, event, conv_name, *args):
     """Rename conversation (use . for current conversation)
-       Usage: /bot conv_rename conversation_name new_conversation_name"""
+       Usage: /bot conv_rename [--dry-run] conversation_name new_conversation_name"""
+    dry_run, conv_name, args = parse_dry_run(conv_name, args)
     conv_name = strip_quotes(conv_name)
     new_conv_name = strip_quotes(' '.join(args))
 
     convs = [event.conv] if conv_name == '.' else bot.find_conversations(conv_name)
-    for c in convs:
-        yield from c.rename(new_conv_name)
+    yield from run_bulk(bot, event, 'conv_rename', convs, lambda c: c.rename(new_conv_name), dry_run=dry_run)
 
 
-@command.register(admin=True)
+@command.register(admin=True, timeout=1800)
 def conv_send(bot, event, conv_name, *args):
     """Send message to conversation as bot (use . for current conversation)
-       Usage: /bot conv_send conversation_name text"""
+       Usage: /bot conv_send [--dry-run] conversation_name text"""
+    dry_run, conv_name, args = parse_dry_run(conv_name, args)
     conv_name = strip_quotes(conv_name)
+    text = ' '.join(args)
 
     convs = [event.conv] if conv_name == '.' else bot.find_conversations(conv_name)
-    for c in convs:
-        yield from c.send_message(text_to_segments(' '.join(args)))
+    yield from run_bulk(bot, event, 'conv_send', convs, lambda c: bot.send_message(c, text), dry_run=dry_run)
 
 
-@command.register(admin=True)
+@command.register(admin=True, timeout=1800)
 def conv_leave(bot, event, conv_name='', *args):
     """Leave current (or specified) conversation
-       Usage: /bot conv_leave [conversation_name]"""
+       Usage: /bot conv_leave [--dry-run] [conversation_name]"""
+    dry_run, conv_name, args = parse_dry_run(conv_name, args)
     conv_name = strip_quotes(conv_name)
 
-    convs = [event.conv] if not conv_name or conv_name == '.' else bot.find_conversations(conv_name)
-    for c in convs:
-        yield from c.send_message(text_to_segments(_('I\'ll be back!')))
+    @asyncio.coroutine
+    def leave(c):
+        yield from bot.send_message(c, _('I\'ll be back!'))
         yield from c.leave()
 
+    convs = [event.conv] if not conv_name or conv_name == '.' else bot.find_conversations(conv_name)
+    yield from run_bulk(bot, event, 'conv_leave', convs, leave, dry_run=dry_run)
+
 
 @command.register(admin=True)
 def conv_list(bot, event, conv_name='', *args):
@@ -158,16 +174,14 @@ def conv_list(bot, event, conv_name='', *args):
     conv_name = strip_quotes(conv_name)
 
     convs = bot.list_conversations() if not conv_name else bot.find_conversations(conv_name)
-    convs_text = []
-    for c in convs:
-        s = '{} [c: {:d}, f: {:d}, a: {:d}]'.format(
-            get_conv_name(c, truncate=True),
-            bot.get_config_suboption(c.id_, 'commands_enabled'),
-            bot.get_config_suboption(c.id_, 'forwarding_enabled'),
-            bot.get_config_suboption(c.id_, 'autoreplies_enabled')
-        )
-        convs_text.append(s)
 
-    text = _('**Active conversations:**\n'
-             '{}').format('\n'.join(convs_text))
-    yield from event.conv.send_message(text_to_segments(text))
+    def lines():
+        yield _('**Active conversations:**')
+        for c in convs:
+            yield '{} [c: {:d}, f: {:d}, a: {:d}]'.format(
+                get_conv_name(c, truncate=True),
+                bot.get_config_suboption(c.id_, 'commands_enabled'),
+                bot.get_config_suboption(c.id_, 'forwarding_enabled'),
+                bot.get_config_suboption(c.id_, 'autoreplies_enabled')
+            )
+    yield from send_pages(bot, event, lines(), title=_('Active conversations'))
@@ -1,14 +1,14 @@
 from hangups.ui.utils import get_conv_name
 
-from hangupsbot.utils import text_to_segments
+from hangupsbot.pager import send_more
 from hangupsbot.commands import command
 
 
 @command.register_unknown
 def unknown_command(bot, event, *args):
     """Unknown command handler"""
-    yield from event.conv.send_message(
-        text_to_segments(_('{}: Unknown command!').format(event.user.full_name))
+    yield from bot.send_message(
+        event.conv, _('{}: Unknown command!').format(event.user.full_name)
     )
 
 
@@ -18,10 +18,9 @@ def help(bot, event, cmd=None, *args):
        Usage: /bot help [command]"""
 
     cmd = cmd if cmd else 'help'
-    try:
-        command_fn = command.commands[cmd]
-    except KeyError:
-        yield from command.unknown_command(bot, event)
+    command_fn = command.get_command(cmd)
+    if command_fn is None:
+        yield from command.get_unknown_command()(bot, event)
         return
 
     text = _('**{}:**\n'
@@ -30,22 +29,31 @@ def help(bot, event, cmd=None, *args):
     if cmd == 'help':
         text += _('\n\n'
                   '**Supported commands:**\n'
-                  '{}').format(', '.join(sorted(command.commands.keys())))
+                  '{}').format(', '.join(command.get_command_names()))
 
-    yield from event.conv.send_message(text_to_segments(text))
+    yield from bot.send_message(event.conv, text)
+
+
+@command.register
+def more(bot, event, *args):
+    """Show next page of output of your last command"""
+    if not (yield from send_more(bot, event)):
+        yield from bot.send_message(
+            event.conv, _('{}: Nothing more to show!').format(event.user.full_name)
+        )
 
 
 @command.register
 def ping(bot, event, *args):
     """Let's play ping pong!"""
-    yield from event.conv.send_message(text_to_segments('pong'))
+    yield from bot.send_message(event.conv, 'pong')
 
 
 @command.register
 def echo(bot, event, *args):
     """Monkey see, monkey do!
        Usage: /bot echo text"""
-    yield from event.conv.send_message(text_to_segments(' '.join(args)))
+    yield from bot.send_message(event.conv, ' '.join(args))
 
 
 @command.register(admin=True)
@@ -55,5 +63,5 @@ def quit(bot, event, *args):
         event.user.full_name,
         get_conv_name(event.conv, truncate=True)
     ))
-    yield from event.conv.send_message(text_to_segments(_('Et tu, Brute?')))
+    yield from bot.send_message(event.conv, _('Et tu, Brute?'))
     yield from bot._client.disconnect()
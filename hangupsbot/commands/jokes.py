@@ -2,7 +2,7 @@ import asyncio, random
 
 from hangups import hangouts_pb2
 
-from hangupsbot.utils import strip_quotes, text_to_segments
+from hangupsbot.utils import strip_quotes
 from hangupsbot.commands import command
 
 
@@ -42,4 +42,4 @@ def spoof(bot, event, *args):
         '**!!! WARNING !!!**\n'
         'Agent {} ({}) has been reported to Niantic for attempted spoofing!'
     ).format(event.user.full_name, link)
-    yield from event.conv.send_message(text_to_segments(text))
+    yield from bot.send_message(event.conv, text)
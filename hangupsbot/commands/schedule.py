@@ -0,0 +1,97 @@
+import time, datetime
+
+from hangupsbot.utils import strip_quotes
+from hangupsbot.scheduler import CronSchedule, parse_delay
+from hangupsbot.commands import command
+
+
+def parse_when(when, now):
+    """Get (due time, cron expression) from delay (10m), time of day (HH:MM) or cron expression"""
+    delay = parse_delay(when)
+    if delay is not None:
+        return now + delay, None
+
+    try:
+        at = datetime.datetime.strptime(when, '%H:%M').time()
+    except ValueError:
+        pass
+    else:
+        due = datetime.datetime.combine(datetime.date.fromtimestamp(now), at)
+        if due.timestamp() <= now:
+            due += datetime.timedelta(days=1)
+        return due.timestamp(), None
+
+    # Raises ValueError if it isn't cron expression either (or if expression never matches)
+    schedule = CronSchedule(when)
+    schedule.next_time(now)
+    return None, schedule.expression
+
+
+def format_job(job):
+    """Get one line description of job"""
+    return _('{}: {}{} - {}').format(
+        job.id_, datetime.datetime.fromtimestamp(job.due).strftime('%Y-%m-%d %H:%M'),
+        ' ({})'.format(job.cron) if job.cron else '', job.text)
+
+
+@command.register(admin=True)
+def schedule(bot, event, when=None, *args):
+    """Schedule message (or recurring message by cron expression) in current conversation
+       Usage: /bot schedule delay|HH:MM|"minute hour day month weekday" text
+       /bot schedule list
+       /bot schedule cancel job_id"""
+    if when == 'list':
+        jobs = bot.scheduler.list_jobs(event.conv_id)
+        text = _('**Scheduled messages:**\n{}').format('\n'.join(format_job(job) for job in jobs)) if jobs else \
+            _('No scheduled messages!')
+        yield from bot.send_message(event.conv, text)
+        return
+
+    if when == 'cancel':
+        job = bot.scheduler.jobs.get(int(args[0])) if args and args[0].isdigit() else None
+        if job is None or job.conv_id != event.conv_id:
+            yield from bot.send_message(event.conv, _('No such scheduled message!'))
+            return
+        bot.scheduler.cancel(job.id_)
+        yield from bot.send_message(event.conv, _('Scheduled message {} cancelled').format(job.id_))
+        return
+
+    text = ' '.join(args)
+    try:
+        due, cron = parse_when(strip_quotes(when or ''), time.time())
+    except ValueError:
+        due, cron = None, None
+    if not text or (due is None and cron is None):
+        yield from bot.send_message(
+            event.conv, _('Usage: /bot schedule delay|HH:MM|"minute hour day month weekday" text')
+        )
+        return
+
+    job = bot.scheduler.add(due, event.conv_id, text, cron=cron, user_id=event.user_id.chat_id)
+    yield from bot.send_message(event.conv, _('Scheduled message {}').format(format_job(job)))
+
+
+@command.register
+def remind(bot, event, delay=None, *args):
+    """Remind you of something after delay (e.g. 10m, 1h30m or 2d)
+       Usage: /bot remind delay text"""
+    seconds = parse_delay(delay or '')
+    text = ' '.join(args)
+    if not seconds or not text:
+        yield from bot.send_message(event.conv, _('Usage: /bot remind delay text'))
+        return
+
+    user_id = event.user_id.chat_id
+    max_reminders = bot.config.get('remind_max_per_user') or 10
+    if sum(1 for job in bot.scheduler.jobs.values()
+           if job.kind == 'remind' and job.user_id == user_id) >= max_reminders:
+        yield from bot.send_message(
+            event.conv, _('{}: You have too many reminders already!').format(event.user.full_name)
+        )
+        return
+
+    job = bot.scheduler.add(time.time() + seconds, event.conv_id,
+                            _('**Reminder for {}:** {}').format(event.user.full_name, text),
+                            user_id=user_id, kind='remind')
+    yield from bot.send_message(event.conv, _('{}: I will remind you at {}').format(
+        event.user.full_name, datetime.datetime.fromtimestamp(job.due).strftime('%Y-%m-%d %H:%M')))
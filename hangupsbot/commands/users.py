@@ -1,6 +1,9 @@
+import itertools
+
 from hangups.ui.utils import get_conv_name
 
-from hangupsbot.utils import strip_quotes, text_to_segments
+from hangupsbot.utils import strip_quotes
+from hangupsbot.pager import send_pages
 from hangupsbot.commands import command
 
 
@@ -22,15 +25,16 @@ def user_list(bot, event, conv_name='', user_name='', *args):
     conv_name = strip_quotes(conv_name)
     user_name = strip_quotes(user_name)
     convs = [event.conv] if not conv_name or conv_name == '.' else bot.find_conversations(conv_name)
-    text = []
-    for c in convs:
-        text.append(_(
-            '**List of participants in "{}" ({} total):**'
-        ).format(get_conv_name(c, truncate=True), len(c.users)))
-        for u in bot.find_users(user_name, conv=c):
-            text.append(user_to_text(u))
-        text.append('')
-    yield from event.conv.send_message(text_to_segments('\n'.join(text)))
+
+    def lines():
+        for c in convs:
+            yield _(
+                '**List of participants in "{}" ({} total):**'
+            ).format(get_conv_name(c, truncate=True), len(c.users))
+            for u in bot.find_users(user_name, conv=c):
+                yield user_to_text(u)
+            yield ''
+    yield from send_pages(bot, event, lines(), title=_('List of participants'))
 
 
 @command.register(admin=True)
@@ -38,7 +42,6 @@ def user_find(bot, event, user_name='', *args):
     """Find users known to bot by their name
        Usage: /bot user_find [user_name]"""
     user_name = strip_quotes(user_name)
-    text = [_('**Search results for user name "{}":**').format(user_name)]
-    for u in bot.find_users(user_name):
-        text.append(user_to_text(u))
-    yield from event.conv.send_message(text_to_segments('\n'.join(text)))
+    title = _('Search results for user name "{}"').format(user_name)
+    lines = itertools.chain(['**{}:**'.format(title)], map(user_to_text, bot.find_users(user_name)))
+    yield from send_pages(bot, event, lines, title=title)
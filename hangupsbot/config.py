@@ -1,34 +1,216 @@
-import collections, functools, json
+import json, time, hashlib, logging, asyncio, functools, collections
+
+from hangupsbot.utils import atomic_write
+from hangupsbot.lanes import overflow_policies
+
+
+logger = logging.getLogger(__name__)
+
+# Options which must be lists if they are set
+list_options = ['admins', 'autoreplies', 'commands_admin', 'commands_aliases', 'forward_to']
+
+
+def validate_config(config):
+    """Raise ValueError if config doesn't have valid structure"""
+    if not isinstance(config, dict):
+        raise ValueError('Config must be JSON object')
+
+    if config.get('event_overflow_policy', 'drop_oldest') not in overflow_policies:
+        raise ValueError('"event_overflow_policy" must be one of {}'.format(', '.join(overflow_policies)))
+
+    conversations = config.get('conversations', {})
+    if not isinstance(conversations, dict):
+        raise ValueError('"conversations" must be JSON object')
+
+    for path, options in [([], config)] + [(['conversations', c], o) for c, o in conversations.items()]:
+        if not isinstance(options, dict):
+            raise ValueError('"{}" must be JSON object'.format('.'.join(path)))
+        for option in list_options:
+            value = options.get(option)
+            if value is not None and not isinstance(value, list):
+                raise ValueError('"{}" must be list'.format('.'.join(path + [option])))
+        if not all(isinstance(admin, str) for admin in options.get('admins') or []):
+            raise ValueError('"{}" must be list of user IDs (strings)'.format('.'.join(path + ['admins'])))
+        admin_groups = options.get('admin_groups')
+        if admin_groups is not None and (not isinstance(admin_groups, dict) or
+                                         not all(isinstance(g, list) for g in admin_groups.values())):
+            raise ValueError('"{}" must be JSON object of lists'.format('.'.join(path + ['admin_groups'])))
+        for autoreply in options.get('autoreplies') or []:
+            if (not isinstance(autoreply, list) or len(autoreply) != 2 or
+                    not isinstance(autoreply[0], list) or not isinstance(autoreply[1], str)):
+                raise ValueError('"{}" must be list of [[keywords], sentence] pairs'.format(
+                    '.'.join(path + ['autoreplies'])))
+
+
+def diff_config(old, new):
+    """Return set of changed global options and set of IDs of conversations with changed options"""
+    missing = object()
+    changed_options = {k for k in set(old) | set(new)
+                       if k != 'conversations' and old.get(k, missing) != new.get(k, missing)}
+    old_convs = old.get('conversations') or {}
+    new_convs = new.get('conversations') or {}
+    changed_convs = {c for c in set(old_convs) | set(new_convs)
+                     if old_convs.get(c, missing) != new_convs.get(c, missing)}
+    return changed_options, changed_convs
+
+
+def read_file(filename):
+    """Read whole file"""
+    with open(filename, 'rb') as f:
+        return f.read()
 
 
 class Config(collections.MutableMapping):
     """Configuration JSON storage class"""
-    def __init__(self, filename, default=None):
+    def __init__(self, filename, default=None, save_delay=1.0):
         self.filename = filename
         self.default = None
         self.config = {}
-        self.changed = False
+        self.changed_paths = set()    # paths (tuples of keys) changed since last save
+        self.save_delay = save_delay  # changes made within this time are saved at once
+        self._save_handle = None
+        self._save_lock = asyncio.Lock()
+        self._digest = None           # SHA-1 of config file as it was last loaded or saved
+        self._global_options = None   # options shared by conversations without own settings
+        self._conv_options = {}       # conv_id -> resolved options
+        self._conv_cache = {}         # conv_id -> {key: value derived from options}
         self.load()
 
     def load(self):
         """Load config from file"""
         try:
-            self.config = json.load(open(self.filename))
+            data = read_file(self.filename)
         except IOError:
             self.config = {}
+            self.changed = False
+            self.invalidate()
+            return
+        self.replace(json.loads(data.decode('utf-8')), hashlib.sha1(data).hexdigest())
+
+    @asyncio.coroutine
+    def reload(self, force=False):
+        """Reload config from file if it has changed (file is read and parsed outside of event loop)
+
+           Only conversations affected by changes are invalidated."""
+        start = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        try:
+            data = yield from loop.run_in_executor(None, read_file, self.filename)
+            digest = hashlib.sha1(data).hexdigest()
+            if digest == self._digest and not force:
+                return None
+            config = yield from loop.run_in_executor(None, json.loads, data.decode('utf-8'))
+            changes = self.replace(config, digest)
+        except (IOError, ValueError) as e:
+            logger.error('Failed to reload config {}: {}'.format(self.filename, e))
+            raise
+
+        logger.info('Config reloaded in {:.3f} s ({} global options and {} conversations changed)'.format(
+            time.perf_counter() - start, len(changes[0]), len(changes[1])))
+        return changes
+
+    def replace(self, config, digest=None):
+        """Replace config with new one and return set of changed global options
+           and set of IDs of conversations with changed options
+
+           Raises ValueError if config has unsaved changes (they would be lost)."""
+        validate_config(config)
+        if self.changed:
+            paths = sorted('.'.join(map(str, path)) or '(whole config)' for path in self.changed_paths)
+            raise ValueError('Config has unsaved changes of {} (they will overwrite config file)'.format(
+                ', '.join(paths)))
+
+        changed_options, changed_convs = diff_config(self.config, config)
+        self.config = config
+        self._digest = digest
         self.changed = False
 
+        # Global options are part of options of all conversations
+        if changed_options:
+            self.invalidate()
+        else:
+            for conv_id in changed_convs:
+                self.invalidate(conv_id)
+        return changed_options, changed_convs
+
     def loads(self, json_str):
         """Load config from JSON string"""
         self.config = json.loads(json_str)
         self.changed = True
+        self.invalidate()
+
+    @property
+    def changed(self):
+        """True if config has changed since last save"""
+        return bool(self.changed_paths)
+
+    @changed.setter
+    def changed(self, value):
+        if value:
+            self.changed_paths.add(())
+        else:
+            self.changed_paths.clear()
+            if self._save_handle:
+                self._save_handle.cancel()
+                self._save_handle = None
+
+    def dumps(self):
+        """Serialize config to JSON string"""
+        return json.dumps(self.config, indent=2, sort_keys=True)
 
     def save(self):
-        """Save config to file (only if config has changed)"""
+        """Save config to file (only if config has changed)
+
+           Saving is delayed, so successive changes are written to file at once."""
+        if not self.changed:
+            return
+
+        loop = asyncio.get_event_loop()
+        if not loop.is_running():
+            self.save_now()
+            return
+
+        if self._save_handle:
+            self._save_handle.cancel()
+        self._save_handle = loop.call_later(
+            self.save_delay, lambda: asyncio.async(self.flush())
+        )
+
+    def save_now(self):
+        """Save config to file immediately (blocks until config is written)"""
         if self.changed:
-            with open(self.filename, 'w') as f:
-                json.dump(self.config, f, indent=2, sort_keys=True)
-                self.changed = False
+            data = self.dumps().encode()
+            atomic_write(self.filename, data)
+            self._digest = hashlib.sha1(data).hexdigest()
+            self.changed = False
+
+    @asyncio.coroutine
+    def flush(self):
+        """Save config to file now if it has changed (file is written outside of event loop)"""
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        yield from self._save_lock.acquire()
+        try:
+            if not self.changed:
+                return
+            data = self.dumps().encode()
+            changed_paths = self.changed_paths
+            self.changed_paths = set()
+
+            loop = asyncio.get_event_loop()
+            try:
+                yield from loop.run_in_executor(None, atomic_write, self.filename, data)
+            except OSError as e:
+                # Keep changes for next try
+                self.changed_paths |= changed_paths
+                logger.error('Failed to save config {}: {}'.format(self.filename, e))
+            else:
+                self._digest = hashlib.sha1(data).hexdigest()
+                logger.debug('Config saved ({} changed paths)'.format(len(changed_paths)))
+        finally:
+            self._save_lock.release()
 
     def get_by_path(self, keys_list):
         """Get item from config by path (list of keys)"""
@@ -37,6 +219,61 @@ class Config(collections.MutableMapping):
     def set_by_path(self, keys_list, value):
         """Set item in config by path (list of keys)"""
         self.get_by_path(keys_list[:-1])[keys_list[-1]] = value
+        self.changed_paths.add(tuple(keys_list))
+        if len(keys_list) >= 2 and keys_list[0] == 'conversations':
+            self.invalidate(keys_list[1])
+        else:
+            self.invalidate()
+
+    def invalidate(self, conv_id=None):
+        """Drop resolved options of conversation (or of all conversations if conv_id is None)
+
+           Must be called after nested values are changed in place (without set_by_path)."""
+        if conv_id is None:
+            self._global_options = None
+            self._conv_options.clear()
+            self._conv_cache.clear()
+        else:
+            self._conv_options.pop(conv_id, None)
+            self._conv_cache.pop(conv_id, None)
+
+    def get_conv_options(self, conv_id):
+        """Get options for conversation resolved against global options (built once and cached)"""
+        try:
+            return self._conv_options[conv_id]
+        except KeyError:
+            pass
+
+        if self._global_options is None:
+            self._global_options = dict(self.config)
+
+        conversations = self.config.get('conversations')
+        conv_config = conversations.get(conv_id) if isinstance(conversations, dict) else None
+        if conv_config:
+            options = dict(self._global_options)
+            options.update(conv_config)
+        else:
+            options = self._global_options
+
+        self._conv_options[conv_id] = options
+        return options
+
+    def get_suboption(self, conv_id, option):
+        """Get config suboption for conversation (or global option if not defined)"""
+        return self.get_conv_options(conv_id).get(option)
+
+    def memoize(self, conv_id, key, func):
+        """Get value derived from conversation options (computed by func only after config change)"""
+        cache = self._conv_cache.setdefault(conv_id, {})
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = func()
+            return value
+
+    def get(self, key, default=None):
+        """Get global option (or default if option isn't set)"""
+        return self.config.get(key, default)
 
     def __getitem__(self, key):
         try:
@@ -46,11 +283,13 @@ class Config(collections.MutableMapping):
 
     def __setitem__(self, key, value):
         self.config[key] = value
-        self.changed = True
+        self.changed_paths.add((key,))
+        self.invalidate()
 
     def __delitem__(self, key):
         del self.config[key]
-        self.changed = True
+        self.changed_paths.add((key,))
+        self.invalidate()
 
     def __iter__(self):
         return iter(self.config)
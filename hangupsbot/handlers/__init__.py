@@ -1,8 +1,13 @@
-import os, glob, logging, itertools, asyncio
+import os, time, bisect, logging, importlib, itertools, asyncio
 
 import hangups
 from hangups.ui.utils import get_conv_name
 
+from hangupsbot.plugins import PluginManifest
+
+
+logger = logging.getLogger(__name__)
+
 
 class StopEventHandling(Exception):
     """Raise to stop handling of current event by other handlers"""
@@ -36,15 +41,23 @@ class EventHandler:
     def __init__(self):
         self.handlers = []
         self.counter = itertools.count()
-
-    def register(self, *args, priority=10, event=None):
+        self.index = {}       # event type -> tuple of matching handlers (in order of priority)
+        self.timeouts = {}    # handler function -> timeout set by plugin (in seconds)
+        self.stats = {}       # handler function -> [number of calls, cumulative time, failures, timeouts]
+        self.on_handled = []  # hooks called as hook(bot, func, elapsed_time, exception) after every handler
+        self.wrap_coroutine = None  # function called as wrap_coroutine(name, coro) (used by profiler)
+        self.pending = {}     # plugin module which hasn't been imported yet -> names of handled event types
+
+    def register(self, *args, priority=10, event=None, timeout=None):
         """Decorator for registering event handler"""
         def wrapper(func):
             # Automatically wrap handler function in coroutine
             func = asyncio.coroutine(func)
+            if timeout is not None:
+                self.timeouts[func] = timeout
             entry = (priority, next(self.counter), func, event)
-            self.handlers.append(entry)
-            self.handlers.sort()
+            bisect.insort(self.handlers, entry)
+            self.index.clear()
             return func
 
         # If there is one (and only one) positional argument and this argument is callable,
@@ -54,6 +67,84 @@ class EventHandler:
         else:
             return wrapper
 
+    def add_plugins(self, manifest):
+        """Import plugins only when first event of type they handle arrives
+           (plugins which can't be scanned are imported immediately)"""
+        for module, registered in sorted(manifest.modules.items()):
+            if registered is None:
+                importlib.import_module(module)
+            elif registered:
+                self.pending[module] = {kwds.get('event') for name, kwds in registered}
+        self.index.clear()
+
+    def disable_plugins(self, plugins):
+        """Never import plugins from list (e.g. ["handlers.rename"])"""
+        for module in list(self.pending):
+            if module.split('.', 1)[-1] in plugins:
+                del self.pending[module]
+                self.index.clear()
+
+    def load_plugins(self, event_type):
+        """Import plugins which handle event type"""
+        names = {cls.__name__ for cls in event_type.__mro__}
+        for module, event_names in sorted(self.pending.items()):
+            if None in event_names or event_names & names:
+                del self.pending[module]
+                try:
+                    importlib.import_module(module)
+                except Exception as e:
+                    logger.exception('Failed to load plugin {}: {}'.format(module, e))
+
+    def get_handlers(self, event_type):
+        """Get handlers for event type (including handlers registered for its base classes)"""
+        try:
+            return self.index[event_type]
+        except KeyError:
+            if self.pending:
+                self.load_plugins(event_type)
+            handlers = tuple(entry for entry in self.handlers
+                             if entry[3] is None or issubclass(event_type, entry[3]))
+            self.index[event_type] = handlers
+            return handlers
+
+    def get_timeout(self, bot, func):
+        """Get timeout of handler (set in config.json or by plugin, None means no timeout)"""
+        timeouts = bot.config.get('handler_timeouts') or {}
+        if func.__name__ in timeouts:
+            return timeouts[func.__name__] or None
+        if func in self.timeouts:
+            return self.timeouts[func] or None
+        return bot.config.get('handler_timeout', 60) or None
+
+    def get_stats(self):
+        """Get number of calls, cumulative time, failures and timeouts for every handler"""
+        return {'{}.{}'.format(func.__module__, func.__name__): tuple(stats)
+                for func, stats in self.stats.items()}
+
+    def _on_handled(self, bot, func, elapsed, exception=None):
+        """Update handler statistics and run hooks"""
+        try:
+            stats = self.stats[func]
+        except KeyError:
+            stats = self.stats[func] = [0, 0.0, 0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if isinstance(exception, asyncio.CancelledError):
+            logger.debug('handler={} duration={:.3f} status=cancelled'.format(func.__name__, elapsed))
+        elif isinstance(exception, asyncio.TimeoutError):
+            stats[3] += 1
+            logger.warning('handler={} duration={:.3f} status=timeout'.format(func.__name__, elapsed))
+        elif exception is not None:
+            stats[2] += 1
+            logger.error('handler={} duration={:.3f} status=failed error={!r}'.format(
+                func.__name__, elapsed, exception),
+                exc_info=(type(exception), exception, exception.__traceback__))
+        else:
+            logger.debug('handler={} duration={:.3f} status=ok'.format(func.__name__, elapsed))
+
+        for hook in self.on_handled:
+            hook(bot, func, elapsed, exception)
+
     @asyncio.coroutine
     def handle(self, bot, event):
         """Handle event"""
@@ -65,24 +156,35 @@ class EventHandler:
         if wrapped_event.user.is_self:
             return
 
-        # Run all event handlers
-        for prio, i, func, event_type in self.handlers:
-            if event_type is None or isinstance(event, event_type):
-                try:
-                    yield from func(bot, wrapped_event)
-                except StopEventHandling:
-                    break
-                except Exception as e:
-                    print(e)
+        # Run all event handlers (handler which doesn't finish in time is cancelled)
+        for prio, i, func, event_type in self.get_handlers(type(event)):
+            # Plugins are shared by all bots, but every bot can disable some of them
+            if bot.is_plugin_disabled(func.__module__):
+                continue
+            start = time.perf_counter()
+            exception = None
+            try:
+                coro = func(bot, wrapped_event)
+                if self.wrap_coroutine:
+                    coro = self.wrap_coroutine('handler:{}'.format(func.__name__), coro)
+                timeout = self.get_timeout(bot, func)
+                if timeout:
+                    yield from asyncio.wait_for(coro, timeout)
+                else:
+                    yield from coro
+            except StopEventHandling:
+                break
+            except asyncio.CancelledError as e:
+                exception = e
+                raise
+            except Exception as e:
+                exception = e
+            finally:
+                self._on_handled(bot, func, time.perf_counter() - start, exception)
 
 
 # Create EventHandler singleton
 handler = EventHandler()
 
-# Build list of handlers
-_plugins = glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))
-__all__ = [os.path.splitext(os.path.basename(f))[0] for f in _plugins
-           if os.path.isfile(f) and not os.path.basename(f).startswith("_")]
-
-# Load all handlers
-from hangupsbot.handlers import *
+# Find handlers in plugins (they are imported on first event of type they handle)
+handler.add_plugins(PluginManifest(__name__, os.path.dirname(__file__), 'handler'))
@@ -1,11 +1,16 @@
-import re
+import re, asyncio, logging
 
 import hangups
 
-from hangupsbot.utils import word_in_text, text_to_segments
+from hangupsbot.utils import unicode_to_ascii, word_in_text, text_to_words
+from hangupsbot.cache import get_compiled
+from hangupsbot.offload import rules_versions, text_digest
 from hangupsbot.handlers import handler
 
 
+logger = logging.getLogger(__name__)
+
+
 def find_keyword(kw, text):
     """Return True if keyword is in text"""
     if kw == "*":
@@ -18,6 +23,77 @@ def find_keyword(kw, text):
         return False
 
 
+class AutoreplyMatcher:
+    """Match text against all keywords of autoreplies list at once
+
+       Gives the same results as calling find_keyword for every keyword,
+       but text is normalized only once and plain words are looked up in index."""
+    def __init__(self, autoreplies_list):
+        self.sentences = []
+        self.match_all = set()   # indexes of autoreplies with "*" keyword
+        self.words = {}          # normalized word -> set of autoreply indexes
+        self.regexes = []        # (autoreply index, compiled regex)
+        self.version = next(rules_versions)
+
+        for i, (kwds, sentence) in enumerate(autoreplies_list):
+            self.sentences.append(sentence)
+            for kw in kwds:
+                if kw == "*":
+                    self.match_all.add(i)
+                elif kw.lower().startswith("regex:"):
+                    try:
+                        self.regexes.append((i, re.compile(kw[6:], re.DOTALL | re.IGNORECASE)))
+                    except re.error as e:
+                        logger.warning('Invalid autoreply regex {!r}: {}'.format(kw[6:], e))
+                else:
+                    self.words.setdefault(unicode_to_ascii(kw).lower(), set()).add(i)
+
+    def match(self, text):
+        """Return list of autoreply sentences matching text (in order of autoreplies list)"""
+        matched = self._match_words(text_to_words(text) if self.words else [])
+
+        for i, regex in self.regexes:
+            if i not in matched and regex.search(text):
+                matched.add(i)
+
+        return [self.sentences[i] for i in sorted(matched)]
+
+    @asyncio.coroutine
+    def match_offloaded(self, text, offloader):
+        """Same as match, but long texts and regexes are processed in process pool of offloader"""
+        digest = text_digest(text)
+        matched = offloader.get_cached('autoreplies', self.version, digest)
+        if matched is None:
+            complete = True
+            words = (yield from offloader.process_text(text_to_words, text)) if self.words else []
+            if words is None:
+                words, complete = [], False
+            matched = self._match_words(words)
+
+            regexes = [(i, regex) for i, regex in self.regexes if i not in matched]
+            found = yield from asyncio.gather(*[offloader.search(regex, text) for i, regex in regexes])
+            for (i, regex), result in zip(regexes, found):
+                if result:
+                    matched.add(i)
+                elif result is None:
+                    complete = False
+
+            # Results of failed or disabled searches are not cached
+            if complete:
+                offloader.set_cached('autoreplies', self.version, digest, matched)
+
+        return [self.sentences[i] for i in sorted(matched)]
+
+    def _match_words(self, words):
+        """Get set of indexes of autoreplies matching words (or matching everything)"""
+        matched = set(self.match_all)
+        for word in words:
+            indexes = self.words.get(word)
+            if indexes:
+                matched.update(indexes)
+        return matched
+
+
 @handler.register(priority=7, event=hangups.ChatMessageEvent)
 def handle_autoreply(bot, event):
     """Handle autoreplies to keywords in messages"""
@@ -34,8 +110,13 @@ def handle_autoreply(bot, event):
     if not autoreplies_list:
         return
 
-    for kwds, sentence in autoreplies_list:
-        for kw in kwds:
-            if find_keyword(kw, event.text):
-                yield from event.conv.send_message(text_to_segments(sentence))
-                break
+    # Autoreplies are compiled only once (until config is changed) and
+    # conversations (or bots) with the same autoreplies share one matcher
+    matcher = bot.config.memoize(event.conv_id, 'autoreplies',
+                                 lambda: get_compiled(AutoreplyMatcher, autoreplies_list))
+    if bot.offloader:
+        sentences = yield from matcher.match_offloaded(event.text, bot.offloader)
+    else:
+        sentences = matcher.match(event.text)
+    for sentence in sentences:
+        yield from bot.send_message(event.conv, sentence)
@@ -1,14 +1,22 @@
-import re, shlex
+import re, asyncio, logging
 
 import hangups
 
-from hangupsbot.utils import text_to_segments
+from hangupsbot.utils import split_args
+from hangupsbot.cache import get_compiled
+from hangupsbot.offload import rules_versions, text_digest
+from hangupsbot.permissions import is_admin
 from hangupsbot.handlers import handler, StopEventHandling
 from hangupsbot.commands import command
 
 
+logger = logging.getLogger(__name__)
+
 default_bot_alias = '/bot'
 
+# Backreferences or inline flags can't be used in combined regex
+_uncombinable_regex = re.compile(r'\\\d|\(\?P=|\(\?[aiLmsux]+\)')
+
 
 def find_bot_alias(aliases_list, text):
     """Return True if text starts with bot alias"""
@@ -21,6 +29,79 @@ def find_bot_alias(aliases_list, text):
     return False
 
 
+class AliasMatcher:
+    """Test if text starts with one of bot aliases (same as find_bot_alias, but faster)
+
+       Text which can't start with any plain alias is rejected by its first character
+       (if there are no regex aliases), regex aliases are combined into one regex."""
+    def __init__(self, aliases_list):
+        self.aliases = set()
+        patterns = []
+        for alias in aliases_list:
+            if alias.lower().startswith('regex:'):
+                patterns.append(alias[6:])
+            else:
+                self.aliases.add(alias.lower())
+        self.first_chars = {alias[0] for alias in self.aliases if alias}
+        self.version = next(rules_versions)
+
+        self.regexes = []
+        if patterns and not any(_uncombinable_regex.search(p) for p in patterns):
+            try:
+                self.regexes = [re.compile('|'.join('(?:{})'.format(p) for p in patterns), re.IGNORECASE)]
+            except re.error:
+                pass
+        if patterns and not self.regexes:
+            for pattern in patterns:
+                try:
+                    self.regexes.append(re.compile(pattern, re.IGNORECASE))
+                except re.error as e:
+                    logger.warning('Invalid bot alias regex {!r}: {}'.format(pattern, e))
+
+    def match(self, text):
+        """Return True if text starts with bot alias"""
+        if not self.regexes and text[0].lower()[0] not in self.first_chars:
+            return False
+        command = text.split(None, 1)[0].lower()
+        if command in self.aliases:
+            return True
+        for regex in self.regexes:
+            if regex.search(command):
+                return True
+        return False
+
+    def match_plain(self, text):
+        """Return True if text starts with plain (not regex) bot alias"""
+        return text.split(None, 1)[0].lower() in self.aliases
+
+    @asyncio.coroutine
+    def match_offloaded(self, text, offloader):
+        """Same as match, but regexes are searched in process pool of offloader"""
+        if self.match_plain(text):
+            return True
+        if not self.regexes:
+            return False
+
+        command = text.split(None, 1)[0].lower()
+        digest = text_digest(command)
+        matched = offloader.get_cached('aliases', self.version, digest)
+        if matched is None:
+            found = yield from asyncio.gather(*[offloader.search(regex, command) for regex in self.regexes])
+            matched = any(found)
+            # Results of failed or disabled searches are not cached
+            if matched or None not in found:
+                offloader.set_cached('aliases', self.version, digest, matched)
+        return matched
+
+
+def get_alias_matcher(bot, conv_id):
+    """Get bot alias matcher for conversation (compiled only once until config is changed)"""
+    def build():
+        aliases_list = bot.get_config_suboption(conv_id, 'commands_aliases')
+        return get_compiled(AliasMatcher, aliases_list or [default_bot_alias])
+    return bot.config.memoize(conv_id, 'commands_aliases', build)
+
+
 @handler.register(priority=5, event=hangups.ChatMessageEvent)
 def handle_command(bot, event):
     """Handle command messages"""
@@ -28,13 +109,13 @@ def handle_command(bot, event):
     if not event.text:
         return
 
-    # Get list of bot aliases
-    aliases_list = bot.get_config_suboption(event.conv_id, 'commands_aliases')
-    if not aliases_list:
-        aliases_list = [default_bot_alias]
-
     # Test if message starts with bot alias
-    if not find_bot_alias(aliases_list, event.text):
+    matcher = get_alias_matcher(bot, event.conv_id)
+    if bot.offloader:
+        is_command = yield from matcher.match_offloaded(event.text, bot.offloader)
+    else:
+        is_command = matcher.match(event.text)
+    if not is_command:
         return
 
     # Test if command handling is enabled
@@ -42,22 +123,20 @@ def handle_command(bot, event):
         raise StopEventHandling
 
     # Parse message
-    line_args = shlex.split(event.text, posix=False)
+    line_args = split_args(event.text)
 
     # Test if command length is sufficient
     if len(line_args) < 2:
-        yield from event.conv.send_message(
-            text_to_segments(_('{}: How may I serve you?').format(event.user.full_name))
+        yield from bot.send_message(
+            event.conv, _('{}: How may I serve you?').format(event.user.full_name)
         )
         raise StopEventHandling
 
     # Test if user has permissions for running command
-    commands_admin_list = command.get_admin_commands(bot, event.conv_id)
-    if commands_admin_list and line_args[1].lower() in commands_admin_list:
-        admins_list = bot.get_config_suboption(event.conv_id, 'admins')
-        if event.user_id.chat_id not in admins_list:
-            yield from event.conv.send_message(
-                text_to_segments(_('{}: I\'m sorry, Dave. I\'m afraid I can\'t do that.').format(event.user.full_name))
+    if line_args[1].lower() in command.get_admin_commands(bot, event.conv_id):
+        if not is_admin(bot, event.conv_id, event.user_id.chat_id):
+            yield from bot.send_message(
+                event.conv, _('{}: I\'m sorry, Dave. I\'m afraid I can\'t do that.').format(event.user.full_name)
             )
             raise StopEventHandling
 
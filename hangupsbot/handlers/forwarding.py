@@ -1,9 +1,32 @@
+import logging, asyncio
+
 import hangups
+from hangups.ui.utils import get_conv_name
 
 from hangupsbot.utils import text_to_segments
 from hangupsbot.handlers import handler
 
 
+logger = logging.getLogger(__name__)
+
+default_forwarding_concurrency = 5
+
+
+@asyncio.coroutine
+def forward_message(bot, conv, segments, image_id_list, semaphore):
+    """Forward message to one destination (text is always sent before images)"""
+    yield from semaphore.acquire()
+    try:
+        # Send text message first (without attachments)
+        yield from bot.send_message_segments(conv, segments)
+
+        # If there are attachments, send them separately
+        for image_id in image_id_list:
+            yield from bot.send_message_segments(conv, [], image_id=image_id)
+    finally:
+        semaphore.release()
+
+
 @handler.register(priority=7, event=hangups.ChatMessageEvent)
 def handle_forward(bot, event):
     """Handle message forwarding"""
@@ -20,26 +43,35 @@ def handle_forward(bot, event):
     if not forward_to_list:
         return
 
-    # Prepare attachments
-    image_id_list = yield from bot.upload_images(event.conv_event.attachments)
-
-    # Forward message to all destinations
+    destinations = []
     for dst in forward_to_list:
         try:
-            conv = bot._conv_list.get(dst)
+            destinations.append(bot._conv_list.get(dst))
         except KeyError:
             continue
+    if not destinations:
+        return
+
+    # Prepare attachments
+    image_id_list = yield from bot.upload_images(event.conv_event.attachments)
 
-        # Prepend forwarded message with name of sender
-        link = 'https://plus.google.com/u/0/{}/about'.format(event.user_id.chat_id)
-        segments = text_to_segments('**[{}]({}):** '.format(event.user.full_name, link))
+    # Prepend forwarded message with name of sender
+    link = 'https://plus.google.com/u/0/{}/about'.format(event.user_id.chat_id)
+    segments = text_to_segments('**[{}]({}):** '.format(event.user.full_name, link))
 
-        # Copy original message segments
-        segments.extend(event.conv_event.segments)
+    # Copy original message segments
+    segments.extend(event.conv_event.segments)
 
-        # Send text message first (without attachments)
-        yield from conv.send_message(segments)
+    # Forward message to all destinations concurrently (failure of one doesn't affect others)
+    concurrency = (bot.get_config_suboption(event.conv_id, 'forwarding_concurrency') or
+                   default_forwarding_concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = yield from asyncio.gather(
+        *[forward_message(bot, conv, segments, image_id_list, semaphore) for conv in destinations],
+        return_exceptions=True
+    )
 
-        # If there are attachments, send them separately
-        for image_id in image_id_list:
-            yield from conv.send_message([], image_id=image_id)
+    for conv, result in zip(destinations, results):
+        if isinstance(result, Exception):
+            print(_('Failed to forward message to {}: {}').format(get_conv_name(conv, truncate=True), result))
+            logger.warning('Failed to forward message from {} to {}: {!r}'.format(event.conv_id, conv.id_, result))
@@ -1,7 +1,7 @@
 import hangups
 
-from hangupsbot.utils import text_to_segments
 from hangupsbot.handlers import handler
+from hangupsbot.permissions import is_admin
 
 
 @handler.register(priority=5, event=hangups.MembershipChangeEvent)
@@ -19,10 +19,9 @@ def handle_membership_change(bot, event):
     # JOIN
     if event.conv_event.type_ == hangups.MEMBERSHIP_CHANGE_TYPE_JOIN:
         # Test if user who added new participants is admin
-        admins_list = bot.get_config_suboption(event.conv_id, 'admins')
-        if event.user_id.chat_id in admins_list:
-            yield from event.conv.send_message(
-                text_to_segments(_('{}: Welcome!').format(names))
+        if is_admin(bot, event.conv_id, event.user_id.chat_id):
+            yield from bot.send_message(
+                event.conv, _('{}: Welcome!').format(names)
             )
         else:
             text = _(
@@ -0,0 +1,104 @@
+import os, hashlib, logging, asyncio, tempfile
+
+import hangups
+
+from hangupsbot.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageUploader:
+    """Download images and upload them to Google+ (already uploaded images are cached)
+
+       fetch is coroutine fetch(link, image_file) writing image data to file,
+       upload is coroutine upload(image_file, filename) returning image_id,
+       download_cache is optional LRUCache of SHA-1 of downloaded images (it can be shared by more bots).
+       Images are spooled to temporary files, so they are never kept in memory as a whole."""
+    def __init__(self, fetch, upload, concurrency=4, cache_size=256, cache_ttl=3600, download_cache=None):
+        self.fetch = fetch
+        self.upload = upload
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.url_cache = LRUCache(cache_size, cache_ttl)    # link -> image_id
+        self.hash_cache = LRUCache(cache_size, cache_ttl)   # SHA-1 of image data -> image_id
+        self.download_cache = download_cache                # link -> SHA-1 of image data
+        self._pending = {}                                  # link -> task of running upload
+
+    def configure(self, concurrency, cache_size, cache_ttl):
+        """Change number of images processed at once and size and TTL of caches of uploaded images"""
+        if concurrency != self.concurrency:
+            self.concurrency = concurrency
+            self.semaphore = asyncio.Semaphore(concurrency)
+        for cache in (self.url_cache, self.hash_cache):
+            cache.maxsize, cache.ttl = cache_size, cache_ttl
+
+    @asyncio.coroutine
+    def upload_image(self, link):
+        """Download image and upload it to Google+ (returns image_id or None on failure)"""
+        image_id = self.url_cache.get(link)
+        if image_id is not None:
+            return image_id
+
+        # Share running upload between all callers asking for same link
+        try:
+            task = self._pending[link]
+        except KeyError:
+            task = self._pending[link] = asyncio.async(self._upload_image(link))
+            task.add_done_callback(lambda future: self._pending.pop(link, None))
+        return (yield from asyncio.shield(task))
+
+    @asyncio.coroutine
+    def upload_images(self, links):
+        """Download images and upload them to Google+ concurrently (returns list of image_ids)"""
+        image_id_list = yield from asyncio.gather(*[self.upload_image(link) for link in links])
+        return [image_id for image_id in image_id_list if image_id is not None]
+
+    @asyncio.coroutine
+    def _upload_image(self, link):
+        """Download and upload image (limited number of images is processed at once)"""
+        # Semaphore is replaced when concurrency is changed
+        semaphore = self.semaphore
+        yield from semaphore.acquire()
+        try:
+            # Image downloaded by other bot is downloaded again only if this bot hasn't uploaded it
+            digest = self.download_cache.get(link) if self.download_cache is not None else None
+            image_id = self.hash_cache.get(digest) if digest is not None else None
+            if image_id is None:
+                with tempfile.TemporaryFile() as image_file:
+                    try:
+                        yield from self.fetch(link, image_file)
+                    except hangups.NetworkError as e:
+                        print('Failed to download image: {}'.format(e))
+                        return None
+                    digest = file_digest(image_file)
+                    if self.download_cache is not None:
+                        self.download_cache.set(link, digest)
+
+                    # Upload image only if the same image hasn't been uploaded already
+                    image_id = self.hash_cache.get(digest)
+                    if image_id is None:
+                        image_file.seek(0)
+                        try:
+                            image_id = yield from self.upload(image_file, filename=os.path.basename(link))
+                        except hangups.NetworkError as e:
+                            print('Failed to upload image: {}'.format(e))
+                            return None
+                        self.hash_cache.set(digest, image_id)
+                        self.url_cache.set(link, image_id)
+                        return image_id
+            logger.debug('Image {} already uploaded as {}'.format(link, image_id))
+        finally:
+            semaphore.release()
+
+        self.url_cache.set(link, image_id)
+        return image_id
+
+
+def file_digest(f, chunk_size=65536):
+    """Get SHA-1 of data in file (it is read in chunks from beginning)"""
+    sha1 = hashlib.sha1()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        sha1.update(chunk)
+    return sha1.hexdigest()
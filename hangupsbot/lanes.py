@@ -0,0 +1,165 @@
+import time, logging, asyncio, collections
+
+
+logger = logging.getLogger(__name__)
+
+# What to do with new event when queue of conversation is full
+overflow_policies = ['drop_oldest', 'block', 'shed']
+
+
+class EventLanes:
+    """Process events in order within conversation and concurrently across conversations
+
+       Every conversation has its own bounded queue (lane) with one worker. When lane is full,
+       overflow policy decides what happens with new event:
+
+       drop_oldest - oldest waiting event is dropped
+       block - submitting waits until there is free space in lane
+       shed - events which are not commands (as decided by is_priority) are dropped first"""
+    def __init__(self, handle, maxsize=100, policy='drop_oldest', is_priority=None):
+        self.handle = handle            # coroutine called as handle(item)
+        self.is_priority = is_priority  # function called as is_priority(item)
+        self.queues = {}                # lane_id -> deque of (timestamp, item)
+        self.workers = {}               # lane_id -> worker task
+        self.waiters = {}               # lane_id -> deque of futures blocked on full lane
+        self.stats = {}                 # lane_id -> Counter
+        self.set_limit(maxsize, policy)
+
+    def set_limit(self, maxsize, policy):
+        """Change size of queue of every lane and what to do with items when queue is full"""
+        if policy not in overflow_policies:
+            raise ValueError('Unknown overflow policy: {}'.format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+
+        # Blocked submits check new limit
+        for waiters in self.waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+        self.waiters.clear()
+
+    @asyncio.coroutine
+    def submit(self, lane_id, item):
+        """Queue item for processing in lane (returns False if item has been dropped)"""
+        queue = self.queues.setdefault(lane_id, collections.deque())
+        stats = self.stats.setdefault(lane_id, collections.Counter())
+
+        if self.maxsize and len(queue) >= self.maxsize:
+            if self.policy == 'block':
+                # Limit can be changed while submit is blocked
+                while self.policy == 'block' and self.maxsize and len(queue) >= self.maxsize:
+                    waiter = asyncio.Future()
+                    self.waiters.setdefault(lane_id, collections.deque()).append(waiter)
+                    stats['blocked'] += 1
+                    yield from waiter
+                    queue = self.queues.setdefault(lane_id, queue)
+            elif not self._make_room(lane_id, queue, item):
+                stats['dropped'] += 1
+                return False
+
+        queue.append((time.monotonic(), item))
+        stats['queued'] += 1
+        stats['queue_max'] = max(stats['queue_max'], len(queue))
+
+        if lane_id not in self.workers:
+            self.workers[lane_id] = asyncio.async(self._worker(lane_id))
+        return True
+
+    def _make_room(self, lane_id, queue, item):
+        """Drop one waiting event from full lane (returns False if new item should be dropped instead)"""
+        if self.policy == 'shed' and self.is_priority:
+            if not self.is_priority(item):
+                return False
+            for i, (timestamp, waiting) in enumerate(queue):
+                if not self.is_priority(waiting):
+                    del queue[i]
+                    break
+            else:
+                queue.popleft()
+        else:
+            queue.popleft()
+
+        self.stats[lane_id]['dropped'] += 1
+        logger.warning('Event lane {} is full, dropped waiting event'.format(lane_id))
+        return True
+
+    def queue_depth(self, lane_id=None):
+        """Get number of events waiting in lane (or in all lanes)"""
+        if lane_id is not None:
+            return len(self.queues.get(lane_id, ()))
+        return sum(len(queue) for queue in self.queues.values())
+
+    def get_stats(self, lane_id=None):
+        """Get counters of queued, handled and dropped events and wait latency of lane (or of all lanes)"""
+        if lane_id is not None:
+            lanes = [self.stats.get(lane_id, collections.Counter())]
+        else:
+            lanes = self.stats.values()
+
+        stats = collections.Counter()
+        for lane_stats in lanes:
+            for key, value in lane_stats.items():
+                if key.endswith('_max'):
+                    stats[key] = max(stats[key], value)
+                else:
+                    stats[key] += value
+        stats = dict(stats)
+        stats['lanes'] = len(self.workers)
+        stats['queue_depth'] = self.queue_depth(lane_id)
+        if stats.get('handled'):
+            stats['latency_avg'] = stats['latency_total'] / stats['handled']
+        return stats
+
+    def _wake_waiter(self, lane_id):
+        """Let one blocked submit continue"""
+        waiters = self.waiters.get(lane_id)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+        if not waiters:
+            self.waiters.pop(lane_id, None)
+
+    @asyncio.coroutine
+    def _worker(self, lane_id):
+        """Process all events from lane"""
+        queue = self.queues[lane_id]
+        stats = self.stats[lane_id]
+        try:
+            while queue:
+                timestamp, item = queue.popleft()
+                self._wake_waiter(lane_id)
+
+                start = time.monotonic()
+                try:
+                    yield from self.handle(item)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.exception('Failed to handle event in lane {}: {}'.format(lane_id, e))
+
+                now = time.monotonic()
+                stats['handled'] += 1
+                stats['latency_total'] += start - timestamp
+                stats['latency_max'] = max(stats['latency_max'], start - timestamp)
+                stats['handle_time_total'] += now - start
+        finally:
+            del self.workers[lane_id]
+            del self.queues[lane_id]
+            # Blocked submits will create new lane
+            while lane_id in self.waiters:
+                self._wake_waiter(lane_id)
+
+    @asyncio.coroutine
+    def join(self):
+        """Wait until all lanes are empty"""
+        while self.workers:
+            yield from asyncio.wait(list(self.workers.values()))
+
+    def cancel(self):
+        """Cancel processing of all lanes (waiting events are dropped)"""
+        for worker in list(self.workers.values()):
+            worker.cancel()
@@ -0,0 +1,278 @@
+import time, bisect, logging, asyncio
+
+
+logger = logging.getLogger(__name__)
+
+inf = float('inf')
+
+# Default histogram buckets (in seconds)
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    """Format number for text exposition format"""
+    if value == inf:
+        return '+Inf'
+    if value == -inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(names, values, extra=()):
+    """Format label names and values as {name="value",...}"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                                              .replace('"', '\\"')
+                                                              .replace('\n', '\\n'))
+                          for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base class of metrics (values of metric with labels are stored by tuples of label values)"""
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def labels(self, *values):
+        """Get child metric for label values"""
+        values = tuple(str(v) for v in values)
+        try:
+            return self.values[values]
+        except KeyError:
+            if len(values) != len(self.label_names):
+                raise ValueError('Metric {} has labels {}'.format(self.name, self.label_names))
+            child = self.values[values] = self.create_child()
+            return child
+
+    def create_child(self):
+        """Create value of metric for one combination of label values"""
+        raise NotImplementedError
+
+    def expose(self):
+        """Get lines of text exposition format"""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.type)]
+        for values, child in sorted(self.values.items()):
+            lines.extend(child.expose(self.name, self.label_names, values))
+        return lines
+
+
+class Value:
+    """Value of counter or gauge"""
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Increase value"""
+        self.value += amount
+
+    def dec(self, amount=1):
+        """Decrease value"""
+        self.value -= amount
+
+    def set(self, value):
+        """Set value"""
+        self.value = value
+
+    def expose(self, name, label_names, label_values):
+        """Get lines of text exposition format"""
+        return ['{}{} {}'.format(name, format_labels(label_names, label_values), format_value(self.value))]
+
+
+class HistogramValue:
+    """Counts of observations in buckets"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Count observed value in its bucket"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def expose(self, name, label_names, label_values):
+        """Get lines of text exposition format (bucket counts are cumulative)"""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (inf,), self.counts):
+            total += count
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(label_names, label_values, [('le', format_value(bound))]), total))
+        labels = format_labels(label_names, label_values)
+        lines.append('{}_sum{} {}'.format(name, labels, format_value(self.sum)))
+        lines.append('{}_count{} {}'.format(name, labels, total))
+        return lines
+
+
+class Counter(Metric):
+    """Metric which only goes up"""
+    type = 'counter'
+
+    def create_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        """Increase value of counter without labels"""
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """Metric which can go up and down"""
+    type = 'gauge'
+
+    def create_child(self):
+        return Value()
+
+    def set(self, value):
+        """Set value of gauge without labels"""
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    """Metric counting observations in buckets"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=default_buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        """Observe value in histogram without labels"""
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """Collection of metrics
+
+       Collectors are functions called before metrics are exposed
+       (they can update gauges from statistics kept by other objects)."""
+    def __init__(self, prefix='hangupsbot_'):
+        self.prefix = prefix
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, cls, name, *args, **kwds):
+        name = self.prefix + name
+        try:
+            metric = self.metrics[name]
+        except KeyError:
+            metric = self.metrics[name] = cls(name, *args, **kwds)
+        if not isinstance(metric, cls):
+            raise ValueError('Metric {} is already registered as {}'.format(name, metric.type))
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        """Get counter (created on first use)"""
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        """Get gauge (created on first use)"""
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=default_buckets):
+        """Get histogram (created on first use)"""
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def expose(self):
+        """Get all metrics in text exposition format"""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.exception('Metrics collector failed: {}'.format(e))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serve metrics over HTTP in text exposition format (on /metrics)"""
+    def __init__(self, registry, host='127.0.0.1', port=9090):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    @asyncio.coroutine
+    def start(self):
+        """Start listening"""
+        self.server = yield from asyncio.start_server(self._handle_client, self.host, self.port)
+        logger.info('Serving metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+    def stop(self):
+        """Stop listening"""
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    @asyncio.coroutine
+    def _handle_client(self, reader, writer):
+        """Respond to HTTP request"""
+        try:
+            request_line = yield from asyncio.wait_for(reader.readline(), 10)
+            # Skip request headers
+            while True:
+                line = yield from asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] in ('GET', 'HEAD') and parts[1].split('?')[0] == '/metrics':
+                status = '200 OK'
+                body = self.registry.expose().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Not Found\n'
+
+            writer.write('HTTP/1.0 {}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         'Content-Length: {}\r\nConnection: close\r\n\r\n'.format(status, len(body)).encode())
+            if parts and parts[0] != 'HEAD':
+                writer.write(body)
+            yield from writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug('Metrics request failed: {!r}'.format(e))
+        finally:
+            writer.close()
+
+
+class LoopLagMonitor:
+    """Measure how late event loop wakes up sleeping coroutine"""
+    def __init__(self, histogram, gauge, interval=1.0):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self.task = None
+
+    def start(self):
+        """Start measuring"""
+        self.task = asyncio.async(self._run())
+
+    def stop(self):
+        """Stop measuring"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    @asyncio.coroutine
+    def _run(self):
+        """Sleep for interval and record how much longer sleeping took"""
+        while True:
+            start = time.monotonic()
+            yield from asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - start - self.interval, 0)
+            self.histogram.observe(lag)
+            self.gauge.set(lag)
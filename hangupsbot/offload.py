@@ -0,0 +1,176 @@
+import re, time, hashlib, logging, asyncio, itertools, collections
+
+from hangupsbot.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+# Versions of compiled rules (results of matching are cached by them)
+rules_versions = itertools.count(1)
+
+
+class OffloadError(Exception):
+    """Task in process pool timed out or failed"""
+
+
+class PoolTerminated(OffloadError):
+    """Process pool was terminated because other task timed out"""
+
+
+def search_regex(pattern, flags, text):
+    """Search text for regex and return (True if found, time of search) (runs in worker process)"""
+    start = time.perf_counter()
+    found = re.search(pattern, text, flags) is not None
+    return found, time.perf_counter() - start
+
+
+def text_digest(text):
+    """Get hash of message text"""
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+
+class Offloader:
+    """Run CPU heavy matching of messages in process pool, so it can't block event loop
+
+       Every task has timeout, pool with task which timed out is terminated (and started
+       again on next task). Regex which times out or searches longer than budget seconds
+       is counted as slow and disabled after max_strikes slow searches. Results of matching
+       are cached by version of rules and hash of message."""
+    def __init__(self, workers=2, timeout=1.0, min_length=1000, budget=0.1, max_strikes=3, cache_size=1024):
+        self.workers = workers
+        self.timeout = timeout
+        self.min_length = min_length  # shorter texts are transliterated in event loop
+        self.budget = budget
+        self.max_strikes = max_strikes
+        self.results = LRUCache(cache_size)  # (namespace, rules version, text digest) -> result
+        self.strikes = collections.Counter()  # (pattern, flags) -> number of slow searches
+        self.disabled = set()                 # (pattern, flags) of disabled regexes
+        self.stats = collections.Counter()
+        self._pool = None
+        self._pending = set()                 # futures waiting for results from current pool
+
+    def _get_pool(self):
+        """Get process pool (started on first use)"""
+        if self._pool is None:
+            # multiprocessing is imported only if offloading is really used
+            import multiprocessing
+            self._pool = multiprocessing.Pool(self.workers)
+            self._pending = set()
+        return self._pool
+
+    def _terminate(self):
+        """Terminate process pool with all running tasks"""
+        pool, pending = self._pool, self._pending
+        self._pool, self._pending = None, set()
+        for future in pending:
+            if not future.done():
+                future.set_exception(PoolTerminated('process pool terminated'))
+        if pool is not None:
+            asyncio.get_event_loop().run_in_executor(None, pool.terminate)
+
+    def resize(self, workers):
+        """Change number of worker processes (running pool is terminated and started again on next use)"""
+        if workers != self.workers:
+            self.workers = workers
+            self._terminate()
+
+    def close(self):
+        """Terminate process pool (it is started again if offloader is used later)"""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.terminate()
+
+    @asyncio.coroutine
+    def call(self, func, *args):
+        """Run func(*args) in process pool and return its result
+
+           Raises OffloadError if it doesn't finish within timeout or fails."""
+        loop = asyncio.get_event_loop()
+        future = asyncio.Future()
+
+        def set_result(result):
+            if not future.done():
+                future.set_result(result)
+
+        def set_exception(exception):
+            if not future.done():
+                future.set_exception(OffloadError(repr(exception)))
+
+        # Callbacks are called from result handler thread of pool
+        pool = self._get_pool()
+        self._pending.add(future)
+        self.stats['tasks'] += 1
+        pool.apply_async(func, args,
+                         callback=lambda result: loop.call_soon_threadsafe(set_result, result),
+                         error_callback=lambda e: loop.call_soon_threadsafe(set_exception, e))
+        try:
+            return (yield from asyncio.wait_for(future, self.timeout))
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            self._terminate()
+            raise OffloadError('timeout')
+        except PoolTerminated:
+            raise
+        except OffloadError:
+            self.stats['failures'] += 1
+            raise
+        finally:
+            self._pending.discard(future)
+
+    @asyncio.coroutine
+    def search(self, regex, text):
+        """Search text for compiled regex in process pool
+
+           Returns True or False, or None if regex is disabled or search failed."""
+        key = (regex.pattern, regex.flags)
+        if key in self.disabled:
+            return None
+
+        try:
+            found, elapsed = yield from self.call(search_regex, regex.pattern, regex.flags, text)
+        except PoolTerminated:
+            return None
+        except OffloadError as e:
+            self._strike(key, 'failed ({})'.format(e))
+            return None
+
+        if elapsed > self.budget:
+            self._strike(key, 'took {:.3f} s'.format(elapsed))
+        return found
+
+    def _strike(self, key, reason):
+        """Count slow search of regex and disable regex after too many of them"""
+        self.strikes[key] += 1
+        logger.warning('Slow regex {!r}: search {} ({} of {})'.format(
+            key[0], reason, self.strikes[key], self.max_strikes))
+        if self.strikes[key] >= self.max_strikes and key not in self.disabled:
+            self.disabled.add(key)
+            logger.warning('Regex {!r} disabled'.format(key[0]))
+
+    @asyncio.coroutine
+    def process_text(self, func, text):
+        """Call func(text) in process pool if text is long (returns None if it failed)"""
+        if len(text) < self.min_length:
+            return func(text)
+        try:
+            return (yield from self.call(func, text))
+        except OffloadError as e:
+            logger.warning('Failed to process message of {} characters: {}'.format(len(text), e))
+            return None
+
+    def get_cached(self, namespace, version, digest):
+        """Get cached result of matching (or None)"""
+        result = self.results.get((namespace, version, digest))
+        if result is not None:
+            self.stats['cache_hits'] += 1
+        return result
+
+    def set_cached(self, namespace, version, digest, result):
+        """Cache result of matching"""
+        self.results.set((namespace, version, digest), result)
+
+    def get_stats(self):
+        """Get counters of tasks, timeouts, failures and cache hits and number of disabled regexes"""
+        stats = dict(self.stats)
+        stats['disabled'] = len(self.disabled)
+        return stats
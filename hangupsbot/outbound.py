@@ -0,0 +1,192 @@
+import time, logging, asyncio, collections
+
+from hangups import ChatMessageSegment, hangouts_pb2
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket rate limiter (rate of None means unlimited)"""
+    def __init__(self, rate, burst=1, timer=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.timer = timer
+        self.tokens = self.burst
+        self.timestamp = timer()
+
+    def consume(self):
+        """Take one token and return 0 (or return seconds to wait if there is no token)"""
+        if not self.rate:
+            return 0
+        now = self.timer()
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Wait until token is available and take it"""
+        delay = self.consume()
+        while delay:
+            yield from asyncio.sleep(delay)
+            delay = self.consume()
+
+
+class OutboundMessage:
+    """Chat message waiting in outbound queue"""
+    def __init__(self, conv, segments, image_id=None):
+        self.conv = conv
+        self.segments = segments
+        self.image_id = image_id
+        self.length = sum(len(s.text) for s in segments)
+        self.timestamp = time.monotonic()
+        self.futures = [asyncio.Future()]
+
+
+class OutboundDispatcher:
+    """Send chat messages through rate limited per-conversation queues
+
+       Messages to one conversation are sent in order (one at a time), short text message
+       waits up to coalesce_window for following text messages, which are merged into it."""
+    def __init__(self, rate=5, burst=10, conv_rate=1, conv_burst=5,
+                 coalesce_window=1.0, coalesce_length=1000):
+        self.bucket = TokenBucket(rate, burst)
+        self.conv_rate = conv_rate
+        self.conv_burst = conv_burst
+        self.coalesce_window = coalesce_window
+        self.coalesce_length = coalesce_length
+        self.queues = {}         # conv_id -> deque of OutboundMessage
+        self.workers = {}        # conv_id -> worker task
+        self.conv_buckets = {}   # conv_id -> TokenBucket
+        self.waiters = {}        # conv_id -> future done when message is queued
+        self.stats = collections.Counter()
+
+    def send(self, conv, segments, image_id=None):
+        """Queue message for sending and return future with result"""
+        message = OutboundMessage(conv, segments, image_id)
+        queue = self.queues.setdefault(conv.id_, collections.deque())
+        queue.append(message)
+        self.stats['queued'] += 1
+
+        if conv.id_ not in self.workers:
+            self.workers[conv.id_] = asyncio.async(self._worker(conv.id_))
+        waiter = self.waiters.get(conv.id_)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        return message.futures[0]
+
+    def cancel(self):
+        """Stop sending messages (futures of waiting messages are cancelled)"""
+        for worker in list(self.workers.values()):
+            worker.cancel()
+        # Workers which haven't started yet won't clean up their queues
+        for queue in self.queues.values():
+            for message in queue:
+                for future in message.futures:
+                    future.cancel()
+        self.workers.clear()
+        self.queues.clear()
+
+    def set_rates(self, rate, burst, conv_rate, conv_burst):
+        """Change rate limits (buckets keep their tokens)"""
+        self.bucket.rate, self.bucket.burst = rate, max(burst, 1)
+        self.conv_rate, self.conv_burst = conv_rate, conv_burst
+        for bucket in self.conv_buckets.values():
+            bucket.rate, bucket.burst = conv_rate, max(conv_burst, 1)
+
+    def queue_depth(self, conv_id=None):
+        """Get number of messages waiting in queue of conversation (or in all queues)"""
+        if conv_id is not None:
+            return len(self.queues.get(conv_id, ()))
+        return sum(len(queue) for queue in self.queues.values())
+
+    def get_stats(self):
+        """Get counters of queued, sent, failed and coalesced messages and send latency"""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue_depth()
+        if self.stats['sent']:
+            stats['latency_avg'] = self.stats['latency_total'] / self.stats['sent']
+        return stats
+
+    @asyncio.coroutine
+    def _coalesce(self, conv_id, message, queue):
+        """Merge text messages queued within coalesce_window after message into it
+           (waits until window ends, unless message can't grow anymore)"""
+        deadline = message.timestamp + self.coalesce_window
+        while message.image_id is None and message.length < self.coalesce_length:
+            while queue:
+                following = queue[0]
+                if (following.image_id is not None or following.timestamp > deadline or
+                        message.length + following.length + 1 > self.coalesce_length):
+                    return
+                queue.popleft()
+                message.segments = (message.segments +
+                                    [ChatMessageSegment('\n', segment_type=hangouts_pb2.SEGMENT_TYPE_LINE_BREAK)] +
+                                    following.segments)
+                message.length += following.length + 1
+                message.futures.extend(following.futures)
+                self.stats['coalesced'] += 1
+
+            delay = deadline - time.monotonic()
+            if delay <= 0:
+                return
+            waiter = self.waiters[conv_id] = asyncio.Future()
+            try:
+                yield from asyncio.wait([waiter], timeout=delay)
+            finally:
+                del self.waiters[conv_id]
+
+    @asyncio.coroutine
+    def _worker(self, conv_id):
+        """Send all messages from queue of conversation"""
+        queue = self.queues[conv_id]
+        try:
+            bucket = self.conv_buckets[conv_id]
+        except KeyError:
+            bucket = self.conv_buckets[conv_id] = TokenBucket(self.conv_rate, self.conv_burst)
+
+        message = None
+        try:
+            while queue:
+                message = queue[0]
+                yield from bucket.acquire()
+                yield from self.bucket.acquire()
+
+                # Messages queued while waiting for rate limiter (or within coalesce window) are sent together
+                queue.popleft()
+                if self.coalesce_window:
+                    yield from self._coalesce(conv_id, message, queue)
+
+                start = time.monotonic()
+                try:
+                    result = yield from message.conv.send_message(message.segments, image_id=message.image_id)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    for future in message.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    self.stats['sent'] += 1
+                    for future in message.futures:
+                        if not future.done():
+                            future.set_result(result)
+
+                now = time.monotonic()
+                self.stats['send_time_total'] += now - start
+                self.stats['latency_total'] += now - message.timestamp
+                self.stats['latency_max'] = max(self.stats['latency_max'], now - message.timestamp)
+        finally:
+            # If worker has been cancelled, don't leave anybody waiting
+            pending = list(queue)
+            if message is not None:
+                pending.append(message)
+            for message in pending:
+                for future in message.futures:
+                    if not future.done():
+                        future.cancel()
+            self.workers.pop(conv_id, None)
+            self.queues.pop(conv_id, None)
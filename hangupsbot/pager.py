@@ -0,0 +1,112 @@
+import asyncio, collections
+
+from hangupsbot.cache import LRUCache
+
+
+default_page_length = 2000
+default_page_lines = 50
+
+
+def split_pages(lines, max_length=default_page_length, max_lines=default_page_lines):
+    """Pack lines into pages of at most max_length characters and max_lines lines
+       (lines are consumed lazily, too long lines are split)"""
+    page, length = [], 0
+    for line in lines:
+        chunks = [line[i:i + max_length] for i in range(0, len(line), max_length)] or ['']
+        for chunk in chunks:
+            if page and (length + len(chunk) > max_length or len(page) >= max_lines):
+                yield '\n'.join(page)
+                page, length = [], 0
+            page.append(chunk)
+            length += len(chunk) + 1
+    if page:
+        yield '\n'.join(page)
+
+
+class Cursor:
+    """Position in paginated output of command"""
+    def __init__(self, title, pages):
+        self.title = title
+        self.pages = pages    # iterator of pages which haven't been sent yet
+        self.page = 0         # number of pages already sent
+        # Next page is built in advance to know if there is any
+        self.next_page = next(pages, None)
+
+
+class Pager:
+    """Cursors of paginated command outputs (one for every user in every conversation)
+
+       Pages are built only when they are sent, so unread pages cost nothing.
+       Cursors which haven't been used for ttl seconds are dropped."""
+    def __init__(self, maxsize=1000, ttl=600):
+        self.cursors = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.stats = collections.Counter()
+
+    def open(self, key, title, pages):
+        """Create cursor for user (replaces previous cursor of user)"""
+        cursor = Cursor(title, pages)
+        self.cursors.set(key, cursor)
+        self.stats['opened'] += 1
+        return cursor
+
+    def get(self, key):
+        """Get cursor of user (or None if user has nothing more to show)"""
+        return self.cursors.get(key)
+
+    def close(self, key):
+        """Remove cursor of user"""
+        self.cursors.pop(key)
+
+    def get_stats(self):
+        """Get number of opened cursors, sent pages and cursors waiting for /bot more"""
+        stats = dict(self.stats)
+        stats['cursors'] = len(self.cursors)
+        return stats
+
+
+def get_cursor_key(event):
+    """Get key of cursor of user who sent event (cursors are per user and conversation)"""
+    return event.conv_id, event.user_id.chat_id
+
+
+@asyncio.coroutine
+def send_pages(bot, event, lines, title=None):
+    """Send output of command (iterable of lines) split to pages, rest is sent by /bot more"""
+    pages = split_pages(
+        lines,
+        max_length=bot.get_config_suboption(event.conv_id, 'paging_max_length') or default_page_length,
+        max_lines=bot.get_config_suboption(event.conv_id, 'paging_max_lines') or default_page_lines
+    )
+    bot.pager.open(get_cursor_key(event), title, pages)
+    yield from send_more(bot, event)
+
+
+@asyncio.coroutine
+def send_more(bot, event):
+    """Send next pages of output of last command of user (returns False if there is nothing more)"""
+    key = get_cursor_key(event)
+    cursor = bot.pager.get(key)
+    if cursor is None:
+        return False
+
+    count = bot.get_config_suboption(event.conv_id, 'paging_pages') or 1
+    futures = []
+    while cursor.next_page is not None and len(futures) < count:
+        page = cursor.next_page
+        cursor.next_page = next(cursor.pages, None)
+        cursor.page += 1
+        if cursor.page > 1:
+            header = _('**{}** (page {})').format(cursor.title, cursor.page) if cursor.title else \
+                _('**Page {}**').format(cursor.page)
+            page = '{}\n{}'.format(header, page)
+        if cursor.next_page is not None and len(futures) + 1 == count:
+            page += _('\n_Use /bot more to show next page_')
+
+        # Pages are sent in order through outbound queue of conversation
+        futures.append(bot.send_message(event.conv, page))
+        bot.pager.stats['pages'] += 1
+
+    if cursor.next_page is None:
+        bot.pager.close(key)
+    yield from asyncio.gather(*futures)
+    return True
@@ -0,0 +1,48 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Items of admins list starting with this prefix are names of groups from admin_groups
+group_prefix = '@'
+
+
+def resolve_admins(admins_list, admin_groups):
+    """Get frozenset of user IDs from admins list with groups expanded (groups can include groups)"""
+    admins = set()
+    stack = list(admins_list or [])
+    seen_groups = set()
+    while stack:
+        item = stack.pop()
+        if not item.startswith(group_prefix):
+            admins.add(item)
+            continue
+
+        name = item[len(group_prefix):]
+        if name in seen_groups:
+            continue
+        seen_groups.add(name)
+        try:
+            stack.extend(admin_groups[name])
+        except (KeyError, TypeError):
+            logger.warning('Unknown admin group {!r}'.format(name))
+    return frozenset(admins)
+
+
+def get_admins(bot, conv_id):
+    """Get frozenset of IDs of admins of conversation (or global admins if conv_id is None)
+       (resolved only once until config is changed)"""
+    return bot.config.memoize(conv_id, 'admins', lambda: resolve_admins(
+        bot.get_config_suboption(conv_id, 'admins'),
+        bot.get_config_suboption(conv_id, 'admin_groups')
+    ))
+
+
+def is_admin(bot, conv_id, user_id):
+    """Return True if user (chat_id) is admin in conversation"""
+    return user_id in get_admins(bot, conv_id)
+
+
+def is_global_admin(bot, user_id):
+    """Return True if user (chat_id) is admin in global config (not only in some conversation)"""
+    return user_id in get_admins(bot, None)
@@ -0,0 +1,123 @@
+import os, ast, json, glob, logging
+
+
+logger = logging.getLogger(__name__)
+
+# Version of manifest cache format
+MANIFEST_VERSION = 1
+
+
+def scan_decorator(decorator, registry_name):
+    """Get keyword arguments of registering decorator (None if decorator doesn't register function)
+
+       Raises ValueError if arguments can't be found out without importing module."""
+    call = decorator if isinstance(decorator, ast.Call) else None
+    target = call.func if call else decorator
+    if not (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and
+            target.value.id == registry_name):
+        return None
+    if call and (call.args or getattr(call, 'starargs', None) or getattr(call, 'kwargs', None)):
+        raise ValueError('positional arguments')
+
+    kwds = {'method': target.attr}
+    for keyword in call.keywords if call else []:
+        value = keyword.value
+        if keyword.arg == 'event' and isinstance(value, ast.Attribute):
+            # Event types are matched by class name
+            kwds['event'] = value.attr
+        elif keyword.arg == 'event' and isinstance(value, ast.Name) and value.id != 'None':
+            kwds['event'] = value.id
+        else:
+            kwds[keyword.arg] = ast.literal_eval(value)
+    return kwds
+
+
+def scan_module(filename, registry_name):
+    """Find functions registered by decorators in plugin module
+
+       Returns list of (function name, decorator keyword arguments), or None if module
+       registers something in other way and must be imported to find out."""
+    with open(filename, 'rb') as f:
+        tree = ast.parse(f.read(), filename)
+
+    registered = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            try:
+                kwds = scan_decorator(decorator, registry_name)
+            except ValueError:
+                return None
+            if kwds is not None:
+                registered.append((node.name, kwds))
+
+    # Every use of registry must be one of found decorators
+    uses = sum(1 for node in ast.walk(tree)
+               if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and
+               node.value.id == registry_name and node.attr.startswith('register'))
+    if uses != len(registered):
+        return None
+    return registered
+
+
+class PluginManifest:
+    """List of plugin modules with functions they register (found without importing them)
+
+       Results of scanning are cached in __pycache__ directory of plugins and
+       only modules changed since last scan are scanned again."""
+    def __init__(self, package, directory, registry_name):
+        self.package = package
+        self.directory = directory
+        self.registry_name = registry_name
+        self.cache_path = os.path.join(directory, '__pycache__', 'plugins-{}.json'.format(registry_name))
+        self.modules = {}  # module name -> list of (function name, kwds) or None if module can't be scanned
+        self.scan()
+
+    def scan(self):
+        """Scan all plugin modules (unchanged modules are taken from cache)"""
+        cache = self._load_cache()
+        entries = {}
+        for filename in sorted(glob.glob(os.path.join(self.directory, '*.py'))):
+            basename = os.path.basename(filename)
+            if basename.startswith('_') or not os.path.isfile(filename):
+                continue
+            module = '{}.{}'.format(self.package, os.path.splitext(basename)[0])
+            stat = os.stat(filename)
+            key = [stat.st_mtime, stat.st_size]
+
+            entry = cache.get(basename)
+            if not entry or entry['key'] != key:
+                try:
+                    registered = scan_module(filename, self.registry_name)
+                except (SyntaxError, ValueError) as e:
+                    logger.warning('Failed to scan plugin {}: {}'.format(filename, e))
+                    registered = None
+                entry = {'key': key, 'registered': registered}
+            entries[basename] = entry
+
+            registered = entry['registered']
+            self.modules[module] = [tuple(r) for r in registered] if registered is not None else None
+
+        if entries != cache:
+            self._save_cache(entries)
+
+    def _load_cache(self):
+        """Load cached results of last scan"""
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        if cache.get('version') != MANIFEST_VERSION:
+            return {}
+        return cache.get('modules', {})
+
+    def _save_cache(self, entries):
+        """Save results of scan (plugins directory doesn't have to be writable)"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'modules': entries}, f)
+        except OSError as e:
+            logger.debug('Failed to save plugin manifest {}: {}'.format(self.cache_path, e))
@@ -0,0 +1,155 @@
+import os, sys, time, logging, asyncio, threading, collections
+
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_stack(frame):
+    """Get stack of frame in collapsed format (file:function;file:function;...)"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return ';'.join(stack)
+
+
+@asyncio.coroutine
+def drive_coroutine(coro, before_step, after_step):
+    """Run coroutine (same as yield from coro) step by step and call after_step(before_step())
+       around every step, so work done by coroutine itself can be measured or attributed"""
+    value, exception = None, None
+    while True:
+        token = before_step()
+        try:
+            if exception is not None:
+                future = coro.throw(exception)
+            else:
+                future = coro.send(value)
+        except StopIteration as e:
+            return e.value
+        finally:
+            after_step(token)
+
+        try:
+            value, exception = (yield future), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value, exception = None, e
+
+
+class SlowCallbackRecorder(logging.Handler):
+    """Remember slow callbacks reported by asyncio in debug mode"""
+    def __init__(self, maxlen=100):
+        super().__init__(logging.WARNING)
+        self.records = collections.deque(maxlen=maxlen)
+        self.count = 0
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith('Executing '):
+            self.count += 1
+            self.records.append('{} {}'.format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created)), message))
+
+
+class Profiler:
+    """Sampling profiler of event loop thread with run time statistics of handlers and commands
+
+       Stacks of event loop thread are sampled every interval seconds by background thread
+       and counted in collapsed format (as used by flame graph tools). Handlers and commands
+       wrapped by wrap_coroutine are timed step by step, so CPU time spent by coroutine itself
+       is measured separately from wall time spent waiting."""
+    def __init__(self, directory, interval=0.01, slow_callback_duration=0.1):
+        self.directory = directory
+        self.interval = interval
+        self.slow_callback_duration = slow_callback_duration
+        self.stacks = collections.Counter()  # collapsed stack -> number of samples
+        self.samples = 0
+        self.stats = {}                      # name -> [number of calls, wall time, CPU time]
+        self.slow_callbacks = SlowCallbackRecorder()
+        self._thread = None
+        self._thread_id = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, loop):
+        """Enable asyncio debug mode and start sampling thread (must be called from event loop thread)"""
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_duration
+        logging.getLogger('asyncio').addHandler(self.slow_callbacks)
+
+        self._thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling thread"""
+        if self._thread:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+        logging.getLogger('asyncio').removeHandler(self.slow_callbacks)
+
+    def _sample(self):
+        """Record stack of event loop thread every interval seconds"""
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                stack = collapse_stack(frame)
+                with self._lock:
+                    self.stacks[stack] += 1
+                    self.samples += 1
+            del frame
+
+    def wrap_coroutine(self, name, coro):
+        """Return coroutine which runs coro and records its wall and CPU time under name"""
+        return self._timed(name, coro)
+
+    @asyncio.coroutine
+    def _timed(self, name, coro):
+        """Run coroutine and measure CPU time of every step"""
+        start = time.perf_counter()
+        cpu_time = [0.0]
+
+        def after_step(step_start):
+            cpu_time[0] += time.process_time() - step_start
+        try:
+            return (yield from drive_coroutine(coro, time.process_time, after_step))
+        finally:
+            try:
+                stats = self.stats[name]
+            except KeyError:
+                stats = self.stats[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+            stats[2] += cpu_time[0]
+
+    def dump(self):
+        """Write collapsed stacks and statistics of handlers and commands to directory"""
+        prefix = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S'))
+        with self._lock:
+            stacks = self.stacks.most_common()
+            samples = self.samples
+
+        with open(prefix + '.folded', 'w') as f:
+            for stack, count in stacks:
+                f.write('{} {}\n'.format(stack, count))
+
+        with open(prefix + '.txt', 'w') as f:
+            f.write('Samples: {} (every {} s)\n\n'.format(samples, self.interval))
+            f.write('{:40} {:>8} {:>12} {:>12}\n'.format('Handler/command', 'Calls', 'Wall time', 'CPU time'))
+            for name, (calls, wall_time, cpu_time) in sorted(self.stats.items(),
+                                                             key=lambda i: i[1][2], reverse=True):
+                f.write('{:40} {:8} {:12.6f} {:12.6f}\n'.format(name, calls, wall_time, cpu_time))
+            f.write('\nSlow callbacks (longer than {} s): {}\n'.format(
+                self.slow_callback_duration, self.slow_callbacks.count))
+            for record in self.slow_callbacks.records:
+                f.write('{}\n'.format(record))
+
+        logger.info('Profile written to {}.folded and {}.txt'.format(prefix, prefix))
+        return prefix
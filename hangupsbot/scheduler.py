@@ -0,0 +1,273 @@
+import re, json, time, heapq, logging, asyncio, datetime, itertools
+
+from hangupsbot.utils import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+# Version of file with saved jobs
+SCHEDULE_VERSION = 1
+
+# Ranges of fields of cron expression (minute, hour, day of month, month, day of week)
+cron_fields = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+_delay_regex = re.compile(r'^(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$')
+
+
+def parse_delay(text):
+    """Parse delay like 90s, 10m, 1h30m or 2d (returns seconds or None if text is not delay)"""
+    match = _delay_regex.match(text.strip().lower())
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def parse_cron_field(field, low, high):
+    """Parse field of cron expression (*, 5, 1-5, 1,3,5, */15 or 0-30/10) to set of values"""
+    values = set()
+    for part in field.split(','):
+        part, sep, step = part.partition('/')
+        step = int(step) if step else 1
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError('invalid cron field {!r}'.format(field))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Schedule defined by cron expression "minute hour day month weekday" (in local time)"""
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('cron expression must have 5 fields')
+        self.expression = ' '.join(fields)
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            parse_cron_field(field, low, high) for field, (low, high) in zip(fields, cron_fields))
+        # Both 0 and 7 are Sunday in cron, datetime uses 0 for Monday
+        self.weekdays = {(d - 1) % 7 for d in weekdays}
+        # If both day of month and day of week are restricted, either of them must match
+        self.any_day = fields[2] != '*' and fields[4] != '*'
+
+    def _day_matches(self, dt):
+        """Return True if date matches day of month and day of week"""
+        day, weekday = dt.day in self.days, dt.weekday() in self.weekdays
+        return day or weekday if self.any_day else day and weekday
+
+    def next_time(self, after):
+        """Get first time (Unix timestamp) matching schedule after timestamp"""
+        dt = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0)
+        dt += datetime.timedelta(minutes=1)
+        limit = dt.year + 5
+        while dt.year <= limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError('cron expression {!r} never matches'.format(self.expression))
+
+
+class Job:
+    """Message scheduled for sending to conversation (repeated if it has cron expression)"""
+    def __init__(self, id_, due, conv_id, text, cron=None, user_id=None, kind='schedule'):
+        self.id_ = id_
+        self.due = due
+        self.conv_id = conv_id
+        self.text = text
+        self.cron = cron
+        self.user_id = user_id
+        self.kind = kind
+        self.schedule = CronSchedule(cron) if cron else None
+
+    def to_dict(self):
+        """Get job as JSON serializable dict"""
+        return {'id': self.id_, 'due': self.due, 'conv_id': self.conv_id, 'text': self.text,
+                'cron': self.cron, 'user_id': self.user_id, 'kind': self.kind}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create job from dict made by to_dict"""
+        return cls(data['id'], data['due'], data['conv_id'], data['text'],
+                   cron=data.get('cron'), user_id=data.get('user_id'), kind=data.get('kind', 'schedule'))
+
+
+class Scheduler:
+    """Jobs waiting in heap ordered by due time (adding and removing job is O(log n))
+
+       Only one timer is waiting for earliest job. Jobs are saved to file after every change
+       (changes made within save_delay are saved at once), so they survive restarts.
+       Scheduler is paused while bot is disconnected, jobs missed since then (at most
+       catch_up seconds ago) are run after resume, older missed jobs are skipped."""
+    def __init__(self, path, callback, catch_up=3600, save_delay=1.0, timer=time.time):
+        self.path = path
+        self.callback = callback      # called as callback(job) when job is due
+        self.catch_up = catch_up
+        self.save_delay = save_delay
+        self.timer = timer
+        self.jobs = {}                # job ID -> Job
+        self.paused = True
+        self._heap = []               # (due time, sequence number, job ID)
+        self._counter = itertools.count()
+        self._next_id = 1
+        self._handle = None
+        self._save_handle = None
+        self.load()
+
+    def load(self):
+        """Load saved jobs"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (IOError, ValueError) as e:
+            logger.error('Failed to load scheduled jobs from {}: {}'.format(self.path, e))
+            return
+        if data.get('version') != SCHEDULE_VERSION:
+            logger.error('Unknown version of scheduled jobs file {}'.format(self.path))
+            return
+
+        for job_data in data.get('jobs', []):
+            try:
+                job = Job.from_dict(job_data)
+            except (KeyError, ValueError) as e:
+                logger.warning('Invalid scheduled job {!r}: {}'.format(job_data, e))
+                continue
+            self.jobs[job.id_] = job
+            self._heap.append((job.due, next(self._counter), job.id_))
+        heapq.heapify(self._heap)
+        self._next_id = max([data.get('next_id', 1)] + [job_id + 1 for job_id in self.jobs])
+
+    def dumps(self):
+        """Get all jobs as JSON (bytes)"""
+        return json.dumps({
+            'version': SCHEDULE_VERSION,
+            'next_id': self._next_id,
+            'jobs': [job.to_dict() for job in sorted(self.jobs.values(), key=lambda job: job.id_)]
+        }, indent=2, sort_keys=True).encode('utf-8')
+
+    def _save(self):
+        """Write all jobs to file (file is written outside of event loop)"""
+        self._save_handle = None
+
+        def on_saved(future):
+            if future.exception():
+                logger.error('Failed to save scheduled jobs: {}'.format(future.exception()))
+        asyncio.get_event_loop().run_in_executor(None, atomic_write, self.path, self.dumps()).add_done_callback(
+            on_saved)
+
+    def save(self):
+        """Save jobs after save_delay seconds"""
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_event_loop().call_later(self.save_delay, self._save)
+
+    @asyncio.coroutine
+    def close(self):
+        """Stop timer and save pending changes"""
+        self.pause()
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+            try:
+                yield from asyncio.get_event_loop().run_in_executor(None, atomic_write, self.path, self.dumps())
+            except OSError as e:
+                logger.error('Failed to save scheduled jobs: {}'.format(e))
+
+    def add(self, due, conv_id, text, cron=None, user_id=None, kind='schedule'):
+        """Schedule new job and return it (due is Unix timestamp, ignored if cron is set)"""
+        job = Job(self._next_id, due, conv_id, text, cron=cron, user_id=user_id, kind=kind)
+        if job.schedule:
+            job.due = job.schedule.next_time(self.timer())
+        self._next_id += 1
+        self.jobs[job.id_] = job
+        self._push(job)
+        self.save()
+        return job
+
+    def cancel(self, job_id):
+        """Remove job (returns removed job or None)"""
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            # Heap entry is skipped when it's popped, heap is rebuilt if it has too many of them
+            if len(self._heap) > 2 * len(self.jobs) + 64:
+                self._heap = [entry for entry in self._heap if entry[2] in self.jobs]
+                heapq.heapify(self._heap)
+            self.save()
+        return job
+
+    def list_jobs(self, conv_id=None):
+        """Get jobs (of conversation) ordered by due time"""
+        return sorted((job for job in self.jobs.values() if conv_id is None or job.conv_id == conv_id),
+                      key=lambda job: job.due)
+
+    def _push(self, job):
+        """Put job to heap and reset timer if job is earliest one"""
+        entry = (job.due, next(self._counter), job.id_)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._reset_timer()
+
+    def _reset_timer(self):
+        """Wait for earliest job (timer wakes up at least every minute, so changes of clock are noticed)"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self.paused or not self._heap:
+            return
+        delay = min(max(self._heap[0][0] - self.timer(), 0), 60)
+        self._handle = asyncio.get_event_loop().call_later(delay, self._run_due)
+
+    def pause(self):
+        """Stop running jobs (e.g. when bot is disconnected)"""
+        self.paused = True
+        self._reset_timer()
+
+    def resume(self):
+        """Run jobs missed while paused and continue running jobs"""
+        self.paused = False
+        self._run_due()
+
+    def _run_due(self):
+        """Run all due jobs and reschedule repeated ones"""
+        self._handle = None
+        now = self.timer()
+        changed = False
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, job_id = heapq.heappop(self._heap)
+            job = self.jobs.get(job_id)
+            if job is None or job.due != due:
+                continue
+            changed = True
+
+            if now - due <= self.catch_up:
+                try:
+                    self.callback(job)
+                except Exception as e:
+                    logger.exception('Scheduled job {} failed: {!r}'.format(job.id_, e))
+            else:
+                logger.warning('Scheduled job {} skipped (it is {:.0f} s late)'.format(job.id_, now - due))
+
+            # Repeated job is run only once after missing more runs
+            if job.schedule:
+                job.due = job.schedule.next_time(now)
+                heapq.heappush(self._heap, (job.due, next(self._counter), job.id_))
+            else:
+                del self.jobs[job_id]
+
+        if changed:
+            self.save()
+        self._reset_timer()
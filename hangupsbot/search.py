@@ -0,0 +1,92 @@
+from hangupsbot.utils import unicode_to_ascii
+
+
+def trigrams(text):
+    """Return set of all three character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NameIndex:
+    """Trigram index for fast case insensitive substring search in names
+
+       Names are matched both as they are and transliterated to ASCII,
+       so e.g. "krenek" finds "Křenek"."""
+    def __init__(self):
+        self.items = {}      # key -> (object, lowercase name, transliterated lowercase name)
+        self.trigrams = {}   # trigram -> set of keys
+        self.version = 0     # incremented on every change of index
+
+    def add(self, key, name, obj):
+        """Add object to index (or update its name if it is already indexed)"""
+        name_lower = name.lower()
+        name_ascii = unicode_to_ascii(name).lower()
+        try:
+            if self.items[key][1:] == (name_lower, name_ascii):
+                self.items[key] = (obj, name_lower, name_ascii)
+                return
+        except KeyError:
+            pass
+        else:
+            self.remove(key)
+
+        self.items[key] = (obj, name_lower, name_ascii)
+        for trigram in trigrams(name_lower) | trigrams(name_ascii):
+            self.trigrams.setdefault(trigram, set()).add(key)
+        self.version += 1
+
+    def remove(self, key):
+        """Remove object from index"""
+        try:
+            obj, name_lower, name_ascii = self.items.pop(key)
+        except KeyError:
+            return
+        for trigram in trigrams(name_lower) | trigrams(name_ascii):
+            keys = self.trigrams[trigram]
+            keys.discard(key)
+            if not keys:
+                del self.trigrams[trigram]
+        self.version += 1
+
+    def get(self, key):
+        """Get indexed object by key (or None)"""
+        try:
+            return self.items[key][0]
+        except KeyError:
+            return None
+
+    def _candidates(self, query):
+        """Return keys of items containing all trigrams of query (or None if query is too short)"""
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return None
+        postings = sorted((self.trigrams.get(t, ()) for t in query_trigrams), key=len)
+        candidates = set(postings[0])
+        for keys in postings[1:]:
+            if not candidates:
+                break
+            candidates &= keys
+        return candidates
+
+    def search(self, query):
+        """Return list of objects with name containing query"""
+        query_lower = query.lower()
+        query_ascii = unicode_to_ascii(query).lower()
+
+        candidates = self._candidates(query_lower)
+        if candidates is not None and query_ascii and query_ascii != query_lower:
+            ascii_candidates = self._candidates(query_ascii)
+            candidates = None if ascii_candidates is None else candidates | ascii_candidates
+        keys = self.items.keys() if candidates is None else candidates
+
+        results = []
+        for key in keys:
+            obj, name_lower, name_ascii = self.items[key]
+            if query_lower in name_lower or (query_ascii and query_ascii in name_ascii):
+                results.append(obj)
+        return results
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,125 @@
+import json, time, base64, logging, asyncio
+
+from hangups import hangouts_pb2, parsers
+from hangups.user import User, UserID, UserList, NameType
+from hangups.conversation import ConversationList
+
+from hangupsbot.utils import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3
+
+
+def user_to_row(user):
+    """Convert hangups.User to JSON serializable list"""
+    return [user.id_.chat_id, user.id_.gaia_id, user.full_name, user.first_name,
+            user.photo_url, list(user.emails or []), int(user.name_type)]
+
+
+def row_to_user(row, is_self=False):
+    """Convert list made by user_to_row to hangups.User"""
+    chat_id, gaia_id, full_name, first_name, photo_url, emails, name_type = row
+    user = User(UserID(chat_id=chat_id, gaia_id=gaia_id), full_name, first_name, photo_url, emails, is_self)
+    # Names are stored as they were (User would guess them again)
+    user.full_name, user.first_name, user.name_type = full_name, first_name, NameType(name_type)
+    return user
+
+
+def message_to_text(message):
+    """Serialize protobuf message to base64 encoded string"""
+    return base64.b64encode(message.SerializeToString()).decode('ascii')
+
+
+def text_to_message(cls, text):
+    """Parse protobuf message of class cls from base64 encoded string"""
+    return cls.FromString(base64.b64decode(text.encode('ascii')))
+
+
+def dump_snapshot(user_list, conv_list):
+    """Serialize lists of users and conversations to JSON (events are not included)
+
+       Users are stored as plain JSON, so they are loaded without slow parsing of protobuf
+       messages. Conversations are stored as one protobuf message (same as server response)."""
+    self_user = user_list._self_user
+    conversations = hangouts_pb2.SyncRecentConversationsResponse(
+        conversation_state=[hangouts_pb2.ConversationState(
+            conversation_id=c._conversation.conversation_id,
+            conversation=c._conversation
+        ) for c in conv_list.get_all()]
+    )
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'sync_timestamp': parsers.to_timestamp(conv_list._sync_timestamp) if conv_list._sync_timestamp else None,
+        'self_user': user_to_row(self_user),
+        'users': [user_to_row(u) for u in user_list.get_all() if u.id_ != self_user.id_],
+        'conversations': message_to_text(conversations)
+    }
+    return json.dumps(snapshot).encode('utf-8')
+
+
+def load_snapshot(data, client):
+    """Build hangups.UserList and hangups.ConversationList from serialized snapshot"""
+    snapshot = json.loads(data.decode('utf-8'))
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version')
+
+    # Snapshot contains all users (including users known only from conversations)
+    chat_id, gaia_id, full_name, first_name = snapshot['self_user'][:4]
+    self_entity = hangouts_pb2.Entity(
+        id=hangouts_pb2.ParticipantId(chat_id=chat_id, gaia_id=gaia_id),
+        properties=hangouts_pb2.EntityProperties(display_name=full_name, first_name=first_name)
+    )
+    user_list = UserList(client, self_entity, [], [])
+    self_user = user_list._self_user = row_to_user(snapshot['self_user'], is_self=True)
+    user_list._user_dict = {self_user.id_: self_user}
+    for row in snapshot['users']:
+        user = row_to_user(row)
+        user_list._user_dict[user.id_] = user
+
+    conv_states = text_to_message(hangouts_pb2.SyncRecentConversationsResponse,
+                                  snapshot['conversations']).conversation_state
+    sync_timestamp = snapshot['sync_timestamp']
+    if sync_timestamp is not None:
+        sync_timestamp = parsers.from_timestamp(sync_timestamp)
+    conv_list = ConversationList(client, conv_states, user_list, sync_timestamp)
+    return user_list, conv_list, snapshot['created']
+
+
+class SnapshotStore:
+    """Store lists of users and conversations on disk for fast startup"""
+    def __init__(self, filename, max_age=86400):
+        self.filename = filename
+        self.max_age = max_age
+
+    def load(self, client):
+        """Load lists of users and conversations (returns None if there is no usable snapshot)"""
+        start = time.perf_counter()
+        try:
+            with open(self.filename, 'rb') as f:
+                user_list, conv_list, created = load_snapshot(f.read(), client)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning('Failed to load snapshot {}: {!r}'.format(self.filename, e))
+            return None
+
+        age = time.time() - created
+        if age > self.max_age:
+            logger.info('Snapshot {} is too old ({:.0f} s)'.format(self.filename, age))
+            return None
+
+        logger.info('Snapshot {} loaded in {:.3f} s'.format(self.filename, time.perf_counter() - start))
+        return user_list, conv_list
+
+    @asyncio.coroutine
+    def save(self, user_list, conv_list):
+        """Save lists of users and conversations (file is written outside of event loop)"""
+        data = dump_snapshot(user_list, conv_list)
+        loop = asyncio.get_event_loop()
+        try:
+            yield from loop.run_in_executor(None, atomic_write, self.filename, data)
+        except OSError as e:
+            logger.warning('Failed to save snapshot {}: {}'.format(self.filename, e))
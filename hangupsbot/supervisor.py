@@ -0,0 +1,116 @@
+import time, random, logging, asyncio
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSupervisor:
+    """Keep client connected (reconnect with exponential backoff and jitter)
+
+       After max_retries consecutive failures supervisor gives up. If cooldown is set,
+       circuit breaker opens instead and every following attempt is made only after
+       cooldown (until connection succeeds)."""
+    def __init__(self, connect, base_delay=5, max_delay=300, max_retries=5, cooldown=None, jitter=0.25):
+        self.connect = connect   # coroutine returning on disconnect, raising on connection failure
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.cooldown = cooldown
+        self.jitter = jitter
+
+        self.connected = False
+        self.failures = 0                      # consecutive failures
+        self.reconnects = 0                    # successful reconnects
+        self.reconnect_time_total = 0.0
+        self.last_reconnect_duration = None
+        self._disconnect_time = None
+        self._stopping = False
+        self._sleep_task = None
+
+    @property
+    def circuit_open(self):
+        """True if there were too many consecutive failures"""
+        return self.failures >= self.max_retries
+
+    def get_delay(self):
+        """Get delay before next connection attempt"""
+        if self.circuit_open:
+            return self.cooldown
+        delay = min(self.max_delay, self.base_delay * 2 ** max(self.failures - 1, 0))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def on_connected(self):
+        """Must be called when connection has been successfully established"""
+        self.connected = True
+        if self._disconnect_time is not None:
+            self.last_reconnect_duration = time.monotonic() - self._disconnect_time
+            self.reconnect_time_total += self.last_reconnect_duration
+            self.reconnects += 1
+            self._disconnect_time = None
+            logger.info('Reconnected after {:.1f} s ({} failed attempts)'.format(
+                self.last_reconnect_duration, self.failures))
+        self.failures = 0
+
+    def get_stats(self):
+        """Get number of reconnects and time spent reconnecting"""
+        return {
+            'connected': self.connected,
+            'circuit_open': self.circuit_open,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'reconnect_time_total': self.reconnect_time_total,
+            'last_reconnect_duration': self.last_reconnect_duration
+        }
+
+    def stop(self):
+        """Stop reconnecting"""
+        self._stopping = True
+        if self._sleep_task:
+            self._sleep_task.cancel()
+
+    @asyncio.coroutine
+    def run(self):
+        """Connect and reconnect until connection is closed on purpose or supervisor is stopped
+
+           Returns False if supervisor has given up after max_retries failures."""
+        while not self._stopping:
+            try:
+                yield from self.connect()
+            except Exception as e:
+                self.connected = False
+                self.failures += 1
+                if self._disconnect_time is None:
+                    self._disconnect_time = time.monotonic()
+                print(_('Client unexpectedly disconnected:\n{}').format(e))
+                logger.warning('Connection failed ({} consecutive failures): {!r}'.format(self.failures, e))
+            else:
+                self.connected = False
+                return True
+
+            if self._stopping:
+                return True
+            if self.circuit_open and not self.cooldown:
+                print(_('Maximum number of retries reached! Exiting...'))
+                return False
+
+            delay = self.get_delay()
+            if self.circuit_open:
+                print(_('Too many failed attempts, next try in {:.0f} seconds...').format(delay))
+            else:
+                print(_('Waiting {:.0f} seconds...').format(delay))
+
+            self._sleep_task = asyncio.async(asyncio.sleep(delay))
+            try:
+                yield from self._sleep_task
+            except asyncio.CancelledError:
+                if self._stopping:
+                    return True
+                raise
+            finally:
+                self._sleep_task = None
+
+            if self.cooldown:
+                print(_('Trying to connect again (try {})...').format(self.failures + 1))
+            else:
+                print(_('Trying to connect again (try {} of {})...').format(self.failures + 1, self.max_retries))
+        return True
@@ -1,8 +1,15 @@
-import unicodedata, string
+import os, re, unicodedata, string, tempfile
 
 from hangups import ChatMessageSegment
 
 
+# Translation table for replacing delimiters in text with whitespace
+_delimiters_table = str.maketrans('.,:;!?', '      ')
+
+# Quoted argument, unclosed quote or unquoted argument (quotes inside of it are not special)
+_args_regex = re.compile(r'''"[^"]*"|'[^']*'|["']|[^ \t\r\n"'][^ \t\r\n]*''')
+
+
 def text_to_segments(text):
     """Create list of message segments from text"""
     return ChatMessageSegment.from_str(text)
@@ -13,18 +20,44 @@ def unicode_to_ascii(text):
     return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
 
 
+def text_to_words(text):
+    """Return list of transliterated lowercase words in text (delimiters are ignored)"""
+    return unicode_to_ascii(text).lower().translate(_delimiters_table).split()
+
+
 def word_in_text(word, text):
     """Return True if word is in text"""
     word = unicode_to_ascii(word).lower()
-    text = unicode_to_ascii(text).lower()
+    return True if word in text_to_words(text) else False
 
-    # Replace delimiters in text with whitespace
-    for delim in '.,:;!?':
-        text = text.replace(delim, ' ')
 
-    return True if word in text.split() else False
+def split_args(text):
+    """Split text to arguments (same as shlex.split(text, posix=False), but much faster)"""
+    args = _args_regex.findall(text)
+    for arg in args:
+        if arg == '"' or arg == "'":
+            raise ValueError('No closing quotation')
+    return args
 
 
 def strip_quotes(text):
     """Strip quotes and whitespace at the beginning and end of text"""
     return text.strip(string.whitespace + '\'"')
+
+
+def atomic_write(filename, data):
+    """Write data (bytes) to file atomically (file is never left partially written)"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(filename)), dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,116 @@
+import os, sys, struct, logging, asyncio, ctypes, ctypes.util
+
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_event_header = struct.Struct('iIII')
+
+
+class FileWatcher:
+    """Watch file for changes and call callback() after it has changed
+
+       inotify is used on Linux, modification time of file is polled elsewhere.
+       Directory of file is watched, so atomic replacing of file is detected too."""
+    def __init__(self, filename, callback, poll_interval=2.0, delay=0.2):
+        self.filename = os.path.abspath(filename)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.delay = delay          # changes within this time are reported only once
+        self.loop = asyncio.get_event_loop()
+        self._inotify_fd = None
+        self._poll_handle = None
+        self._callback_handle = None
+        self._stat = None
+
+    def start(self):
+        """Start watching file"""
+        try:
+            self._start_inotify()
+        except (OSError, AttributeError, NotImplementedError) as e:
+            logger.info('inotify is not available ({!r}), polling {}'.format(e, self.filename))
+            self._stat = self._get_stat()
+            self._poll_handle = self.loop.call_later(self.poll_interval, self._poll)
+
+    def stop(self):
+        """Stop watching file"""
+        if self._inotify_fd is not None:
+            self.loop.remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        for handle in (self._poll_handle, self._callback_handle):
+            if handle:
+                handle.cancel()
+        self._poll_handle = self._callback_handle = None
+
+    def _changed(self):
+        """Call callback after short delay (successive changes are merged)"""
+        if self._callback_handle:
+            self._callback_handle.cancel()
+        self._callback_handle = self.loop.call_later(self.delay, self._run_callback)
+
+    def _run_callback(self):
+        self._callback_handle = None
+        self.callback()
+
+    def _start_inotify(self):
+        """Watch directory of file with inotify"""
+        if not sys.platform.startswith('linux'):
+            raise NotImplementedError('inotify is supported only on Linux')
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        directory = os.path.dirname(self.filename)
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+
+        try:
+            self.loop.add_reader(fd, self._read_inotify)
+        except NotImplementedError:
+            os.close(fd)
+            raise
+        self._inotify_fd = fd
+
+    def _read_inotify(self):
+        """Read inotify events and check if they are related to watched file"""
+        try:
+            data = os.read(self._inotify_fd, 65536)
+        except BlockingIOError:
+            return
+
+        basename = os.fsencode(os.path.basename(self.filename))
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _event_header.unpack_from(data, offset)
+            offset += _event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name == basename:
+                self._changed()
+
+    def _get_stat(self):
+        """Get modification time, size and inode of file"""
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def _poll(self):
+        """Check if modification time of file has changed"""
+        stat = self._get_stat()
+        if stat != self._stat:
+            self._stat = stat
+            self._changed()
+        self._poll_handle = self.loop.call_later(self.poll_interval, self._poll)